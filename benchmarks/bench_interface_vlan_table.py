@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Compare the single match() query and the narrow queries of pull_interface_vlan_table
+
+Run against the tor blueprint of the env file (tests/fixtures/.env by default)
+    python benchmarks/bench_interface_vlan_table.py [--repeat 3]
+"""
+
+import time
+import json
+import logging
+import argparse
+
+from apstra_bp_consolidation.consolidation import ConsolidationOrder
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.models import InterfaceVlans
+from apstra_bp_consolidation.move_ct import pull_interface_vlan_table
+
+
+def pull_interface_vlan_table_single_query(the_bp, switch_label_pair: list) -> dict:
+    """
+    Pull the single vlan cts for the switch pair with one match() query
+    The rows are the cartesian product of the paths. The former pull_interface_vlan_table
+
+    The return data
+    <system_label>:
+        <if_name>: InterfaceVlans(id=<interface id>)
+    redundacy_group:
+        <ae_id>: InterfaceVlans(member_interfaces={ <system_label>: [ <member if_name> ] })
+    """
+    interface_vlan_table = {
+        CkEnum.REDUNDANCY_GROUP: {}
+    }
+
+    INTERFACE_NODE = 'interface'
+    CT_NODE = 'batch'
+    SINGLE_VLAN_NODE = 'AttachSingleVLAN'
+    VN_NODE = 'virtual_network'
+
+    interface_vlan_query = f"""
+        match(
+            node('ep_endpoint_policy', policy_type_name='batch', name='{CT_NODE}')
+                .in_().node('ep_application_instance', name='ep_application_instance')
+                .out('ep_affected_by').node('ep_group')
+                .in_('ep_member_of').node(name='{INTERFACE_NODE}'),
+            node(name='ep_application_instance')
+                .out('ep_nested').node('ep_endpoint_policy', policy_type_name='AttachSingleVLAN', name='{SINGLE_VLAN_NODE}')
+                .out('vn_to_attach').node('virtual_network', name='virtual_network'),
+            optional(
+                node(name='{INTERFACE_NODE}')
+                .out('composed_of').node('interface')
+                .out('composed_of').node('interface', name='{CkEnum.MEMBER_INTERFACE}')
+                .in_('hosted_interfaces').node('system', label=is_in({switch_label_pair}), name='{CkEnum.MEMBER_SWITCH}' )
+                ),
+            optional(
+                node(name='interface')
+                .in_('hosted_interfaces').node('system', label=is_in({switch_label_pair}), name='switch')
+                )            
+        )
+    """
+
+    interface_vlan_nodes = the_bp.query(interface_vlan_query, multiline=True)
+    logging.debug(f"BP:{the_bp.label} {len(interface_vlan_nodes)=}")
+    # why so many (3172) entries?
+
+    for nodes in interface_vlan_nodes:
+        if nodes[CkEnum.MEMBER_INTERFACE]:
+            # INTERFACE_NODE is EVPN
+            evpn_id = nodes[INTERFACE_NODE]['id']
+            system_label = nodes[CkEnum.MEMBER_SWITCH]['label']
+            if_name = nodes[CkEnum.MEMBER_INTERFACE]['if_name']
+            if if_name in ['et-0/0/48', 'et-0/0/49']:
+                # skip et-0/0/48 and et-0/0/49 which will be taken care of by Apstra
+                continue
+            vlan_id = int(nodes[VN_NODE]['vn_id'] )- 100000
+            is_tagged = 'vlan_tagged' in nodes[SINGLE_VLAN_NODE]['attributes']
+            if evpn_id not in interface_vlan_table[CkEnum.REDUNDANCY_GROUP]:
+                interface_vlan_table[CkEnum.REDUNDANCY_GROUP][evpn_id] = InterfaceVlans(member_interfaces={})
+            this_evpn_interface_data = interface_vlan_table[CkEnum.REDUNDANCY_GROUP][evpn_id]
+            this_evpn_interface_data.add_member_interface(system_label, if_name)
+            this_evpn_interface_data.add_vlan(vlan_id, is_tagged)
+        else:
+            system_label = nodes['switch']['label']
+            if_name = nodes['interface']['if_name']
+            vlan_id = int(nodes['virtual_network']['vn_id'] )- 100000
+            is_tagged = 'vlan_tagged' in nodes[SINGLE_VLAN_NODE]['attributes']
+            if system_label not in interface_vlan_table:
+                interface_vlan_table[system_label] = {}
+            if if_name not in interface_vlan_table[system_label]:
+                interface_vlan_table[system_label][if_name] = InterfaceVlans(id=nodes['interface']['id'])
+            interface_vlan_table[system_label][if_name].add_vlan(vlan_id, is_tagged)
+
+    summary = [f"{x}:{len(interface_vlan_table[x])}" for x in interface_vlan_table.keys()]
+    logging.debug(f"BP:{the_bp.label} {summary=}")
+
+    return interface_vlan_table
+
+
+class QueryCounter:
+    """
+    Count the queries, the rows and the bytes of the blueprint queries
+    """
+    def __init__(self, the_bp):
+        self.the_bp = the_bp
+        self.original_query = the_bp.query
+        self.reset()
+
+    def reset(self):
+        self.queries = 0
+        self.rows = 0
+        self.bytes = 0
+
+    def query(self, *args, **kwargs):
+        items = self.original_query(*args, **kwargs)
+        self.queries += 1
+        self.rows += len(items)
+        self.bytes += len(json.dumps(items))
+        return items
+
+    def __enter__(self):
+        self.the_bp.query = self.query
+        return self
+
+    def __exit__(self, *args):
+        self.the_bp.query = self.original_query
+
+
+def normalize(interface_vlan_table: dict) -> dict:
+    # the order of the vlans is not significant
+    return json.loads(json.dumps(interface_vlan_table, sort_keys=True, default=lambda x: x.to_dict()), object_hook=lambda x: {
+        k: sorted(v) if isinstance(v, list) else v for k, v in x.items()})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env-file', default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    order = ConsolidationOrder(args.env_file)
+    results = {}
+    for name, function in [
+            ('single_query', pull_interface_vlan_table_single_query),
+            ('narrow_queries', pull_interface_vlan_table)]:
+        durations = []
+        with QueryCounter(order.tor_bp) as counter:
+            for _ in range(args.repeat):
+                counter.reset()
+                begin = time.perf_counter()
+                table = function(order.tor_bp, order.switch_label_pair)
+                durations.append(time.perf_counter() - begin)
+        results[name] = normalize(table)
+        print(f"{name:16s} best {min(durations):7.3f}s  queries {counter.queries}  rows {counter.rows:7d}  bytes {counter.bytes:10d}")
+
+    print(f"same table: {results['single_query'] == results['narrow_queries']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Compare the memory of the dict rows and the slotted models on a synthetic large TOR
+Both sides keep the tagged VLANs in a VlanSet, so only the containers of the rows differ
+
+No controller is needed
+    python benchmarks/bench_models_memory.py [--switches 40] [--ports 48] [--vlans 200]
+"""
+
+import argparse
+import tracemalloc
+
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.vlan_set import VlanSet
+from apstra_bp_consolidation.models import InterfaceVlans, GsLink, intern
+
+
+def synthetic_rows(switches: int, ports: int, vlans: int):
+    """
+    Yield the fields of each interface as the query would return them. Each row has its own string objects
+    """
+    for switch_index in range(switches):
+        for port in range(ports):
+            yield {
+                'sw_label': ''.join(['atl1tor-r5r', str(switch_index), 'a']),
+                'sw_if_name': ''.join(['xe-0/0/', str(port)]),
+                'gs_label': ''.join(['server-', str(switch_index), '-', str(port // 2)]),
+                'link_id': ''.join(['link-', str(switch_index), '-', str(port)]),
+                'interface_id': ''.join(['if-', str(switch_index), '-', str(port)]),
+                'aggregate_link': ''.join(['ae-', str(switch_index), '-', str(port // 2)]),
+                'speed': ''.join(['10', 'G']),
+                'tags': [''.join(['tag', str(port % 4)])],
+                'vlans': list(range(100, 100 + vlans)),
+            }
+
+
+def build_dicts(rows) -> tuple:
+    interface_vlan_table = {}
+    generic_systems_data = {}
+    for row in rows:
+        interface_vlan_table.setdefault(row['sw_label'], {})[row['sw_if_name']] = {
+            'id': row['interface_id'],
+            CkEnum.TAGGED_VLANS: VlanSet(row['vlans']),
+            CkEnum.UNTAGGED_VLAN: None,
+        }
+        generic_systems_data.setdefault(row['gs_label'], {})[row['link_id']] = {
+            'sw_label': row['sw_label'],
+            'sw_if_name': row['sw_if_name'],
+            'speed': row['speed'],
+            'aggregate_link': row['aggregate_link'],
+            'tags': row['tags'],
+        }
+    return interface_vlan_table, generic_systems_data
+
+
+def build_models(rows) -> tuple:
+    interface_vlan_table = {}
+    generic_systems_data = {}
+    for row in rows:
+        interface_vlans = InterfaceVlans(id=row['interface_id'])
+        interface_vlans.tagged_vlans = VlanSet(row['vlans'])
+        interface_vlan_table.setdefault(intern(row['sw_label']), {})[intern(row['sw_if_name'])] = interface_vlans
+        gs_link = GsLink(row['link_id'], row['sw_label'], row['sw_if_name'], row['speed'], row['aggregate_link'])
+        for tag in row['tags']:
+            gs_link.add_tag(tag)
+        generic_systems_data.setdefault(intern(row['gs_label']), {})[gs_link.link_id] = gs_link
+    return interface_vlan_table, generic_systems_data
+
+
+def measure(builder, args) -> int:
+    tracemalloc.start()
+    # keep the result alive until measured. the input rows are freed as consumed
+    result = builder(synthetic_rows(args.switches, args.ports, args.vlans))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--switches', type=int, default=40)
+    parser.add_argument('--ports', type=int, default=48)
+    parser.add_argument('--vlans', type=int, default=200)
+    args = parser.parse_args()
+
+    interfaces = args.switches * args.ports
+    dict_bytes = measure(build_dicts, args)
+    model_bytes = measure(build_models, args)
+    print(f"{interfaces} interfaces x {args.vlans} vlans")
+    print(f"dict rows     {dict_bytes:12d} bytes  {dict_bytes // interfaces:6d} per interface")
+    print(f"slotted models{model_bytes:12d} bytes  {model_bytes // interfaces:6d} per interface")
+    print(f"ratio         {model_bytes / dict_bytes:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -38,12 +38,14 @@ class CkApstraBlueprint:
         self.label = label
         self.id = id
         if id:
-            this_blueprint = self.session.get_items(f"blueprints/{id}")
-            self.label = this_blueprint['label']
+            # a blueprint created just now may be newer than the listing
+            self.label = self.session.blueprint_directory.get_label(id, force=True)
+            if self.label is None:
+                raise ValueError(f"Blueprint id '{id}' not found.")
         else:
             self.get_id()
         self.url_prefix = f"{self.session.url_prefix}/blueprints/{self.id}"
-        self.logger = logging.getLogger(f"CkApstraBlueprint({label})")
+        self.logger = logging.getLogger(f"CkApstraBlueprint({self.label})")
 
         self.system_label_2_id_cache = {} # { system_label: { id: id, interface_map_id: id, device_profile_id: id }
         self.system_id_2_label_cache = {} # { system_label: { id: id, interface_map_id: id, device_profile_id: id }
@@ -56,15 +58,18 @@ class CkApstraBlueprint:
         Returns:
             The ID of the blueprint.
         """
-        blueprints = self.session.get_items('blueprints')['items']
-        for blueprint in blueprints:
-            if blueprint['label'] == self.label:
-                self.id = blueprint['id']
-                break
+        # a blueprint created just now may be newer than the listing
+        self.id = self.session.blueprint_directory.get_id(self.label, force=True)
         if self.id is None:
             raise ValueError(f"Blueprint '{self.label}' not found.")
         return self.id
 
+    def get_version(self) -> int:
+        """
+        Get the version of the blueprint as of the last blueprints listing
+        """
+        return self.session.blueprint_directory.get_version(self.id)
+
     # def get_id(self) -> None:
     #     """
     #     Print the ID of the blueprint.
@@ -133,6 +138,13 @@ class CkApstraBlueprint:
             self.system_id_2_label_cache[id] = system_label
         return self.system_label_2_id_cache[system_label]
 
+    def clear_system_cache(self) -> None:
+        '''
+        Drop the cached system nodes. The system_id and deploy_mode of the cached nodes go stale on device move
+        '''
+        self.system_label_2_id_cache = {}
+        self.system_id_2_label_cache = {}
+
     def get_system_label(self, system_id):
         '''
         Get the system label from the system id
@@ -221,21 +233,23 @@ class CkApstraBlueprint:
         # untagged_ct = [x['id'] for x in ct_list if x and 'untagged' in x['ep_endpoint_policy']['attributes']][0] or None
         return (tagged_ct, untagged_ct)
 
-    def add_generic_system(self, gs_spec: dict) -> list:
+    def add_generic_system(self, gs_spec: dict, check_existing: bool = True) -> list:
         """
         Add a generic system (and access switch pair) to the blueprint.
 
         Args:
             gs_spec: The specification of the generic system.
+            check_existing: Skip if the system of the label exists. False if the caller resolved the label already.
 
         Returns:
             The ID of the switch-system-link ids.
         """
-        existing_system_query = f"node('system', label='{gs_spec['new_systems'][0]['label']}', name='system')"
-        existing_system = self.query(existing_system_query)
-        if len(existing_system) > 0:
-            # skipping if the system already exists
-            return []
+        if check_existing:
+            existing_system_query = f"node('system', label='{gs_spec['new_systems'][0]['label']}', name='system')"
+            existing_system = self.query(existing_system_query)
+            if len(existing_system) > 0:
+                # skipping if the system already exists
+                return []
         url = f"{self.url_prefix}/switch-system-links"
         created_generic_system = self.session.session.post(url, json=gs_spec)
         if created_generic_system.status_code >= 400:
@@ -305,6 +319,30 @@ class CkApstraBlueprint:
         return self.session.session.patch(f"{self.url_prefix}/nodes", json=patch_spec, params=params_to_use)
 
 
+    def get_task_status(self, task_ids) -> dict:
+        '''
+        The status of the async tasks (init, in_progress, succeeded, failed). One GET per task id, not the whole listing
+
+        Return: { <task id>: <status> } of the task ids found
+        '''
+        task_status = {}
+        for task_id in set(task_ids):
+            task_got = self.session.session.get(f"{self.url_prefix}/tasks/{task_id}")
+            if task_got.status_code == 404:
+                self.logger.debug(f"task {task_id} not found")
+                continue
+            task_status[task_id] = task_got.json().get('status')
+        return task_status
+
+    def get_system_nodes(self, system_labels: list) -> dict:
+        '''
+        The system nodes of the labels with one query, bypassing the system cache
+
+        Return: { <system label>: <system node> }
+        '''
+        system_nodes = self.query(f"node('system', label=is_in({list(system_labels)}), name='system')")
+        return {x['system']['label']: x['system'] for x in system_nodes}
+
     def get_virtual_network(self, vni):
         '''
         Get virtual network data from vni or None
@@ -318,7 +356,7 @@ class CkApstraBlueprint:
     
     def patch_virtual_network(self, patch_spec, params=None, svi_requirement=False):
         '''
-        Patch virtual network data
+        Patch virtual network data. Return the response
         '''
         if params is None:
             params = {
@@ -327,7 +365,7 @@ class CkApstraBlueprint:
                 'type': 'staging',
                 'svi_requirements': 'true'
             }
-        patched = self.session.patch_throttled(f"{self.url_prefix}/virtual-networks/{patch_spec['id']}", spec=patch_spec, params=params)
+        patched = self.session.patch_throttled_response(f"{self.url_prefix}/virtual-networks/{patch_spec['id']}", spec=patch_spec, params=params)
         return patched
 
     def post_tagging(self, nodes, tags_to_add = None, tags_to_remove = None, params=None, print_prefix=None):
@@ -368,12 +406,12 @@ class CkApstraBlueprint:
             self.logger.info(f"{print_prefix}: {nodes=}, {tags_to_add=}, {tags_to_remove=}, {tagging_spec=}")
         return self.session.session.post(f"{self.url_prefix}/tagging", json=tagging_spec, params={'aync': 'full'})
 
-    def batch(self, batch_spec: dict, params=None) -> None:
+    def batch(self, batch_spec: dict, params=None):
         '''
         Run API commands in batch
         '''
         url = f"{self.url_prefix}/batch"
-        self.session.session.post(url, json=batch_spec, params=params)
+        return self.session.session.post(url, json=batch_spec, params=params)
 
     # def get_cts_on_generic_system_with_only_ae(self, generic_system_label) -> list:
     #     '''
@@ -409,6 +447,27 @@ class CkApstraBlueprint:
         ct_list = [ x['batch']['id'] for x in self.query(ct_list_spec, multiline=True) ]
         return ct_list
 
+    def get_interfaces_cts(self, interface_ids: list) -> dict:
+        '''
+        Get the CTs of the interfaces in a single query
+
+        Return: { <interface id>: set of <ct id> }
+        '''
+        interfaces_cts = {x: set() for x in interface_ids}
+        if not interface_ids:
+            return interfaces_cts
+        ct_list_spec = f"""
+            match(
+                node('ep_endpoint_policy', policy_type_name='batch', name='batch')
+                    .in_().node('ep_application_instance')
+                    .out('ep_affected_by').node('ep_group')
+                    .in_('ep_member_of').node('interface', id=is_in({list(interface_ids)}), name='interface')
+            ).distinct(['batch', 'interface'])
+        """
+        for nodes in self.query(ct_list_spec, multiline=True):
+            interfaces_cts[nodes['interface']['id']].add(nodes['batch']['id'])
+        return interfaces_cts
+
     def add_single_vlan_ct(self, vni: str, is_tagged: bool ) -> str:
         '''
         Create a single VLAN CT
@@ -465,6 +524,60 @@ class CkApstraBlueprint:
         # it will be 204 with b''
         return uuid_batch
 
+    def add_multiple_vlan_ct(self, ct_label: str, tagged_vn_ids: list, untagged_vn_id: str = None, description: str = '') -> str:
+        '''
+        Create a multiple VLAN CT
+
+        Args:
+            tagged_vn_ids: the virtual_network node ids to attach as tagged
+            untagged_vn_id: the virtual_network node id to attach as untagged, or None
+        '''
+        uuid_batch = str(uuid.uuid4())
+        uuid_pipeline = str(uuid.uuid4())
+        uuid_vlan = str(uuid.uuid4())
+        policy_spec = {
+            "policies": [
+                {
+                    "description": description,
+                    "tags": [],
+                    "user_data": f"{{\"isSausage\":true,\"positions\":{{\"{uuid_vlan}\":[290,80,1]}}}}",
+                    "label": ct_label,
+                    "visible": True,
+                    "policy_type_name": "batch",
+                    "attributes": {
+                        "subpolicies": [ uuid_pipeline ]
+                    },
+                    "id": uuid_batch
+                },
+                {
+                    "description": "Add a list of VLANs to interfaces, as tagged or untagged.",
+                    "label": "Virtual Network (Multiple)",
+                    "visible": False,
+                    "attributes": {
+                        "untagged_vn_node_id": untagged_vn_id,
+                        "tagged_vn_node_ids": tagged_vn_ids
+                    },
+                    "policy_type_name": "AttachMultipleVLAN",
+                    "id": uuid_vlan
+                },
+                {
+                    "description": "Add a list of VLANs to interfaces, as tagged or untagged.",
+                    "label": "Virtual Network (Multiple) (pipeline)",
+                    "visible": False,
+                    "attributes": {
+                        "second_subpolicy": None,
+                        "first_subpolicy": uuid_vlan
+                    },
+                    "policy_type_name": "pipeline",
+                    "id": uuid_pipeline
+                }
+            ]
+        }
+        url = f"{self.url_prefix}/obj-policy-import"
+        self.session.session.put(url, json=policy_spec)
+        # it will be 204 with b''
+        return uuid_batch
+
     def get_cabling_maps(self):
         '''
         Get the cabling maps
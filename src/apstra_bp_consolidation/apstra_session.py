@@ -3,6 +3,7 @@ import requests
 import urllib3
 import logging
 import time
+import threading
 from datetime import datetime
 
 class CustomFormatter(logging.Formatter):
@@ -30,6 +31,9 @@ def prep_logging(log_level: str = 'INFO'):
     timestamp = datetime.now().strftime("%Y%m%d-%H:%H:%S")
     root = logging.getLogger()
     root.setLevel(logging.DEBUG)
+    # the daemon builds the order more than once. Do not duplicate the output
+    if any(isinstance(x.formatter, CustomFormatter) for x in root.handlers):
+        return
 
     ch = logging.StreamHandler()
     ch.setLevel(logging.getLevelName(log_level))
@@ -37,8 +41,103 @@ def prep_logging(log_level: str = 'INFO'):
     root.addHandler(ch)
 
 
+class CkBlueprintDirectory:
+    """
+    Blueprint label <-> id (and version) directory built from one blueprints listing
+
+    The listing is pulled on the first use and pulled again on a miss or when older than max_age seconds
+    """
+
+    def __init__(self, session, max_age: int = 300, min_refresh_interval: int = 5) -> None:
+        self.session = session
+        self.max_age = max_age
+        self.min_refresh_interval = min_refresh_interval
+        self.logger = logging.getLogger('CkBlueprintDirectory')
+        self.lock = threading.Lock()
+        self.refreshed_at = None
+        self.label_2_id = {}  # { label: id }
+        self.id_2_label = {}  # { id: label }
+        self.id_2_version = {}  # { id: version }
+
+    def refresh(self) -> None:
+        """
+        Pull the blueprints listing and rebuild the maps
+        """
+        with self.lock:
+            blueprints = self.session.get_items('blueprints')['items']
+            self.label_2_id = {x['label']: x['id'] for x in blueprints}
+            self.id_2_label = {x['id']: x['label'] for x in blueprints}
+            self.id_2_version = {x['id']: x.get('version') for x in blueprints}
+            self.refreshed_at = time.time()
+        self.logger.debug(f"{len(self.label_2_id)} blueprints")
+
+    def _ensure(self, miss: bool = False, force: bool = False) -> None:
+        # pull the listing lazily. on a miss, pull again unless it was pulled just now or forced
+        if self.refreshed_at is None:
+            self.refresh()
+            return
+        age = time.time() - self.refreshed_at
+        if age > self.max_age or (miss and (force or age > self.min_refresh_interval)):
+            self.refresh()
+
+    def get_id(self, label: str, force: bool = False) -> str:
+        """
+        Return the id of the blueprint label or None
+
+        force: a miss pulls the listing again even within min_refresh_interval
+        """
+        self._ensure()
+        if label not in self.label_2_id:
+            self._ensure(miss=True, force=force)
+        return self.label_2_id.get(label)
+
+    def get_label(self, id: str, force: bool = False) -> str:
+        """
+        Return the label of the blueprint id or None
+
+        force: a miss pulls the listing again even within min_refresh_interval
+        """
+        self._ensure()
+        if id not in self.id_2_label:
+            self._ensure(miss=True, force=force)
+        return self.id_2_label.get(id)
+
+    def get_version(self, id: str) -> int:
+        """
+        Return the version of the blueprint id as of the last listing
+        """
+        self._ensure()
+        return self.id_2_version.get(id)
+
+    def resolve_labels(self, labels: list) -> dict:
+        """
+        Return { label: id } of the labels. The id is None for the unknown labels
+        """
+        self._ensure()
+        if any(x not in self.label_2_id for x in labels):
+            self._ensure(miss=True)
+        return {x: self.label_2_id.get(x) for x in labels}
+
+    def resolve_ids(self, ids: list) -> dict:
+        """
+        Return { id: label } of the ids. The label is None for the unknown ids
+        """
+        self._ensure()
+        if any(x not in self.id_2_label for x in ids):
+            self._ensure(miss=True)
+        return {x: self.id_2_label.get(x) for x in ids}
+
+    def list_ids(self) -> list:
+        """
+        Return the ids of all the blueprints
+        """
+        self._ensure()
+        return list(self.id_2_label)
+
+
 # https client session to Apstra Controller
 class CkApstraSession:
+    POOL_MAXSIZE = 32
 
     def __init__(self, host: str, port: int, username: str, password: str) -> None:
         self.host = host
@@ -50,6 +149,8 @@ class CkApstraSession:
         self.logger = logging.getLogger('CkApstraSession')
 
         self.session = requests.Session()
+        # the fleet scans share the session between the worker threads
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=self.POOL_MAXSIZE))
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
         self.session.verify = False
         self.session.headers.update({'Content-Type': "application/json"})
@@ -58,6 +159,8 @@ class CkApstraSession:
         self.login()
 
         self.device_profile_cache = {} # { device_profile_id: data }
+        self.blueprint_directory = CkBlueprintDirectory(self)
+        self.latency_stats = None  # CkLatencyStats recording the responses. See get_latency_stats
 
     def login(self) -> None:
         """
@@ -133,6 +236,18 @@ class CkApstraSession:
         self.logger.debug(f"patch_item({url}, {spec})")
         return self.session.patch(url, json=spec).json()
 
+    def patch_throttled_response(self, url: str, spec: dict, params: dict = None):
+        """
+        Patch, waiting out the 429 responses. Return the response to check the status code
+        """
+        throttle_seconds = 10
+        patched = self.session.patch(url, json=spec, params=params)
+        while patched.status_code == 429:
+            self.logger.info(f"sleeping {throttle_seconds} seconds due to: {patched.text}")
+            time.sleep(throttle_seconds)
+            patched = self.session.patch(url, json=spec, params=params)
+        return patched
+
     def patch_throttled(self, url: str, spec: dict, params: None) -> dict:
         """
         """
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+
+DEFAULT_INITIAL_SIZE = 50
+DEFAULT_MIN_SIZE = 5
+DEFAULT_MAX_SIZE = 1000
+DEFAULT_TARGET_LATENCY = 5.0  # seconds per batch request
+
+
+class AdaptiveBatchSizer:
+    """
+    The chunk size of the batch requests, adjusted by the controller response
+
+    Grow by a step while the latency stays under the target. Shrink by a quarter when slower than the target.
+    Halve on http 429 too many requests.
+    The same sizer is shared by the steps of an order so that the learned size carries over.
+    """
+
+    def __init__(self, initial: int = DEFAULT_INITIAL_SIZE, minimum: int = DEFAULT_MIN_SIZE, maximum: int = DEFAULT_MAX_SIZE, target_latency: float = DEFAULT_TARGET_LATENCY) -> None:
+        self.logger = logging.getLogger('AdaptiveBatchSizer')
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.size = min(max(initial, self.minimum), self.maximum)
+        self.step = max(1, self.size // 5)
+        self.target_latency = target_latency
+        self.lock = threading.Lock()
+
+    def record(self, latency: float, throttled: bool = False) -> int:
+        """
+        Adjust the size by the latency in seconds of the last request of the current size
+
+        Return: the new size
+        """
+        with self.lock:
+            old_size = self.size
+            if throttled:
+                self.size = max(self.minimum, self.size // 2)
+                reason = 'throttled'
+            elif latency > self.target_latency:
+                self.size = max(self.minimum, self.size * 3 // 4)
+                reason = f"{latency:.2f}s > {self.target_latency}s"
+            else:
+                self.size = min(self.maximum, self.size + self.step)
+                reason = f"{latency:.2f}s"
+            if self.size != old_size:
+                self.logger.info(f"batch size {old_size} -> {self.size} ({reason})")
+            return self.size
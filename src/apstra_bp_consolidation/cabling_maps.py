@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import logging
+import yaml
+
+try:
+    # libyaml emitter and parser when available
+    from yaml import CSafeDumper as YamlDumper
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
+    from yaml import SafeLoader as YamlLoader
+
+from apstra_bp_consolidation.apstra_blueprint import CkApstraBlueprint, CkEnum
+from apstra_bp_consolidation.fleet import map_concurrently, DEFAULT_MAX_WORKERS
+
+# 2: evpn_members in the cabling maps
+INDEX_FORMAT = 2
+
+
+def get_index_file(cabling_maps_yaml_file: str) -> str:
+    """
+    The index file next to the cabling maps yaml file
+    """
+    return f"{cabling_maps_yaml_file}.index.json"
+
+
+def load_index(cabling_maps_yaml_file: str) -> dict:
+    """
+    Load the index of the previous collection
+
+    Return: { bp_id: { label: <label>, version: <version>, offset: <byte offset>, length: <byte length> } }
+    """
+    index_file = get_index_file(cabling_maps_yaml_file)
+    if not os.path.exists(index_file) or not os.path.exists(cabling_maps_yaml_file):
+        return {}
+    with open(index_file, 'r') as file:
+        index = json.load(file)
+    if index.get('format') != INDEX_FORMAT:
+        return {}
+    return index['blueprints']
+
+
+def pull_evpn_members(the_bp) -> dict:
+    """
+    The EVPN AE of each member interface of the blueprint
+
+    Return: { <member interface id>: <evpn interface id> }
+    """
+    evpn_query = f"""
+        node('interface', po_control_protocol='evpn', name='{CkEnum.EVPN_INTERFACE}')
+            .out('composed_of').node('interface')
+            .out('composed_of').node('interface', name='{CkEnum.MEMBER_INTERFACE}')
+    """
+    return {x[CkEnum.MEMBER_INTERFACE]['id']: x[CkEnum.EVPN_INTERFACE]['id'] for x in the_bp.query(evpn_query, multiline=True)}
+
+
+def collect_cabling_maps(session, cabling_maps_yaml_file: str, max_workers: int = DEFAULT_MAX_WORKERS, incremental: bool = False) -> dict:
+    """
+    Pull the cabling maps of all the blueprints concurrently and stream them into the yaml file
+
+    The yaml file is a mapping of <bp_label>: <cabling maps>, written one blueprint at a time.
+    The cabling maps carry evpn_members of pull_evpn_members so that the AE of a link is known without a query.
+    The index file keeps the version and the byte range of each blueprint so that the incremental
+    collection copies the unchanged blueprints from the previous file without pulling or parsing them.
+    A blueprint failed to pull is copied from the previous file as is, and pulled again next time.
+    If it is not in the previous file, ValueError is raised and the previous file is left untouched.
+
+    Return: the new index
+    """
+    bp_directory = session.blueprint_directory
+    bp_directory.refresh()
+    bp_id_list = bp_directory.list_ids()
+
+    # the previous entries are the fallback of the failed pulls even without incremental
+    old_index = load_index(cabling_maps_yaml_file)
+    unchanged_bp_ids = [
+        x for x in bp_id_list
+        if incremental and x in old_index and old_index[x]['version'] is not None and old_index[x]['version'] == bp_directory.get_version(x)
+        ]
+    bp_ids_to_pull = [x for x in bp_id_list if x not in unchanged_bp_ids]
+    logging.info(f"{len(bp_id_list)=} {len(unchanged_bp_ids)=} {len(bp_ids_to_pull)=}")
+
+    def pull_cabling_maps(bp_id):
+        the_bp = CkApstraBlueprint(session, None, bp_id)
+        cabling_maps = the_bp.get_cabling_maps()
+        cabling_maps['evpn_members'] = pull_evpn_members(the_bp)
+        return cabling_maps
+
+    new_index = {}
+    failed_bp_ids = []
+    temp_file = f"{cabling_maps_yaml_file}.tmp"
+    with open(temp_file, 'wb') as out_file:
+        old_file = open(cabling_maps_yaml_file, 'rb') if old_index else None
+
+        def copy_old_entry(bp_id):
+            old_entry = old_index[bp_id]
+            old_file.seek(old_entry['offset'])
+            chunk = old_file.read(old_entry['length'])
+            new_index[bp_id] = dict(old_entry, offset=out_file.tell())
+            out_file.write(chunk)
+
+        try:
+            for bp_id in unchanged_bp_ids:
+                copy_old_entry(bp_id)
+
+            pulled_count = 0
+            for bp_id, cabling_maps, exception in map_concurrently(pull_cabling_maps, bp_ids_to_pull, max_workers):
+                if exception is not None:
+                    if bp_id in old_index:
+                        logging.warning(f"keeping the previous cabling maps of {old_index[bp_id]['label']}")
+                        copy_old_entry(bp_id)
+                    else:
+                        failed_bp_ids.append(bp_id)
+                    continue
+                pulled_count += 1
+                bp_label = bp_directory.get_label(bp_id)
+                logging.debug(f"pulled cable map - {pulled_count}/{len(bp_ids_to_pull)} == {bp_label}")
+                chunk = yaml.dump({bp_label: cabling_maps}, Dumper=YamlDumper).encode()
+                new_index[bp_id] = {
+                    'label': bp_label,
+                    'version': bp_directory.get_version(bp_id),
+                    'offset': out_file.tell(),
+                    'length': len(chunk),
+                }
+                out_file.write(chunk)
+        finally:
+            if old_file:
+                old_file.close()
+
+    if failed_bp_ids:
+        os.remove(temp_file)
+        raise ValueError(f"failed to pull the cabling maps of {[bp_directory.get_label(x) for x in failed_bp_ids]} - {cabling_maps_yaml_file} not updated")
+    os.replace(temp_file, cabling_maps_yaml_file)
+    with open(get_index_file(cabling_maps_yaml_file), 'w') as file:
+        json.dump({'format': INDEX_FORMAT, 'blueprints': new_index}, file)
+    logging.info(f"wrote {len(new_index)} cabling maps to {cabling_maps_yaml_file}")
+    return new_index
+
+
+class CkCablingMapIndex:
+    """
+    The collected cabling maps indexed by (system label, if_name) -> the link and the peer endpoint
+
+    Only the blueprints looked up are parsed. With the index file of collect_cabling_maps,
+    the byte range of the blueprint is read without parsing the rest of the file.
+    """
+
+    def __init__(self, cabling_maps_yaml_file: str) -> None:
+        self.cabling_maps_yaml_file = cabling_maps_yaml_file
+        self.logger = logging.getLogger('CkCablingMapIndex')
+        # { bp_label: { label, version, offset, length } }
+        self.file_index = {x['label']: x for x in load_index(cabling_maps_yaml_file).values()}
+        self.all_maps = None  # { bp_label: <cabling maps> } when the file has no index
+        # { bp_label: { (system_label, if_name): <endpoint> } }
+        self.blueprints = {}
+        # { bp_label: { system_label: [ ( if_name, <endpoint> ) ] } }
+        self.system_links = {}
+
+    def _read_cabling_maps(self, bp_label: str) -> dict:
+        if bp_label in self.file_index:
+            entry = self.file_index[bp_label]
+            with open(self.cabling_maps_yaml_file, 'rb') as file:
+                file.seek(entry['offset'])
+                return yaml.load(file.read(entry['length']), Loader=YamlLoader)[bp_label]
+        if self.all_maps is None:
+            self.all_maps = {}
+            if os.path.exists(self.cabling_maps_yaml_file):
+                with open(self.cabling_maps_yaml_file, 'r') as file:
+                    self.all_maps = yaml.load(file, Loader=YamlLoader) or {}
+        return self.all_maps.get(bp_label)
+
+    def load_blueprint(self, bp_label: str) -> dict:
+        """
+        Index the links of the blueprint
+
+        Return: { (system_label, if_name): {
+            link_id, speed, system_id, interface_id, peer_label, peer_id, peer_if_name, peer_interface_id, peer_evpn_interface_id } }
+        """
+        if bp_label in self.blueprints:
+            return self.blueprints[bp_label]
+        cabling_maps = self._read_cabling_maps(bp_label)
+        if cabling_maps is None:
+            raise ValueError(f"{bp_label} not in {self.cabling_maps_yaml_file}")
+        evpn_members = cabling_maps.get('evpn_members') or {}
+        endpoints = {}
+        system_links = {}
+        for link in cabling_maps.get('links', []):
+            link_endpoints = link.get('endpoints', [])
+            if len(link_endpoints) != 2:
+                continue
+            for this_end, peer_end in [link_endpoints, link_endpoints[::-1]]:
+                endpoint = {
+                    'link_id': link['id'],
+                    'speed': link.get('speed'),
+                    'system_id': this_end['system']['id'],
+                    'interface_id': this_end['interface'].get('id'),
+                    'peer_label': peer_end['system']['label'],
+                    'peer_id': peer_end['system']['id'],
+                    'peer_if_name': peer_end['interface']['if_name'],
+                    'peer_interface_id': peer_end['interface'].get('id'),
+                    'peer_evpn_interface_id': evpn_members.get(peer_end['interface'].get('id')),
+                }
+                system_label = this_end['system']['label']
+                if_name = this_end['interface']['if_name']
+                endpoints[(system_label, if_name)] = endpoint
+                system_links.setdefault(system_label, []).append((if_name, endpoint))
+        self.blueprints[bp_label] = endpoints
+        self.system_links[bp_label] = system_links
+        self.logger.debug(f"{bp_label}: {len(endpoints)} endpoints")
+        return endpoints
+
+    def get_version(self, bp_label: str) -> int:
+        """
+        The blueprint version at the collection. None if unknown
+        """
+        return self.file_index.get(bp_label, {}).get('version')
+
+    def lookup(self, bp_label: str, system_label: str, if_name: str) -> dict:
+        """
+        The link and the peer endpoint of the interface. None if absent
+        """
+        return self.load_blueprint(bp_label).get((system_label, if_name))
+
+    def get_system_links(self, bp_label: str, system_label: str) -> list:
+        """
+        The endpoints of the system as [ ( if_name, <endpoint> ) ]
+        """
+        self.load_blueprint(bp_label)
+        return self.system_links[bp_label].get(system_label, [])
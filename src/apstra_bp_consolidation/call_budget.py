@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+import logging
+import collections
+import click
+
+from apstra_bp_consolidation.consolidation import ConsolidationOrder, get_fleet_orders
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.ct_batch import iter_application_points, take_application_points
+from apstra_bp_consolidation.logical_devices import CkLogicalDeviceShapes, get_shapes
+from apstra_bp_consolidation.move_access_switch import pull_tor_interface_nodes_in_main, get_tor_ae_id_in_main
+from apstra_bp_consolidation.move_generic_system import preflight_generic_system_labels, chunk_lag_links
+from apstra_bp_consolidation.move_ct import get_vni_2_ct_id_table, get_multi_vlan_ct_ids, get_multi_vlan_ct_label, update_interface_id
+from apstra_bp_consolidation.plan import build_order_plan, decode_generic_systems, decode_interface_vlan_table
+
+DEFAULT_LATENCY = 1.0  # seconds of a call kind without the statistics
+
+STEPS = ['move-access-switches', 'move-generic-systems', 'move-virtual-networks', 'move-cts', 'move-devices']
+
+
+def count_ct_batches(assignments: dict, batch_size: int, max_application_points: int) -> int:
+    """
+    The number of obj-policy-batch-apply requests of apply_ct_assignments at the fixed batch size without 429
+    """
+    pending = collections.deque(iter_application_points(assignments, batch_size))
+    batches = 0
+    while pending:
+        take_application_points(pending, max_application_points, batch_size)
+        batches += 1
+    return batches
+
+
+def build_vlan_assignments(tor_label: str, interface_vlan_table: dict, multi_vlan: bool = False, current_ct_keys: dict = None) -> dict:
+    """
+    The CT assignments keyed by the VLANs instead of the CT ids. A VLAN maps to one CT, so the packing is the same
+
+    current_ct_keys: { ( <system label>, <if_name or AE id> ): set of <VLAN key> } - the CTs already on the interfaces, left out
+    Return: { ( <tor label>, <system label>, <if_name or AE id> ): { <VLAN key>: <used> } }
+    """
+    current_ct_keys = current_ct_keys or {}
+    assignments = {}
+    for system_label, interfaces in interface_vlan_table.items():
+        for key, interface_vlans in interfaces.items():
+            if not interface_vlans.tagged_vlans and not interface_vlans.untagged_vlan:
+                continue
+            current = current_ct_keys.get((system_label, key), set())
+            single_vlan_policies = {f"t{x}": True for x in interface_vlans.tagged_vlans}
+            if interface_vlans.untagged_vlan:
+                single_vlan_policies[f"u{interface_vlans.untagged_vlan}"] = True
+            if multi_vlan:
+                policies = {get_multi_vlan_ct_label(interface_vlans.tagged_vlans, interface_vlans.untagged_vlan): True}
+                # the single VLAN CTs on the interface are detached
+                policies.update({x: False for x in single_vlan_policies if x in current})
+            else:
+                policies = single_vlan_policies
+            policies = {x: used for x, used in policies.items() if not (used and x in current)}
+            if policies:
+                assignments[(tor_label, system_label, key)] = policies
+    return assignments
+
+
+def get_ct_keys(the_bp) -> dict:
+    """
+    The VLAN keys of build_vlan_assignments of the single and the multiple VLAN CTs of the_bp
+
+    Return: { <ct id>: <VLAN key> }
+    """
+    ct_keys = {ct_id: ct_label for ct_label, ct_id in get_multi_vlan_ct_ids(the_bp).items()}
+    for vni, vni_ct in get_vni_2_ct_id_table(the_bp).items():
+        if vni_ct.tagged_id:
+            ct_keys[vni_ct.tagged_id] = f"t{vni - 100000}"
+        if vni_ct.untagged_id:
+            ct_keys[vni_ct.untagged_id] = f"u{vni - 100000}"
+    return ct_keys
+
+
+def get_current_ct_keys(order, interface_vlan_table: dict, ct_keys: dict) -> dict:
+    """
+    The VLAN keys of the CTs on the interfaces of the access switch pair in the main blueprint
+
+    Return: { ( <system label>, <if_name or AE id> ): set of <VLAN key> }
+    """
+    interface_id_table = update_interface_id(order.main_bp, interface_vlan_table, order.switch_label_pair)
+    interface_keys = {
+        interface_id: (system_label, key)
+        for system_label, interface_ids in interface_id_table.items()
+        for key, interface_id in interface_ids.items()
+    }
+    return {
+        interface_keys[interface_id]: {ct_keys[x] for x in ct_ids if x in ct_keys}
+        for interface_id, ct_ids in order.main_bp.get_interfaces_cts(list(interface_keys)).items()
+    }
+
+
+def get_bound_vni_list(the_bp, switch_label_pair: list) -> list:
+    """
+    The VNIs with the access switch pair in bound_to already
+    """
+    vn_query = f"""
+        node('system', label=is_in({switch_label_pair}))
+            .out('hosted_vn_instances').node('vn_instance')
+            .in_('instantiated_by').node('virtual_network', vn_type='vxlan', name='vn')
+    """
+    return sorted({x['vn']['vn_id'] for x in the_bp.query(vn_query, multiline=True)})
+
+
+def discover_order(order, logical_device_shapes: CkLogicalDeviceShapes, tor_interface_nodes_in_main: list) -> dict:
+    """
+    Run the bulk discovery reads of an order. Nothing is written
+
+    The VNs and the CTs already on the access switch pair are read if the pair is in the main blueprint
+    tor_interface_nodes_in_main: the links of the TOR generic system from pull_tor_interface_nodes_in_main
+    Return: the facts of the order for count_writes
+    """
+    order_plan = build_order_plan(order)
+    tor_ae_id_in_main = get_tor_ae_id_in_main(tor_interface_nodes_in_main, order.tor_label)
+    tor_generic_systems_data = decode_generic_systems(order_plan['generic_systems'])
+    conflict = None
+    try:
+        generic_systems = preflight_generic_system_labels(order, tor_generic_systems_data)
+    except ValueError as e:
+        # counted as if the conflicts were resolved
+        conflict = str(e)
+        generic_systems = tor_generic_systems_data
+    interface_vlan_table = decode_interface_vlan_table(order_plan['interface_vlan_table'])
+    pair_present = bool(order.main_bp.get_system_nodes(order.switch_label_pair))
+    ct_keys = get_ct_keys(order.main_bp)
+    return {
+        'tor_label': order.tor_label,
+        'tor_bp': order.tor_bp.label,
+        'main_bp': order.main_bp.label,
+        'old_ae_cts': tor_ae_id_in_main and len(order.main_bp.get_interface_cts(tor_ae_id_in_main)),
+        'pair_present': pair_present,
+        'generic_systems': generic_systems,
+        'conflict': conflict,
+        'missing_shapes': set(logical_device_shapes.get_missing(get_shapes(generic_systems))),
+        'vni_list': order_plan['vni_list'],
+        'bound_vni_list': get_bound_vni_list(order.main_bp, order.switch_label_pair) if pair_present else [],
+        'interface_vlan_table': interface_vlan_table,
+        'ct_keys': set(ct_keys.values()),
+        'current_ct_keys': get_current_ct_keys(order, interface_vlan_table, ct_keys) if pair_present else {},
+    }
+
+
+def count_writes(facts_list: list, batch_size: int, max_application_points: int, multi_vlan: bool = False) -> collections.Counter:
+    """
+    The writes the steps would issue for the orders run together (--fleet), merged the same way
+
+    The VNs and the CTs already in effect are left out, as the steps skip them.
+    The 429 retries and the size changes of the CT batches are not counted.
+    Return: Counter { ( <step>, <call kind> ): <requests> }
+    """
+    writes = collections.Counter()
+    for facts in facts_list:
+        step = 'move-access-switches'
+        if facts['old_ae_cts'] is not None:
+            writes[(step, 'POST batch')] += count_ct_batches({'ae': {f"ct{i}": False for i in range(facts['old_ae_cts'])}}, batch_size, max_application_points)
+            # delete-switch-system-links
+            writes[(step, 'POST batch')] += 1
+        if not facts['pair_present']:
+            writes[(step, 'POST switch-system-links')] += 1
+
+        step = 'move-generic-systems'
+        lag_links = {}
+        tag_sets = set()
+        for generic_system_label, links in facts['generic_systems'].items():
+            writes[(step, 'POST switch-system-links')] += 1
+            for link_id, gs_link in links.items():
+                if gs_link.tags:
+                    tag_sets.add(frozenset(gs_link.tags))
+                if gs_link.aggregate_link:
+                    lag_links[link_id] = {'group_label': gs_link.aggregate_link, 'lag_mode': 'lacp_active'}
+        # one tagging request per distinct tag set (CkMainBlueprintWrites.flush_tags)
+        writes[(step, 'POST tagging')] += len(tag_sets)
+        writes[(step, 'PATCH leaf-server-link-labels')] += len(list(chunk_lag_links(lag_links)))
+    # the logical devices are created once per controller
+    missing_shapes = set().union(*(x['missing_shapes'] for x in facts_list))
+    writes[('move-generic-systems', 'PUT design/logical-devices')] += len(missing_shapes)
+
+    by_main_bp = {}
+    for facts in facts_list:
+        by_main_bp.setdefault(facts['main_bp'], []).append(facts)
+    for main_facts in by_main_bp.values():
+        # the renames of the new pairs in one PATCH per main blueprint
+        if any(not x['pair_present'] for x in main_facts):
+            writes[('move-access-switches', 'PATCH nodes')] += 1
+        # each VN patched once with all the new pairs not in its bound_to yet
+        writes[('move-virtual-networks', 'PATCH virtual-networks')] += len({
+            vni for x in main_facts for vni in x['vni_list'] if vni not in x['bound_vni_list']})
+        # the missing CTs are created for all the VLANs of the interfaces
+        all_assignments = {}
+        assignments = {}
+        for facts in main_facts:
+            all_assignments.update(build_vlan_assignments(facts['tor_label'], facts['interface_vlan_table'], multi_vlan))
+            assignments.update(build_vlan_assignments(facts['tor_label'], facts['interface_vlan_table'], multi_vlan, facts['current_ct_keys']))
+        ct_keys = set().union(*(x['ct_keys'] for x in main_facts))
+        writes[('move-cts', 'PUT obj-policy-import')] += len({ct for x in all_assignments.values() for ct in x} - ct_keys)
+        writes[('move-cts', 'POST batch')] += count_ct_batches(assignments, batch_size, max_application_points)
+        writes[('move-devices', 'PATCH nodes')] += 1
+    writes[('move-devices', 'PATCH nodes')] += len({x['tor_bp'] for x in facts_list})
+    return writes
+
+
+def estimate_seconds(writes: collections.Counter, latency_stats) -> dict:
+    """
+    { <step>: <seconds> } by the mean latency of each call kind from the earlier runs
+    """
+    seconds = collections.Counter()
+    for (step, kind), count in writes.items():
+        seconds[step] += count * latency_stats.mean(kind, DEFAULT_LATENCY)
+    return seconds
+
+
+def log_cost_report(label: str, writes: collections.Counter, latency_stats) -> None:
+    seconds = estimate_seconds(writes, latency_stats)
+    for step in STEPS:
+        step_writes = {kind: count for (this_step, kind), count in writes.items() if this_step == step and count}
+        logging.info(f"{label} {step}: {sum(step_writes.values())} writes {step_writes} ~{seconds[step]:.0f}s")
+    logging.info(f"{label} total: {sum(writes.values())} writes ~{sum(seconds.values()):.0f}s")
+
+
+@click.command(name='dry-run', help='run the discovery reads only and report the writes and the estimated time of each step')
+@click.option('--fleet', is_flag=True, help='all the TORs of blueprint.tors in the config')
+@click.option('--multi-vlan', is_flag=True, help='one multiple VLAN CT per distinct VLAN set instead of single VLAN CTs')
+@click.option('--ct-batch-size', type=int, help='the policies per CT batch. The initial size of the sizer by default')
+def click_dry_run(fleet, multi_vlan, ct_batch_size):
+    orders = get_fleet_orders() if fleet else [ConsolidationOrder()]
+    order_dry_run(orders, multi_vlan, ct_batch_size)
+
+
+def order_dry_run(orders: list, multi_vlan: bool = False, ct_batch_size: int = None) -> collections.Counter:
+    """
+    Report the writes per TOR as if run alone, and the total of the orders run together
+
+    The waits for the asynchronous changes and the polls are not counted.
+    Return: the writes of the orders run together
+    """
+    batch_size = ct_batch_size or orders[0].ct_batch_sizer.size
+    max_application_points = orders[0].ct_batch_max_application_points
+    latency_stats = orders[0].latency_stats
+    logical_device_shapes = CkLogicalDeviceShapes(orders[0].session)
+    logging.info(f"======== Dry run of {[x.tor_label for x in orders]} with CT batch size {batch_size}")
+
+    tor_interface_nodes = pull_tor_interface_nodes_in_main(orders)
+    facts_list = [discover_order(x, logical_device_shapes, tor_interface_nodes[x.tor_label]) for x in orders]
+    for facts in facts_list:
+        if facts['conflict']:
+            logging.warning(f"{facts['tor_label']}: {facts['conflict']}")
+        log_cost_report(facts['tor_label'], count_writes([facts], batch_size, max_application_points, multi_vlan), latency_stats)
+    writes = count_writes(facts_list, batch_size, max_application_points, multi_vlan)
+    if len(facts_list) > 1:
+        log_cost_report('fleet', writes, latency_stats)
+    return writes
@@ -7,6 +7,12 @@ import logging
 from apstra_bp_consolidation.apstra_session import CkApstraSession
 from apstra_bp_consolidation.apstra_blueprint import CkApstraBlueprint
 from apstra_bp_consolidation.apstra_session import prep_logging
+from apstra_bp_consolidation.cabling_maps import collect_cabling_maps
+from apstra_bp_consolidation.fleet import DEFAULT_MAX_WORKERS
+from apstra_bp_consolidation.ct_batch import DEFAULT_MAX_APPLICATION_POINTS, DEFAULT_MAX_POLICIES
+from apstra_bp_consolidation.batch_sizer import AdaptiveBatchSizer, DEFAULT_INITIAL_SIZE, DEFAULT_TARGET_LATENCY
+from apstra_bp_consolidation.device_move import DEFAULT_DEVICE_MOVE_TIMEOUT
+from apstra_bp_consolidation.latency_stats import get_latency_stats
 
 
 # # PLAN
@@ -70,9 +76,15 @@ class ConsolidationOrder:
     #     'access_if_name': 'et-0/0/48'
     #  }]
 
-    def __init__(self, env_file_input: str = None):
+    def __init__(self, env_file_input: str = None, session: CkApstraSession = None, blueprint_cache: dict = None, tor_config: dict = None):
         """
         Build the consolidation order object from the env file path
+
+        Args:
+            env_file_input: The env file path. ENV_FILE by default
+            session: The session to reuse (daemon mode). A new session is created by default
+            blueprint_cache: { bp_label: CkApstraBlueprint } to reuse the blueprint objects (daemon mode)
+            tor_config: The TOR entry of blueprint.tors (fleet mode). blueprint.tor by default
         """
         import yaml
         import os
@@ -103,30 +115,59 @@ class ConsolidationOrder:
         #     apstra_server['username'],
         #     apstra_server['password']
         #     )
-        self.session = CkApstraSession(
+        self.session = session or CkApstraSession(
             apstra_server_host, 
             apstra_server_port,
             apstra_server_username,
             apstra_server_password,
             )
-        self.main_bp = CkApstraBlueprint(self.session, self.config['blueprint']['main']['name'])
-        self.tor_bp = CkApstraBlueprint(self.session, self.config['blueprint']['tor']['name'])
-        # print(f"{self.main_bp.id=}, {self.main_bp.label}, {self.tor_bp.id=}, {self.tor_bp.label}, {self.config['blueprint']['tor']=}")
-        access_switch_interface_map_label = self.config['blueprint']['tor']['new_interface_map']
+        self.blueprint_cache = blueprint_cache if blueprint_cache is not None else {}
+        self.tor_config = tor_config or self.config['blueprint'].get('tor') or self.config['blueprint']['tors'][0]
+        self.main_bp = self.get_blueprint(self.config['blueprint']['main']['name'])
+        self.tor_bp = self.get_blueprint(self.tor_config['name'])
+        # print(f"{self.main_bp.id=}, {self.main_bp.label}, {self.tor_bp.id=}, {self.tor_bp.label}, {self.tor_config=}")
+        self.access_switch_interface_map_label = self.tor_config['new_interface_map']
         self.logger = logging.getLogger(f"ConsolidationOrder({self.main_bp.label}<-{self.tor_bp.label})")
 
-        self.tor_label = self.config['blueprint']['tor']['torname']
-        self.switch_label_pair = self.config['blueprint']['tor']['switch_names']
+        self.tor_label = self.tor_config['torname']
+        self.switch_label_pair = self.tor_config['switch_names']
         self.logger.debug(f"{self.main_bp.id=}, {self.tor_bp.id=}")
         # self.leaf_links = self.pull_leaf_links()
         # self.vni_list = []
-        self.pull_vni_ids()
+        # pulled on the first use. apply sets it from the plan
+        self._vni_list = None
         # self.logger.info(f"{self=}")
         self.cabling_maps_yaml_file = os.getenv('cabling_maps_yaml_file')
+        # the number of the concurrent requests for the fleet scans
+        self.max_workers = int(os.getenv('max_workers') or DEFAULT_MAX_WORKERS)
+        self.vni_index_file = os.getenv('vni_index_file')
+        self.inventory_db_file = os.getenv('inventory_db_file')
+        # comma separated switch pair template files. DEFAULT_SWITCH_TEMPLATE_FILES by default
+        self.switch_template_files = os.getenv('switch_template_files')
+        # the size limits of an obj-policy-batch-apply payload
+        self.ct_batch_max_application_points = int(os.getenv('ct_batch_max_application_points') or DEFAULT_MAX_APPLICATION_POINTS)
+        self.ct_batch_max_policies = int(os.getenv('ct_batch_max_policies') or DEFAULT_MAX_POLICIES)
+        # the policies per CT batch grow and shrink by the controller response, shared by the steps
+        self.ct_batch_sizer = AdaptiveBatchSizer(
+            initial=int(os.getenv('ct_batch_initial_policies') or DEFAULT_INITIAL_SIZE),
+            maximum=self.ct_batch_max_policies,
+            target_latency=float(os.getenv('ct_batch_target_latency') or DEFAULT_TARGET_LATENCY))
+        # the seconds to confirm each of the undeploy and the deploy of move-devices
+        self.device_move_timeout = int(os.getenv('device_move_timeout') or DEFAULT_DEVICE_MOVE_TIMEOUT)
+        # the response times by the API call kind, recorded across the runs for dry-run. Not recorded without the file
+        self.latency_stats = get_latency_stats(self.session, os.getenv('latency_stats_file'))
  
     def __repr__(self) -> str:
         return f"ConsolidationOrder({self.config_yaml_input_file=}, {self.config=}, {self.session=}, {self.main_bp=}, {self.tor_bp=}, {self.tor_label=}, {self.switch_label_pair=})"
     
+    def get_blueprint(self, bp_label: str) -> CkApstraBlueprint:
+        """
+        Get the blueprint object of the label, reusing the cached one if present
+        """
+        if bp_label not in self.blueprint_cache:
+            self.blueprint_cache[bp_label] = CkApstraBlueprint(self.session, bp_label)
+        return self.blueprint_cache[bp_label]
+
     def rename_generic_system(self, generic_system_from_tor_bp: str) -> str:
         # rename the generic system in the main blueprint to avoid conflict
         # the maximum length is 32. Prefix 'r5r14-'
@@ -145,11 +186,31 @@ class ConsolidationOrder:
         # just prefix
         return f"{prefix}-{generic_system_from_tor_bp}"
 
+    def rename_generic_system_tail(self, generic_system_from_tor_bp: str) -> str:
+        # the prefix and the tail of the label within the maximum length 32
+        #   the alternative when the label kept by rename_generic_system collides
+        max_len = 32
+        prefix = self.tor_label[len('atl1tor-'):]
+        return f"{prefix}-{generic_system_from_tor_bp[-(max_len - len(prefix) - 1):]}"
+
     # PLAN
     # def pull_leaf_links(self):
     #     # TODO: pull the live data from the blueprint
     #     return self.config.get('leaf_links', [])
 
+    @property
+    def vni_list(self) -> list:
+        """
+        The vni ids present in the switch pair of the tor blueprint. Pulled on the first use
+        """
+        if getattr(self, '_vni_list', None) is None:
+            self.pull_vni_ids()
+        return self._vni_list
+
+    @vni_list.setter
+    def vni_list(self, vni_list: list) -> None:
+        self._vni_list = vni_list
+
     def pull_vni_ids(self):
         """
         Pull the vni ids present in the switch pair
@@ -171,33 +232,37 @@ class ConsolidationOrder:
         return
 
 
+def get_fleet_orders(env_file_input: str = None) -> list:
+    """
+    Build an order per TOR in blueprint.tors of the config, sharing the session and the blueprint objects
+    The single order of blueprint.tor without blueprint.tors
+    """
+    first_order = ConsolidationOrder(env_file_input)
+    tor_configs = first_order.config['blueprint'].get('tors')
+    if not tor_configs:
+        return [first_order]
+    orders = [first_order] if first_order.tor_config is tor_configs[0] else []
+    for tor_config in tor_configs[len(orders):]:
+        orders.append(ConsolidationOrder(env_file_input, first_order.session, first_order.blueprint_cache, tor_config))
+    return orders
+
+
 @click.command(name='collect-cabling-maps', help='collect the cabling maps from all the blueprints and write to a yaml file')
-def click_collect_cabling_maps():
+@click.option('--incremental', is_flag=True, help='pull only the blueprints whose version changed since the previous collection')
+def click_collect_cabling_maps(incremental):
     """
     Collect the cabling maps from all blueprints
     """
     logging.info(f"======== Collecting Cabling Maps from all blueprints")
     order = ConsolidationOrder()
-    order_collect_cabling_maps(order)
+    order_collect_cabling_maps(order, incremental)
 
-def order_collect_cabling_maps(order: ConsolidationOrder):
+def order_collect_cabling_maps(order: ConsolidationOrder, incremental: bool = False):
     logging.info(f"======== Collecting Cabling Maps from all blueprints")
-    cabling_maps = {}    # bp_label: cabling_maps
     cable_map_out_yaml_file = order.cabling_maps_yaml_file
 
-    # iterate all the blueprints
-    bp_id_list = order.session.list_blueprint_ids()
-    for i in range(len(bp_id_list)):
-        bp_id = bp_id_list[i]
-        this_bp = CkApstraBlueprint(order.session, None, bp_id)
-        this_bp_label = this_bp.label
-        logging.debug(f"pulling cable map - {i+1}/{len(bp_id_list)} == {this_bp_label}")
-        cabling_maps[this_bp_label] = this_bp.get_cabling_maps()
-        i += 1
-
-    logging.info(f"writing cabling maps to {cable_map_out_yaml_file}")
-    with open(cable_map_out_yaml_file, 'w') as file:
-        yaml.dump(cabling_maps, file)
+    # pull concurrently and stream each blueprint to the file as it arrives
+    collect_cabling_maps(order.session, cable_map_out_yaml_file, order.max_workers, incremental)
     
 
 def pretty_yaml(data: dict, label: str) -> None:
@@ -249,11 +314,30 @@ cli.add_command(click_move_devices)
 
 cli.add_command(move_all)
 
+from apstra_bp_consolidation.verify import click_verify
+cli.add_command(click_verify)
+
+from apstra_bp_consolidation.plan import click_plan, click_apply
+cli.add_command(click_plan)
+cli.add_command(click_apply)
+
+from apstra_bp_consolidation.call_budget import click_dry_run
+cli.add_command(click_dry_run)
+
 from apstra_bp_consolidation.find_missing_vn import find_missing_vn
 cli.add_command(find_missing_vn)
 
+from apstra_bp_consolidation.find_missing_vn import click_vni_index
+cli.add_command(click_vni_index)
+
 cli.add_command(click_collect_cabling_maps)
 
+from apstra_bp_consolidation.inventory import click_inventory
+cli.add_command(click_inventory)
+
+from apstra_bp_consolidation.daemon import click_daemon
+cli.add_command(click_daemon)
+
 if __name__ == "__main__":
     move_all()
 
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import time
+import logging
+import collections
+
+from apstra_bp_consolidation.batch_sizer import AdaptiveBatchSizer
+
+DEFAULT_MAX_APPLICATION_POINTS = 100
+DEFAULT_MAX_POLICIES = 50  # the limit of the former per-interface batches. raised by ct_batch_max_policies
+THROTTLE_SECONDS = 10
+MAX_BATCH_ATTEMPTS = 3
+
+
+def group_by_ct_set(assignments: dict) -> dict:
+    """
+    Group the interfaces having the exact same CT set
+
+    Args:
+        assignments: { <interface id>: { <ct id>: <used> } }
+
+    Return: { frozenset of (ct id, used): [ <interface id> ] }
+    """
+    groups = {}
+    for interface_id, policies in assignments.items():
+        groups.setdefault(frozenset(policies.items()), []).append(interface_id)
+    return groups
+
+
+def diff_ct_assignments(assignments: dict, current: dict, managed_cts: set = frozenset()) -> dict:
+    """
+    The CT changes to bring the current assignments to the desired assignments
+
+    Args:
+        assignments: { <interface id>: { <ct id>: True } } - the desired CTs
+        current: { <interface id>: set of <ct id> } - the CTs already attached
+        managed_cts: set of <ct id> - the extra CTs are removed only if in this set
+
+    Return: { <interface id>: { <ct id>: <used> } } of the interfaces to change only
+    """
+    delta = {}
+    for interface_id, policies in assignments.items():
+        current_cts = current.get(interface_id, set())
+        desired_cts = {ct_id for ct_id, used in policies.items() if used}
+        changes = {ct_id: True for ct_id in desired_cts - current_cts}
+        changes.update({ct_id: False for ct_id in (current_cts - desired_cts) & managed_cts})
+        if changes:
+            delta[interface_id] = changes
+    return delta
+
+
+def iter_application_points(assignments: dict, max_policies: int = DEFAULT_MAX_POLICIES):
+    """
+    Yield the application points grouped by the CT set, the largest groups first
+
+    An interface with more than max_policies CTs is split into multiple application points
+    """
+    groups = group_by_ct_set(assignments)
+    for ct_set, interface_ids in sorted(groups.items(), key=lambda x: -len(x[1])):
+        policies = [{"policy": ct_id, "used": used} for ct_id, used in sorted(ct_set, key=lambda x: (not x[1], x[0]))]
+        if not policies:
+            continue
+        for interface_id in interface_ids:
+            for i in range(0, len(policies), max_policies):
+                yield {
+                    "id": interface_id,
+                    "policies": policies[i:i+max_policies]
+                }
+
+
+def build_batch_ct_spec(payload: dict) -> dict:
+    return {
+        "operations": [
+            {
+                "path": "/obj-policy-batch-apply",
+                "method": "PATCH",
+                "payload": payload
+            }
+        ]
+    }
+
+
+def take_application_points(pending: collections.deque, max_application_points: int, max_policies: int) -> list:
+    """
+    Take the application points from pending for one payload of up to max_policies policies
+
+    An application point larger than max_policies is split. The rest stays at the front of pending
+    """
+    points = []
+    interface_ids = set()
+    policies = 0
+    while pending and len(points) < max_application_points:
+        if pending[0]['id'] in interface_ids:
+            # an interface appears once per payload
+            break
+        this_policies = len(pending[0]['policies'])
+        if policies + this_policies <= max_policies:
+            interface_ids.add(pending[0]['id'])
+            points.append(pending.popleft())
+            policies += this_policies
+            continue
+        if not points:
+            point = pending[0]
+            points.append({"id": point['id'], "policies": point['policies'][:max_policies]})
+            pending[0] = {"id": point['id'], "policies": point['policies'][max_policies:]}
+        break
+    return points
+
+
+def put_back_application_points(pending: collections.deque, points: list) -> None:
+    """
+    Put the points back at the front of pending in order, joining a split point again
+    """
+    for point in reversed(points):
+        if pending and pending[0]['id'] == point['id']:
+            pending[0] = {"id": point['id'], "policies": point['policies'] + pending[0]['policies']}
+        else:
+            pending.appendleft(point)
+
+
+def apply_ct_assignments(the_bp, assignments: dict, sizer: AdaptiveBatchSizer = None, max_application_points: int = DEFAULT_MAX_APPLICATION_POINTS) -> int:
+    """
+    Apply the CT assignments in the batches sized by the sizer
+
+    Each batch carries up to sizer.size policies. The latency and the 429 responses adjust the size.
+    A throttled batch is sent again after THROTTLE_SECONDS with the smaller size.
+    A failed batch is sent again with the halved size, up to MAX_BATCH_ATTEMPTS times.
+    The rest is applied even if a batch keeps failing, then ValueError is raised with the failed interfaces.
+
+    Args:
+        assignments: { <interface id>: { <ct id>: <used> } }
+
+    Return: the number of the batch requests
+    """
+    sizer = sizer or AdaptiveBatchSizer(maximum=DEFAULT_MAX_POLICIES)
+    pending = collections.deque(iter_application_points(assignments, sizer.maximum))
+    total_policies = sum(len(x['policies']) for x in pending)
+    done_policies = 0
+    requests = 0
+    attempts = 0  # the failed attempts of the batch at the front of pending
+    failed_points = []
+    while pending:
+        points = take_application_points(pending, max_application_points, sizer.size)
+        this_policies = sum(len(x['policies']) for x in points)
+        begin = time.perf_counter()
+        batch_result = the_bp.batch(build_batch_ct_spec({"application_points": points}), params={"comment": "batch-api"})
+        latency = time.perf_counter() - begin
+        requests += 1
+        status_code = getattr(batch_result, 'status_code', None)
+        if status_code == 429:
+            sizer.record(latency, throttled=True)
+            logging.info(f"sleeping {THROTTLE_SECONDS} seconds due to: {batch_result.text}")
+            time.sleep(THROTTLE_SECONDS)
+            # the next batch is taken with the smaller size
+            put_back_application_points(pending, points)
+            continue
+        if status_code is not None and status_code >= 400:
+            # shrink as on 429 so that a bad application point is isolated in the smaller batches
+            sizer.record(latency, throttled=True)
+            attempts += 1
+            if attempts < MAX_BATCH_ATTEMPTS:
+                logging.warning(f"CT batch failed {status_code} - attempt {attempts}/{MAX_BATCH_ATTEMPTS}: {batch_result.text}")
+                put_back_application_points(pending, points)
+                continue
+            logging.error(f"CT batch failed {status_code} - giving up {[x['id'] for x in points]}: {batch_result.text}")
+            failed_points.extend(points)
+            attempts = 0
+            continue
+        attempts = 0
+        sizer.record(latency)
+        done_policies += this_policies
+        logging.debug(f"applied CTs {done_policies}/{total_policies}: {len(points)} application points {this_policies} policies in {latency:.2f}s")
+    if failed_points:
+        failed_interfaces = sorted({x['id'] for x in failed_points})
+        raise ValueError(f"failed to apply {sum(len(x['policies']) for x in failed_points)} CTs on the interfaces {failed_interfaces}")
+    return requests
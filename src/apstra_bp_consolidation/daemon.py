@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import socket
+import logging
+import importlib
+import socketserver
+import click
+
+from apstra_bp_consolidation.consolidation import ConsolidationOrder
+from apstra_bp_consolidation.consolidation import ENV_FILE
+
+DEFAULT_SOCKET_FILE = '/tmp/consolidation-helper.sock'
+
+# step name: (module, order function, clear the system caches after the step)
+DAEMON_STEPS = {
+    'move-access-switches': ('apstra_bp_consolidation.move_access_switch', 'order_move_access_switches', False),
+    'move-generic-systems': ('apstra_bp_consolidation.move_generic_system', 'order_move_generic_systems', False),
+    'move-virtual-networks': ('apstra_bp_consolidation.move_vn', 'order_move_virtual_networks', False),
+    'move-cts': ('apstra_bp_consolidation.move_ct', 'order_move_cts', False),
+    # system_id and deploy_mode of the cached system nodes change
+    'move-devices': ('apstra_bp_consolidation.move_device', 'order_move_devices', True),
+    'find-missing-vns': ('apstra_bp_consolidation.find_missing_vn', 'order_find_missing_vn', False),
+    'collect-cabling-maps': ('apstra_bp_consolidation.consolidation', 'order_collect_cabling_maps', False),
+}
+MOVE_ALL_STEPS = ['move-access-switches', 'move-generic-systems', 'move-virtual-networks', 'move-cts', 'move-devices']
+# the env settings of the session. The session is created again when any of them changes
+SESSION_SETTINGS = ['apstra_server_host', 'apstra_server_port', 'apstra_server_username', 'apstra_server_password']
+
+
+def get_socket_file(env_file: str = None) -> str:
+    """
+    The unix socket file path from the env file (daemon_socket_file)
+    """
+    from dotenv import load_dotenv
+    load_dotenv(env_file or ENV_FILE)
+    return os.getenv('daemon_socket_file') or DEFAULT_SOCKET_FILE
+
+
+class SocketLogHandler(logging.Handler):
+    """
+    Relay the log records of a step to the client as json lines
+    """
+    def __init__(self, wfile, level=logging.INFO):
+        super().__init__(level)
+        self.wfile = wfile
+        self.setFormatter(logging.Formatter("%(asctime)s %(levelname)8s %(name)s:%(funcName)s() - %(message)s"))
+
+    def emit(self, record):
+        try:
+            self.wfile.write((json.dumps({'log': self.format(record)}) + '\n').encode())
+            self.wfile.flush()
+        except Exception:
+            # the client went away. keep running the step
+            pass
+
+
+class ConsolidationDaemon:
+    """
+    Keep the session, the blueprint objects and their caches warm between the steps
+
+    The order is rebuilt (reusing the session and the blueprint objects) when the env file or the config file changes.
+    The session and the blueprint objects are dropped too when the server or the credentials change
+    """
+    def __init__(self, env_file: str = None):
+        self.env_file = env_file or ENV_FILE
+        self.logger = logging.getLogger('ConsolidationDaemon')
+        self.session = None
+        self.session_settings = None
+        self.blueprint_cache = {}  # bp_label: CkApstraBlueprint
+        self.order = None
+        self.order_mtimes = None
+        self.started = time.time()
+
+    def _mtimes(self) -> tuple:
+        config_yaml_input_file = os.getenv('config_yaml_input_file')
+        return tuple(os.path.getmtime(x) if x and os.path.exists(x) else None for x in [self.env_file, config_yaml_input_file])
+
+    def get_order(self) -> ConsolidationOrder:
+        """
+        Return the warm order. Build it on the first call or when the input files changed
+        """
+        from dotenv import load_dotenv
+        load_dotenv(self.env_file, override=True)
+        mtimes = self._mtimes()
+        if self.order is None or mtimes != self.order_mtimes:
+            session_settings = tuple(os.getenv(x) for x in SESSION_SETTINGS)
+            if self.session is not None and session_settings != self.session_settings:
+                self.logger.info(f"the server settings changed in {self.env_file}. logging in again")
+                self.session = None
+                self.blueprint_cache.clear()
+            self.logger.info(f"building the order from {self.env_file}")
+            self.order = ConsolidationOrder(self.env_file, session=self.session, blueprint_cache=self.blueprint_cache)
+            self.session = self.order.session
+            self.session_settings = session_settings
+            self.order_mtimes = mtimes
+        return self.order
+
+    def reload(self) -> None:
+        """
+        Drop the blueprint objects and log in again
+        """
+        self.blueprint_cache.clear()
+        self.order = None
+        if self.session:
+            self.session.login()
+            self.session.device_profile_cache = {}
+
+    def status(self) -> dict:
+        return {
+            'uptime': int(time.time() - self.started),
+            'order': self.order and f"{self.order.main_bp.label}<-{self.order.tor_bp.label}",
+            'blueprints': {
+                label: {
+                    'id': bp.id,
+                    'system_label_2_id_cache': len(bp.system_label_2_id_cache),
+                }
+                for label, bp in self.blueprint_cache.items()
+            },
+            'device_profile_cache': self.session and len(self.session.device_profile_cache),
+        }
+
+    def run_step(self, step: str) -> None:
+        """
+        Run a step with the warm order
+        """
+        steps = MOVE_ALL_STEPS if step == 'move-all' else [step]
+        order = self.get_order()
+        for this_step in steps:
+            module_name, function_name, clear_system_cache = DAEMON_STEPS[this_step]
+            order_function = getattr(importlib.import_module(module_name), function_name)
+            begin = time.time()
+            order_function(order)
+            self.logger.info(f"{this_step} took {time.time() - begin:.1f} seconds")
+            if clear_system_cache:
+                order.main_bp.clear_system_cache()
+                order.tor_bp.clear_system_cache()
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    """
+    One json line request per connection: { "command": <step> | "status" | "reload" | "stop" }
+
+    The response is a stream of json lines { "log": <line> } ending with { "result": "ok" | "error", ... }
+    """
+    def write_json(self, data: dict) -> None:
+        self.wfile.write((json.dumps(data) + '\n').encode())
+        self.wfile.flush()
+
+    def handle(self):
+        daemon = self.server.daemon
+        begin = time.time()
+        try:
+            request = json.loads(self.rfile.readline())
+            command = request['command']
+        except Exception as e:
+            self.write_json({'result': 'error', 'error': f"invalid request: {e}"})
+            return
+        if command == 'status':
+            self.write_json({'result': 'ok', 'status': daemon.status()})
+            return
+        if command == 'reload':
+            daemon.reload()
+            self.write_json({'result': 'ok'})
+            return
+        if command == 'stop':
+            self.write_json({'result': 'ok'})
+            self.server.stop_requested = True
+            return
+        if command not in DAEMON_STEPS and command != 'move-all':
+            self.write_json({'result': 'error', 'error': f"unknown command {command}"})
+            return
+
+        log_handler = SocketLogHandler(self.wfile, logging.getLevelName(request.get('log_level', 'INFO')))
+        root = logging.getLogger()
+        root.addHandler(log_handler)
+        try:
+            daemon.run_step(command)
+            result = {'result': 'ok'}
+        except Exception as e:
+            daemon.logger.exception(f"{command} failed")
+            result = {'result': 'error', 'error': repr(e)}
+        finally:
+            root.removeHandler(log_handler)
+        result['elapsed'] = round(time.time() - begin, 3)
+        self.write_json(result)
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    # the steps share the order. Serve one request at a time
+    stop_requested = False
+    timeout = 1
+
+    def __init__(self, socket_file: str, daemon: ConsolidationDaemon):
+        self.daemon = daemon
+        super().__init__(socket_file, DaemonRequestHandler)
+
+
+def serve(socket_file: str, env_file: str = None) -> None:
+    """
+    Build the warm order and serve the step commands on the unix socket
+    """
+    daemon = ConsolidationDaemon(env_file)
+    daemon.get_order()
+    if os.path.exists(socket_file):
+        os.unlink(socket_file)
+    with DaemonServer(socket_file, daemon) as server:
+        os.chmod(socket_file, 0o600)
+        daemon.logger.info(f"listening on {socket_file}")
+        try:
+            while not server.stop_requested:
+                server.handle_request()
+        finally:
+            os.unlink(socket_file)
+    daemon.logger.info(f"stopped")
+
+
+def send_command(socket_file: str, command: str, log_level: str = 'INFO') -> dict:
+    """
+    Send a command to the daemon and print the relayed log lines
+
+    Return the last (result) line
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_file)
+        sock.sendall((json.dumps({'command': command, 'log_level': log_level}) + '\n').encode())
+        with sock.makefile('rb') as rfile:
+            for line in rfile:
+                response = json.loads(line)
+                if 'log' in response:
+                    click.echo(response['log'], err=True)
+                    continue
+                return response
+    return {'result': 'error', 'error': 'connection closed'}
+
+
+@click.group(name='daemon', help='keep the session and caches warm and run the steps over a unix socket')
+def click_daemon():
+    pass
+
+@click_daemon.command(name='start', help='start the daemon in the foreground')
+@click.option('--socket-file', default=None, help='the unix socket path (daemon_socket_file in the env file)')
+def click_daemon_start(socket_file):
+    serve(socket_file or get_socket_file())
+
+@click_daemon.command(name='send', help='run a step (or status, reload, stop) in the daemon')
+@click.argument('command', type=click.Choice(list(DAEMON_STEPS) + ['move-all', 'status', 'reload', 'stop']))
+@click.option('--socket-file', default=None, help='the unix socket path (daemon_socket_file in the env file)')
+@click.option('--log-level', default='INFO', help='the level of the relayed log lines')
+def click_daemon_send(command, socket_file, log_level):
+    response = send_command(socket_file or get_socket_file(), command, log_level)
+    if 'status' in response:
+        click.echo(json.dumps(response['status'], indent=2))
+    if response['result'] != 'ok':
+        raise click.ClickException(response.get('error', 'unknown error'))
+    if 'elapsed' in response:
+        click.echo(f"{command} done in {response['elapsed']} seconds", err=True)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+import time
+import logging
+
+DEFAULT_DEVICE_MOVE_TIMEOUT = 900  # seconds to confirm each of undeploy and deploy
+POLL_INITIAL_SECONDS = 2
+POLL_MAX_SECONDS = 30
+
+TASK_FAILED = ['failed', 'timeout']
+
+UNDEPLOY = 'undeploy'
+DEPLOY = 'deploy'
+
+
+class DeviceMove:
+    """
+    A device to undeploy from the TOR blueprint and deploy into the main blueprint
+
+    state: pending, undeploying, undeployed, deploying, deployed, skipped or failed
+    task_id: the async task of the current phase. None if the PATCH was not async
+    timings: { undeploy|deploy: <seconds from the PATCH to the confirmed state> }
+    """
+    __slots__ = ('label', 'tor_bp', 'main_bp', 'system_id', 'tor_node_id', 'main_node_id', 'state', 'error', 'task_id', 'sent_at', 'timings')
+
+    def __init__(self, label: str, tor_bp, main_bp) -> None:
+        self.label = label
+        self.tor_bp = tor_bp
+        self.main_bp = main_bp
+        self.system_id = None
+        self.tor_node_id = None
+        self.main_node_id = None
+        self.state = 'pending'
+        self.error = None
+        self.task_id = None
+        self.sent_at = None
+        self.timings = {}
+
+    def fail(self, error: str) -> None:
+        self.state = 'failed'
+        self.error = error
+
+    def __repr__(self) -> str:
+        return f"DeviceMove({self.label}, {self.state}, {self.system_id=}, {self.timings=})"
+
+
+def group_by_blueprint(moves: list, phase: str) -> dict:
+    """
+    { <blueprint label>: ( <blueprint>, [ DeviceMove ] ) } of the source (undeploy) or the target (deploy) blueprints
+    """
+    groups = {}
+    for move in moves:
+        the_bp = move.tor_bp if phase == UNDEPLOY else move.main_bp
+        groups.setdefault(the_bp.label, (the_bp, []))[1].append(move)
+    return groups
+
+
+def is_confirmed(move: DeviceMove, phase: str, system_node: dict) -> bool:
+    if system_node is None:
+        return False
+    if phase == UNDEPLOY:
+        return system_node.get('system_id') is None
+    return system_node.get('system_id') == move.system_id and system_node.get('deploy_mode') == 'deploy'
+
+
+class CkDeviceMoveEngine:
+    """
+    Move the devices of many switch pairs between the blueprints
+
+    Undeploy all the devices with one PATCH per TOR blueprint and wait for the confirmed undeploy.
+    Then deploy the undeployed ones with one PATCH per main blueprint and wait for the confirmed deploy.
+    Each poll takes one tasks listing and one system query per blueprint. The poll interval backs off
+    from POLL_INITIAL_SECONDS to POLL_MAX_SECONDS.
+    """
+
+    def __init__(self, timeout: int = DEFAULT_DEVICE_MOVE_TIMEOUT) -> None:
+        self.logger = logging.getLogger('CkDeviceMoveEngine')
+        self.timeout = timeout
+        self.moves = []
+
+    def add_pair(self, switch_label_pair: list, tor_bp, main_bp) -> None:
+        for label in switch_label_pair:
+            self.moves.append(DeviceMove(label, tor_bp, main_bp))
+
+    def prepare(self) -> None:
+        """
+        Read the system nodes of both sides with one query per blueprint. Skip the devices with nothing to move
+        """
+        for phase, node_id_attr in [(UNDEPLOY, 'tor_node_id'), (DEPLOY, 'main_node_id')]:
+            pending = [x for x in self.moves if x.state == 'pending']
+            for the_bp, moves in group_by_blueprint(pending, phase).values():
+                system_nodes = the_bp.get_system_nodes([x.label for x in moves])
+                for move in moves:
+                    system_node = system_nodes.get(move.label)
+                    if system_node is None:
+                        move.fail(f"absent in {the_bp.label}")
+                        continue
+                    setattr(move, node_id_attr, system_node['id'])
+                    if phase == UNDEPLOY:
+                        move.system_id = system_node.get('system_id')
+                    elif move.system_id is None:
+                        if system_node.get('system_id'):
+                            move.state = 'skipped'
+                            move.error = f"already deployed in {the_bp.label}"
+                        else:
+                            move.fail(f"no device assigned in {move.tor_bp.label}")
+
+    def send(self, phase: str) -> None:
+        """
+        PATCH the nodes of the phase with one request per blueprint
+        """
+        ready_state = 'pending' if phase == UNDEPLOY else 'undeployed'
+        ready_moves = [x for x in self.moves if x.state == ready_state]
+        for the_bp, moves in group_by_blueprint(ready_moves, phase).values():
+            if phase == UNDEPLOY:
+                patch_spec = [{'id': x.tor_node_id, 'system_id': None, 'deploy_mode': None} for x in moves]
+            else:
+                patch_spec = [{'id': x.main_node_id, 'system_id': x.system_id, 'deploy_mode': 'deploy'} for x in moves]
+            sent_at = time.monotonic()
+            patched = the_bp.patch_nodes(patch_spec)
+            if patched.status_code >= 400:
+                for move in moves:
+                    move.fail(f"{phase} PATCH {patched.status_code} {patched.text}")
+                continue
+            task_id = patched.json().get('task_id') if patched.status_code == 202 else None
+            self.logger.info(f"{phase} {[x.label for x in moves]} in {the_bp.label} {task_id=}")
+            for move in moves:
+                move.state = f"{phase}ing"
+                move.task_id = task_id
+                move.sent_at = sent_at
+
+    def poll(self, phase: str) -> int:
+        """
+        Update the moves of the phase by the task status and the system nodes
+        A task not found is confirmed by the system node only
+
+        Return: the number of the moves still in progress
+        """
+        in_progress = [x for x in self.moves if x.state == f"{phase}ing"]
+        for the_bp, moves in group_by_blueprint(in_progress, phase).values():
+            task_ids = {x.task_id for x in moves if x.task_id}
+            task_status = the_bp.get_task_status(task_ids) if task_ids else {}
+            task_done = []
+            for move in moves:
+                status = task_status.get(move.task_id) if move.task_id else 'succeeded'
+                if status in TASK_FAILED:
+                    move.fail(f"{phase} task {move.task_id} {status}")
+                elif status in ['succeeded', None]:
+                    # a task not found (expired or never listed) falls back to the system node
+                    task_done.append(move)
+            if not task_done:
+                continue
+            system_nodes = the_bp.get_system_nodes([x.label for x in task_done])
+            for move in task_done:
+                if is_confirmed(move, phase, system_nodes.get(move.label)):
+                    move.state = f"{phase}ed"
+                    move.timings[phase] = time.monotonic() - move.sent_at
+                    self.logger.info(f"{move.label} {phase}ed in {the_bp.label} in {move.timings[phase]:.1f} seconds")
+        return len([x for x in self.moves if x.state == f"{phase}ing"])
+
+    def wait(self, phase: str) -> None:
+        """
+        Poll with the backoff until all the moves of the phase are confirmed, failed or timed out
+        """
+        deadline = time.monotonic() + self.timeout
+        interval = POLL_INITIAL_SECONDS
+        while self.poll(phase):
+            if time.monotonic() > deadline:
+                for move in self.moves:
+                    if move.state == f"{phase}ing":
+                        move.fail(f"{phase} not confirmed in {self.timeout} seconds")
+                return
+            time.sleep(interval)
+            interval = min(interval * 2, POLL_MAX_SECONDS)
+
+    def run(self) -> list:
+        """
+        Undeploy, confirm, deploy and confirm. The devices failed to undeploy are not deployed
+
+        Return: the DeviceMove list
+        """
+        self.prepare()
+        for phase in [UNDEPLOY, DEPLOY]:
+            self.send(phase)
+            self.wait(phase)
+        self.report()
+        return self.moves
+
+    def report(self) -> None:
+        for move in self.moves:
+            timings = ' '.join(f"{phase}={seconds:.1f}s" for phase, seconds in move.timings.items())
+            log = self.logger.error if move.state == 'failed' else self.logger.info
+            log(f"{move.label} {move.state} {timings} {move.error or ''}")
+        states = {}
+        for move in self.moves:
+            states[move.state] = states.get(move.state, 0) + 1
+        self.logger.info(f"{len(self.moves)} devices: {states}")
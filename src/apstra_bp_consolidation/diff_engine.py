@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import hashlib
+
+from apstra_bp_consolidation.vlan_set import VlanSet
+
+ADDED = 'added'        # present in <B>, absent in <A>
+REMOVED = 'removed'    # present in <A>, absent in <B>
+CHANGED = 'changed'    # different values at the same path
+
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def _digest(*parts: bytes) -> bytes:
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(part)
+    return hasher.digest()
+
+
+class MerkleNode:
+    """
+    A canonical subtree with the digest of its content. The digest of a scalar leaf is the typed repr
+
+    children: { <key>: MerkleNode } of a dict or a slotted model, [ MerkleNode ] of a list, None of a leaf
+    value: the original value of a leaf. The list of the scalars is a leaf expanded only when compared
+    The list digest does not depend on the item order, the same as deep_diff sorting the items.
+    """
+    __slots__ = ('digest', 'children', 'value')
+
+    def __init__(self, digest: bytes, children=None, value=None) -> None:
+        self.digest = digest
+        self.children = children
+        self.value = value
+
+
+def _scalar_digest(value) -> bytes:
+    # a scalar is its own digest. No hashing per leaf
+    return f"{type(value).__name__}:{value!r}".encode()
+
+
+def build_tree(value) -> MerkleNode:
+    """
+    Canonicalise and hash the value bottom up. Each subtree is hashed once
+
+    dict, list, tuple, set, VlanSet, the slotted models (InterfaceVlans, GsLink) and the scalars
+    """
+    if isinstance(value, dict):
+        children = {key: build_tree(item) for key, item in value.items()}
+        return MerkleNode(_digest(b'd', *(_digest(str(key).encode(), children[key].digest) for key in sorted(children, key=str))), children)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        if all(isinstance(x, SCALAR_TYPES) for x in value):
+            # like the tagged vlan list. no node per item
+            return MerkleNode(_digest(b'l', *sorted(_scalar_digest(x) for x in value)), value=list(value))
+        children = [build_tree(item) for item in value]
+        return MerkleNode(_digest(b'l', *sorted(x.digest for x in children)), children)
+    if isinstance(value, VlanSet):
+        return MerkleNode(_digest(b'v', str(value.bits).encode()), value=value)
+    slots = getattr(type(value), '__slots__', None)
+    if slots:
+        return build_tree({key: getattr(value, key) for key in slots if getattr(value, key) is not None})
+    return MerkleNode(_scalar_digest(value), value=value)
+
+
+class DiffRecord:
+    """
+    A difference between <A> and <B>
+
+    kind: ADDED, REMOVED or CHANGED
+    path: ( <dict key or list index> ) from the root
+    a, b: the values in <A> and <B>. None on the absent side
+    The message is formatted only when printed.
+    """
+    __slots__ = ('kind', 'path', 'a', 'b')
+
+    def __init__(self, kind: str, path: tuple, a=None, b=None) -> None:
+        self.kind = kind
+        self.path = path
+        self.a = a
+        self.b = b
+
+    @property
+    def path_str(self) -> str:
+        return ''.join(f"[{x}]" if isinstance(x, int) else f"/{x}" for x in self.path).lstrip('/')
+
+    def __str__(self) -> str:
+        if self.kind == ADDED:
+            return f"'{self.path_str}' present in <B>, but not in <A>: {self.b}"
+        if self.kind == REMOVED:
+            return f"'{self.path_str}' present in <A>, but not in <B>: {self.a}"
+        if isinstance(self.a, VlanSet) and isinstance(self.b, VlanSet):
+            return f"Different VLANs at '{self.path_str}': <B> has +{self.b - self.a} -{self.a - self.b}"
+        return f"Different values at '{self.path_str}': <A> has '{self.a}' vs <B> has '{self.b}'"
+
+    def __repr__(self) -> str:
+        return f"DiffRecord({self.kind}, {self.path}, {self.a!r}, {self.b!r})"
+
+
+def _original(node: MerkleNode):
+    """
+    The value of a leaf. A subtree is reported by its digest only
+    """
+    return node.value if node.children is None else f"<{node.digest.hex()[:8]}>"
+
+
+def _list_children(node: MerkleNode):
+    """
+    The item nodes of a list. None if not a list
+    """
+    if isinstance(node.children, list):
+        return node.children
+    if node.children is None and isinstance(node.value, list):
+        return [MerkleNode(_scalar_digest(x), value=x) for x in node.value]
+    return None
+
+
+def iter_tree_diff(node_a: MerkleNode, node_b: MerkleNode, path: tuple = ()):
+    """
+    Yield DiffRecord of the two trees. The subtrees of the same digest are skipped without descending
+
+    The list items are paired by the digest first. The rest are paired in the original order
+    and the leftovers are added or removed.
+    """
+    if node_a.digest == node_b.digest:
+        return
+    if isinstance(node_a.children, dict) and isinstance(node_b.children, dict):
+        for key, child_a in node_a.children.items():
+            if key not in node_b.children:
+                yield DiffRecord(REMOVED, path + (key,), a=_original(child_a))
+            else:
+                yield from iter_tree_diff(child_a, node_b.children[key], path + (key,))
+        for key, child_b in node_b.children.items():
+            if key not in node_a.children:
+                yield DiffRecord(ADDED, path + (key,), b=_original(child_b))
+        return
+    children_a = _list_children(node_a)
+    children_b = _list_children(node_b)
+    if children_a is not None and children_b is not None:
+        unmatched_b = {}  # { digest: [ ( index, MerkleNode ) ] }
+        for index, child_b in enumerate(children_b):
+            unmatched_b.setdefault(child_b.digest, []).append((index, child_b))
+        rest_a = []
+        for index, child_a in enumerate(children_a):
+            if unmatched_b.get(child_a.digest):
+                unmatched_b[child_a.digest].pop()
+            else:
+                rest_a.append((index, child_a))
+        rest_b = sorted(x for same_digest in unmatched_b.values() for x in same_digest)
+        for (index, child_a), (_, child_b) in zip(rest_a, rest_b):
+            yield from iter_tree_diff(child_a, child_b, path + (index,))
+        for index, child_a in rest_a[len(rest_b):]:
+            yield DiffRecord(REMOVED, path + (index,), a=_original(child_a))
+        for index, child_b in rest_b[len(rest_a):]:
+            yield DiffRecord(ADDED, path + (index,), b=_original(child_b))
+    else:
+        yield DiffRecord(CHANGED, path, a=_original(node_a), b=_original(node_b))
+
+
+def iter_diff(value_a, value_b, path: tuple = ()):
+    """
+    Yield DiffRecord of the two values lazily. See build_tree for the supported types
+    """
+    yield from iter_tree_diff(build_tree(value_a), build_tree(value_b), path)
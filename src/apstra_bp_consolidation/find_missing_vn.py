@@ -1,8 +1,8 @@
 import click
 import logging
 
-from apstra_bp_consolidation.apstra_blueprint import CkApstraBlueprint
 from apstra_bp_consolidation.consolidation import ConsolidationOrder
+from apstra_bp_consolidation.vni_index import CkVniIndex
 
 
 @click.command(name='find-missing-vns', help='find the virtual networks absent in main blueprint but present in tor blueprints')
@@ -10,35 +10,29 @@ def find_missing_vn():
     order = ConsolidationOrder()
     order_find_missing_vn(order)
 
-def order_find_missing_vn(order):
+def order_find_missing_vn(order, refresh: bool = True):
     logging.info(f"======== Finding Missing VN from {order.main_bp.label}")
 
-    VN_ID = 'virtual_network'
-    main_vni_list = []
-    all_vn_query = f"node('{VN_ID}', name='{VN_ID}')"
-    main_vn_nodes = order.main_bp.query(all_vn_query)
-    for vn_node in main_vn_nodes:
-        # logging.debug(f"{vn_node=}")
-        vni = vn_node[VN_ID]['vn_id']
-        vni in main_vni_list or main_vni_list.append(vni)
-    logging.info(f"{len(main_vni_list)=}")
-
-    bp_list = order.session.list_blueprint_ids()
-    logging.debug(f"{bp_list=}")
-    for bp_id in bp_list:
-        this_bp = CkApstraBlueprint(order.session, None, bp_id)
-        logging.debug(f"checking BP {this_bp.label}")
-        this_vni_nodes = this_bp.query(all_vn_query)
-        missing_vns = []
-        for vn_node in this_vni_nodes:
-            vni = vn_node[VN_ID]['vn_id']
-            if vni not in main_vni_list:
-                missing_vns.append(vni) 
-        if len(missing_vns) > 0:
-            logging.warning(f"BP {this_bp.label} {len(missing_vns)=} {missing_vns=}")
-
-
-
+    # the index pulls only the blueprints changed since the previous run
+    vni_index = CkVniIndex(order.vni_index_file)
+    if refresh or not vni_index.has_blueprint(order.main_bp.label):
+        vni_index.refresh(order.session, order.max_workers)
+    logging.info(f"{len(vni_index.get_vnis(order.main_bp.label))=}")
 
+    for bp_label, missing_vns in vni_index.find_missing_vns(order.main_bp.label).items():
+        logging.warning(f"BP {bp_label} {len(missing_vns)=} {missing_vns=}")
 
 
+@click.command(name='vni-index', help='refresh the cross-blueprint vni index and look up the blueprints having the vnis')
+@click.option('--vni', 'vni_list', multiple=True, type=int, help='the vni to look up. can be repeated')
+@click.option('--no-refresh', is_flag=True, help='use the index file as is')
+def click_vni_index(vni_list, no_refresh):
+    order = ConsolidationOrder()
+    vni_index = CkVniIndex(order.vni_index_file)
+    if not no_refresh:
+        vni_index.refresh(order.session, order.max_workers)
+    for vni in vni_list:
+        bp_vn_ids = vni_index.lookup(vni)
+        click.echo(f"{vni}: {', '.join(sorted(bp_vn_ids)) or 'absent'}")
+        for bp_label, vn_ids in sorted(bp_vn_ids.items()):
+            logging.debug(f"{vni=} {bp_label=} {vn_ids=}")
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+DEFAULT_MAX_WORKERS = 8
+_END = object()
+
+
+def map_concurrently(function, items: list, max_workers: int = DEFAULT_MAX_WORKERS):
+    """
+    Run function(item) on the worker threads and yield (item, result, exception) as they complete
+
+    At most 2 x max_workers results are in flight so that the caller can stream them out
+    """
+    items_iter = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}  # future: item
+        for item in items_iter:
+            in_flight[executor.submit(function, item)] = item
+            if len(in_flight) >= max_workers * 2:
+                break
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                exception = future.exception()
+                if exception is not None:
+                    logging.warning(f"{item=} failed: {exception!r}")
+                yield item, (None if exception else future.result()), exception
+                next_item = next(items_iter, _END)
+                if next_item is not _END:
+                    in_flight[executor.submit(function, next_item)] = next_item
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+import time
+import sqlite3
+import logging
+import click
+
+from apstra_bp_consolidation.consolidation import ConsolidationOrder
+from apstra_bp_consolidation.apstra_blueprint import CkApstraBlueprint
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.fleet import map_concurrently, DEFAULT_MAX_WORKERS
+
+DEFAULT_INVENTORY_DB_FILE = 'inventory.sqlite3'
+
+INVENTORY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS blueprints (
+        id TEXT PRIMARY KEY, label TEXT, version INTEGER, refreshed_at REAL);
+    CREATE TABLE IF NOT EXISTS systems (
+        bp_id TEXT, id TEXT, label TEXT, hostname TEXT, system_type TEXT, role TEXT, system_id TEXT, deploy_mode TEXT);
+    CREATE INDEX IF NOT EXISTS systems_label ON systems (label);
+    CREATE INDEX IF NOT EXISTS systems_bp_id ON systems (bp_id);
+    CREATE VIEW IF NOT EXISTS generic_systems AS
+        SELECT * FROM systems WHERE system_type = 'server';
+    CREATE TABLE IF NOT EXISTS links (
+        bp_id TEXT, link_id TEXT, speed TEXT, switch_label TEXT, switch_if_name TEXT,
+        gs_label TEXT, gs_if_name TEXT, evpn_interface_id TEXT);
+    CREATE INDEX IF NOT EXISTS links_gs_label ON links (gs_label);
+    CREATE INDEX IF NOT EXISTS links_switch ON links (switch_label, switch_if_name);
+    CREATE INDEX IF NOT EXISTS links_bp_id ON links (bp_id);
+    CREATE TABLE IF NOT EXISTS link_tags (
+        bp_id TEXT, link_id TEXT, tag TEXT);
+    CREATE INDEX IF NOT EXISTS link_tags_link_id ON link_tags (link_id);
+    CREATE INDEX IF NOT EXISTS link_tags_bp_id ON link_tags (bp_id);
+    CREATE TABLE IF NOT EXISTS vns (
+        bp_id TEXT, id TEXT, vni INTEGER, label TEXT);
+    CREATE INDEX IF NOT EXISTS vns_vni ON vns (vni);
+    CREATE INDEX IF NOT EXISTS vns_bp_id ON vns (bp_id);
+    CREATE TABLE IF NOT EXISTS vn_instances (
+        bp_id TEXT, vni INTEGER, system_label TEXT);
+    CREATE INDEX IF NOT EXISTS vn_instances_vni ON vn_instances (vni);
+    CREATE INDEX IF NOT EXISTS vn_instances_system_label ON vn_instances (system_label);
+    CREATE INDEX IF NOT EXISTS vn_instances_bp_id ON vn_instances (bp_id);
+    CREATE TABLE IF NOT EXISTS ct_assignments (
+        bp_id TEXT, interface_id TEXT, host_label TEXT, if_name TEXT, ct_id TEXT, ct_label TEXT);
+    CREATE INDEX IF NOT EXISTS ct_assignments_interface_id ON ct_assignments (interface_id);
+    CREATE INDEX IF NOT EXISTS ct_assignments_host ON ct_assignments (host_label, if_name);
+    CREATE INDEX IF NOT EXISTS ct_assignments_bp_id ON ct_assignments (bp_id);
+"""
+
+# the tables keyed by bp_id
+INVENTORY_TABLES = ['systems', 'links', 'link_tags', 'vns', 'vn_instances', 'ct_assignments']
+
+
+def pull_blueprint_inventory(the_bp) -> dict:
+    """
+    Pull the inventory rows of a blueprint
+
+    Return: { <table>: [ <row tuple without bp_id> ] }
+    """
+    rows = {x: [] for x in INVENTORY_TABLES}
+
+    for nodes in the_bp.query("node('system', name='system')"):
+        system = nodes['system']
+        rows['systems'].append((
+            system['id'], system['label'], system.get('hostname'), system.get('system_type'),
+            system.get('role'), system.get('system_id'), system.get('deploy_mode')))
+
+    link_query = f"""
+        match(
+            node('system', system_type='server', name='{CkEnum.GENERIC_SYSTEM}')
+                .out('hosted_interfaces').node('interface', name='{CkEnum.GENERIC_SYSTEM_INTERFACE}')
+                .out('link').node('link', name='{CkEnum.LINK}')
+                .in_('link').node('interface', name='{CkEnum.MEMBER_INTERFACE}')
+                .in_('hosted_interfaces').node('system', system_type='switch', name='{CkEnum.MEMBER_SWITCH}'),
+            optional(
+                node('interface', po_control_protocol='evpn', name='{CkEnum.EVPN_INTERFACE}')
+                    .out('composed_of').node('interface')
+                    .out('composed_of').node(name='{CkEnum.MEMBER_INTERFACE}')
+            )
+        )
+    """
+    for nodes in the_bp.query(link_query, multiline=True):
+        evpn_interface = nodes[CkEnum.EVPN_INTERFACE]
+        rows['links'].append((
+            nodes[CkEnum.LINK]['id'], nodes[CkEnum.LINK].get('speed'),
+            nodes[CkEnum.MEMBER_SWITCH]['label'], nodes[CkEnum.MEMBER_INTERFACE]['if_name'],
+            nodes[CkEnum.GENERIC_SYSTEM]['label'], nodes[CkEnum.GENERIC_SYSTEM_INTERFACE]['if_name'],
+            evpn_interface and evpn_interface['id']))
+
+    for nodes in the_bp.query(f"node('tag', name='{CkEnum.TAG}').out().node('link', name='{CkEnum.LINK}')"):
+        rows['link_tags'].append((nodes[CkEnum.LINK]['id'], nodes[CkEnum.TAG]['label']))
+
+    # the VLAN type VNs have no vn_id
+    for nodes in the_bp.query("node('virtual_network', vn_type='vxlan', name='vn')"):
+        rows['vns'].append((nodes['vn']['id'], int(nodes['vn']['vn_id']), nodes['vn']['label']))
+
+    vn_instance_query = """
+        match(
+            node('system', name='system')
+                .out().node('vn_instance')
+                .out().node('virtual_network', vn_type='vxlan', name='vn')
+        ).distinct(['system', 'vn'])
+    """
+    for nodes in the_bp.query(vn_instance_query, multiline=True):
+        rows['vn_instances'].append((int(nodes['vn']['vn_id']), nodes['system']['label']))
+
+    # the AE interfaces are hosted by the redundancy group
+    ct_query = """
+        match(
+            node('ep_endpoint_policy', policy_type_name='batch', name='ct')
+                .in_().node('ep_application_instance')
+                .out('ep_affected_by').node('ep_group')
+                .in_('ep_member_of').node('interface', name='interface'),
+            optional(
+                node(name='interface')
+                    .in_('hosted_interfaces').node(name='host')
+            )
+        ).distinct(['ct', 'interface'])
+    """
+    for nodes in the_bp.query(ct_query, multiline=True):
+        host = nodes['host']
+        rows['ct_assignments'].append((
+            nodes['interface']['id'], host and host.get('label'), nodes['interface'].get('if_name'),
+            nodes['ct']['id'], nodes['ct']['label']))
+
+    return rows
+
+
+class CkInventory:
+    """
+    Local SQLite snapshot of the systems, generic systems, links, VNs and CT assignments of all the blueprints
+
+    Only the blueprints whose version changed are pulled again on refresh
+    """
+
+    def __init__(self, db_file: str = None) -> None:
+        self.db_file = db_file or DEFAULT_INVENTORY_DB_FILE
+        self.logger = logging.getLogger('CkInventory')
+        self.connection = sqlite3.connect(self.db_file)
+        self.connection.executescript(INVENTORY_SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def refresh(self, session, max_workers: int = DEFAULT_MAX_WORKERS) -> int:
+        """
+        Pull the new or changed blueprints concurrently and replace their rows
+
+        Return: the number of the blueprints pulled
+        """
+        bp_directory = session.blueprint_directory
+        bp_directory.refresh()
+        bp_id_list = bp_directory.list_ids()
+        known_versions = dict(self.connection.execute("SELECT id, version FROM blueprints"))
+
+        with self.connection:
+            for bp_id in [x for x in known_versions if x not in bp_id_list]:
+                self._delete_blueprint(bp_id)
+        bp_ids_to_pull = [
+            x for x in bp_id_list
+            if x not in known_versions or known_versions[x] is None or known_versions[x] != bp_directory.get_version(x)
+            ]
+        self.logger.info(f"{len(bp_id_list)=} {len(bp_ids_to_pull)=}")
+
+        def pull_rows(bp_id):
+            return pull_blueprint_inventory(CkApstraBlueprint(session, None, bp_id))
+
+        # sqlite connection stays in this thread. the workers only pull
+        for bp_id, rows, exception in map_concurrently(pull_rows, bp_ids_to_pull, max_workers):
+            if exception is not None:
+                continue
+            with self.connection:
+                self._delete_blueprint(bp_id)
+                self.connection.execute(
+                    "INSERT INTO blueprints VALUES (?, ?, ?, ?)",
+                    (bp_id, bp_directory.get_label(bp_id), bp_directory.get_version(bp_id), time.time()))
+                for table, table_rows in rows.items():
+                    if not table_rows:
+                        continue
+                    placeholders = ', '.join(['?'] * (len(table_rows[0]) + 1))
+                    self.connection.executemany(
+                        f"INSERT INTO {table} VALUES ({placeholders})",
+                        [(bp_id,) + x for x in table_rows])
+        return len(bp_ids_to_pull)
+
+    def _delete_blueprint(self, bp_id: str) -> None:
+        self.connection.execute("DELETE FROM blueprints WHERE id = ?", (bp_id,))
+        for table in INVENTORY_TABLES:
+            self.connection.execute(f"DELETE FROM {table} WHERE bp_id = ?", (bp_id,))
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        """
+        Run the sql and return the rows as dicts
+        """
+        cursor = self.connection.execute(sql, params)
+        columns = [x[0] for x in cursor.description]
+        return [dict(zip(columns, x)) for x in cursor.fetchall()]
+
+    def where_connected(self, gs_label: str) -> list:
+        """
+        The switch interfaces of the generic system in each blueprint
+        """
+        return self.query("""
+            SELECT b.label AS blueprint, l.gs_label, l.gs_if_name, l.switch_label, l.switch_if_name, l.speed, l.evpn_interface_id
+            FROM links l JOIN blueprints b ON b.id = l.bp_id
+            WHERE l.gs_label = ? ORDER BY b.label, l.switch_label, l.switch_if_name""", (gs_label,))
+
+    def systems_with_vni(self, vni: int) -> list:
+        """
+        The systems having the vni in each blueprint
+        """
+        return self.query("""
+            SELECT b.label AS blueprint, i.system_label, i.vni
+            FROM vn_instances i JOIN blueprints b ON b.id = i.bp_id
+            WHERE i.vni = ? ORDER BY b.label, i.system_label""", (vni,))
+
+    def blueprints_with_generic_system(self, gs_label: str) -> list:
+        """
+        The blueprints carrying the generic system
+        """
+        return self.query("""
+            SELECT b.label AS blueprint, g.id, g.label
+            FROM generic_systems g JOIN blueprints b ON b.id = g.bp_id
+            WHERE g.label = ? ORDER BY b.label""", (gs_label,))
+
+
+def print_rows(rows: list) -> None:
+    if not rows:
+        click.echo("no match")
+        return
+    click.echo('\t'.join(rows[0].keys()))
+    for row in rows:
+        click.echo('\t'.join(str(x) for x in row.values()))
+
+
+@click.command(name='inventory', help='refresh the local SQLite inventory of all the blueprints and query it')
+@click.option('--no-refresh', is_flag=True, help='query the inventory file as is')
+@click.option('--server', help='where the generic system is connected')
+@click.option('--vni', type=int, help='which systems have the vni')
+@click.option('--generic-system', help='which blueprints carry the generic system')
+@click.option('--sql', help='run the sql on the inventory')
+def click_inventory(no_refresh, server, vni, generic_system, sql):
+    order = ConsolidationOrder()
+    inventory = CkInventory(order.inventory_db_file)
+    if not no_refresh:
+        inventory.refresh(order.session, order.max_workers)
+    if server:
+        print_rows(inventory.where_connected(server))
+    if vni:
+        print_rows(inventory.systems_with_vni(vni))
+    if generic_system:
+        print_rows(inventory.blueprints_with_generic_system(generic_system))
+    if sql:
+        print_rows(inventory.query(sql))
+    inventory.close()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import atexit
+import logging
+import threading
+from urllib.parse import urlparse
+
+
+def classify_request(method: str, url: str) -> str:
+    """
+    The kind of the API call without the ids, like 'PATCH nodes' or 'PUT design/logical-devices'
+    """
+    segments = [x for x in urlparse(url).path.split('/') if x]
+    if segments and segments[0] == 'api':
+        segments = segments[1:]
+    if len(segments) >= 3 and segments[0] == 'blueprints':
+        # blueprints/<id>/<resource>/...
+        return f"{method} {segments[2]}"
+    return f"{method} {'/'.join(segments[:2])}"
+
+
+class CkLatencyStats:
+    """
+    The response time of the API calls by kind, kept across the runs in a json file
+
+    <kind>: { count: <calls>, total: <seconds>, max: <seconds> }
+    The responses of the session are recorded by the hook and the file is written at exit
+    """
+
+    def __init__(self, file: str = None) -> None:
+        self.file = file
+        self.logger = logging.getLogger('CkLatencyStats')
+        self.lock = threading.Lock()
+        self.kinds = {}
+        if file and os.path.exists(file):
+            with open(file, 'r') as f:
+                self.kinds = json.load(f)
+
+    def record(self, kind: str, seconds: float) -> None:
+        with self.lock:
+            stats = self.kinds.setdefault(kind, {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+
+    def hook(self, response, *args, **kwargs):
+        self.record(classify_request(response.request.method, response.url), response.elapsed.total_seconds())
+
+    def mean(self, kind: str, default: float = None):
+        """
+        The mean seconds of the kind. default if not recorded
+        """
+        stats = self.kinds.get(kind)
+        if not stats or not stats['count']:
+            return default
+        return stats['total'] / stats['count']
+
+    def save(self) -> None:
+        if not self.file:
+            return
+        with self.lock:
+            with open(self.file, 'w') as f:
+                json.dump(self.kinds, f, indent=2, sort_keys=True)
+        self.logger.debug(f"saved {len(self.kinds)} kinds to {self.file}")
+
+
+def get_latency_stats(session, file: str = None) -> CkLatencyStats:
+    """
+    Record the responses of the session once. The orders sharing the session share the statistics
+
+    Nothing is recorded without the file. The statistics are empty then
+    """
+    if getattr(session, 'latency_stats', None) is None:
+        latency_stats = CkLatencyStats(file)
+        if file:
+            session.session.hooks['response'].append(latency_stats.hook)
+            atexit.register(latency_stats.save)
+        session.latency_stats = latency_stats
+    return session.latency_stats
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import logging
+
+
+def get_logical_device_id(speed: str, port_count: int) -> str:
+    return f"auto-{speed}x{port_count}"
+
+
+def build_logical_device(speed: str, port_count: int) -> dict:
+    """
+    The logical device of port_count ports of the speed like 10G
+    """
+    return {
+        'display_name': get_logical_device_id(speed, port_count),
+        'id': get_logical_device_id(speed, port_count),
+        'panels': [
+            {
+                'panel_layout': {
+                    'row_count': 1,
+                    'column_count': port_count,
+                },
+                'port_indexing': {
+                    'order': 'T-B, L-R',
+                    'start_index': 1,
+                    'schema': 'absolute'
+                },
+                'port_groups': [
+                    {
+                        'count': port_count,
+                        'speed': {
+                            'unit': speed[-1:],
+                            'value': int(speed[:-1])
+                        },
+                        'roles': [
+                            'leaf',
+                            'access'
+                        ]
+                    }
+                ]
+            }
+        ]
+    }
+
+
+def get_shapes(generic_system_data: dict) -> set:
+    """
+    The (speed, port count) shapes of the generic systems. The speed of the last link as in the new system spec
+
+    Args:
+        generic_system_data: { <generic system label>: { <link id>: GsLink } }
+    """
+    return {(list(x.values())[-1].speed, len(x)) for x in generic_system_data.values() if x}
+
+
+def get_panel_signature(logical_device: dict) -> list:
+    """
+    The panel definition of the logical device without the fields the catalog adds, like the timestamps
+    """
+    return [
+        {
+            'panel_layout': panel.get('panel_layout'),
+            'port_indexing': panel.get('port_indexing'),
+            'port_groups': [
+                {'count': x.get('count'), 'speed': x.get('speed'), 'roles': sorted(x.get('roles', []))}
+                for x in panel.get('port_groups', [])
+            ],
+        }
+        for panel in logical_device.get('panels', [])
+    ]
+
+
+class CkLogicalDeviceShapes:
+    """
+    The (speed, port count) shapes of the generic systems as logical devices in the design catalog
+
+    Each shape is created once in the catalog and referenced by logical_device_id from the new system specs.
+    A catalog object of the same id with another panel definition is not reused.
+    The shapes failed to create or mismatched fall back to the inline logical_device.
+    """
+
+    def __init__(self, session) -> None:
+        self.session = session
+        self.logger = logging.getLogger('CkLogicalDeviceShapes')
+        self.catalog = None  # { <logical device id>: <logical device> } of the design catalog
+        self.catalog_ids = set()  # the logical device ids to reference - created or matching the shape
+
+    def load_catalog(self) -> None:
+        if self.catalog is None:
+            self.catalog = {x['id']: x for x in self.session.get_items('design/logical-devices').get('items', [])}
+
+    def get_missing(self, shapes: set) -> list:
+        """
+        The shapes absent in the catalog. The catalog is listed on the first call
+        """
+        self.load_catalog()
+        return sorted(x for x in shapes if get_logical_device_id(*x) not in self.catalog)
+
+    def ensure(self, shapes: set) -> None:
+        """
+        Create the logical devices of the shapes absent in the catalog, and check the present ones
+
+        Args:
+            shapes: { ( <speed>, <port count> ) }
+        """
+        missing = self.get_missing(shapes)
+        self.logger.info(f"{len(shapes)} shapes, {len(missing)} to create")
+        for speed, port_count in sorted(shapes):
+            ld_id = get_logical_device_id(speed, port_count)
+            logical_device = build_logical_device(speed, port_count)
+            if ld_id in self.catalog:
+                if get_panel_signature(self.catalog[ld_id]) != get_panel_signature(logical_device):
+                    self.logger.warning(f"{ld_id} in the catalog has another panel definition, using inline")
+                    continue
+                self.catalog_ids.add(ld_id)
+                continue
+            created = self.session.session.put(f"{self.session.url_prefix}/design/logical-devices/{ld_id}", json=logical_device)
+            if created.status_code >= 400:
+                self.logger.warning(f"failed to create {ld_id}, using inline: {created.status_code} {created.text}")
+                continue
+            self.catalog[ld_id] = logical_device
+            self.catalog_ids.add(ld_id)
+
+    def get_spec(self, speed: str, port_count: int) -> dict:
+        """
+        The logical device part of the new system spec
+        """
+        ld_id = get_logical_device_id(speed, port_count)
+        if ld_id in self.catalog_ids:
+            return {'logical_device_id': ld_id}
+        return {'logical_device': build_logical_device(speed, port_count)}
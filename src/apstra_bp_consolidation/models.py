@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import sys
+
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.vlan_set import VlanSet
+
+
+def intern(value):
+    """
+    Intern the string so that the same id or label is stored once across the rows
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class InterfaceVlans:
+    """
+    The VLAN assignment of an interface in interface_vlan_table
+
+    id: the interface id of a standalone interface
+    tagged_vlans: VlanSet
+    untagged_vlan: <vlan id> or None
+    member_interfaces: { <system_label>: [ <member if_name> ] } of an AE. None for a standalone interface
+    """
+    __slots__ = ('id', 'tagged_vlans', 'untagged_vlan', 'member_interfaces')
+
+    def __init__(self, id: str = None, member_interfaces: dict = None) -> None:
+        self.id = intern(id)
+        self.tagged_vlans = VlanSet()
+        self.untagged_vlan = None
+        self.member_interfaces = member_interfaces
+
+    def add_vlan(self, vlan_id: int, is_tagged: bool) -> None:
+        if is_tagged:
+            self.tagged_vlans.add(vlan_id)
+        else:
+            self.untagged_vlan = vlan_id
+
+    def add_member_interface(self, system_label: str, if_name: str) -> None:
+        this_system_members = self.member_interfaces.setdefault(intern(system_label), [])
+        if if_name not in this_system_members:
+            this_system_members.append(intern(if_name))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, InterfaceVlans):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def to_dict(self) -> dict:
+        """
+        The dict in the CkEnum keys as printed by pretty_yaml
+        """
+        data = {
+            CkEnum.TAGGED_VLANS: list(self.tagged_vlans),
+            CkEnum.UNTAGGED_VLAN: self.untagged_vlan,
+        }
+        if self.id is not None:
+            data['id'] = self.id
+        if self.member_interfaces is not None:
+            data[CkEnum.MEMBER_INTERFACE] = self.member_interfaces
+        return data
+
+    def __repr__(self) -> str:
+        return f"InterfaceVlans({self.to_dict()})"
+
+
+class GsLink:
+    """
+    A link of a generic system in generic_systems_data
+
+    link_id: the link id in the TOR blueprint
+    sw_label, sw_if_name: the switch side of the link
+    speed: like 10G
+    aggregate_link: the EVPN interface id in the TOR blueprint or None
+    tags: [ <tag label> ]
+    """
+    __slots__ = ('link_id', 'sw_label', 'sw_if_name', 'speed', 'aggregate_link', 'tags')
+
+    def __init__(self, link_id: str, sw_label: str, sw_if_name: str, speed: str, aggregate_link: str = None) -> None:
+        self.link_id = intern(link_id)
+        self.sw_label = intern(sw_label)
+        self.sw_if_name = intern(sw_if_name)
+        self.speed = intern(speed)
+        self.aggregate_link = intern(aggregate_link)
+        self.tags = []
+
+    def add_tag(self, tag: str) -> None:
+        self.tags.append(intern(tag))
+
+    def to_dict(self) -> dict:
+        data = {
+            'sw_label': self.sw_label,
+            'sw_if_name': self.sw_if_name,
+            'speed': self.speed,
+            'tags': self.tags,
+        }
+        if self.aggregate_link:
+            data['aggregate_link'] = self.aggregate_link
+        return data
+
+    def __repr__(self) -> str:
+        return f"GsLink({self.link_id}, {self.to_dict()})"
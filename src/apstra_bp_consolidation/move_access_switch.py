@@ -1,40 +1,31 @@
 #!/usr/bin/env python3
 
-import json
+import os
 import time
 import logging
 import click
 
-from apstra_bp_consolidation.consolidation import ConsolidationOrder
+from apstra_bp_consolidation.consolidation import ConsolidationOrder, get_fleet_orders
 from apstra_bp_consolidation.consolidation import prep_logging
 from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.switch_templates import get_switch_template_registry
+from apstra_bp_consolidation.ct_batch import apply_ct_assignments
+from apstra_bp_consolidation.cabling_maps import CkCablingMapIndex
+from apstra_bp_consolidation.switch_templates import InterfaceNameRules, SwitchPairTemplate
 
-def build_access_switch_fabric_links_dict(a_link_nodes:dict) -> dict:
+def build_access_switch_fabric_links_dict(a_link_nodes:dict, interface_name_rules: InterfaceNameRules) -> dict:
     '''
     Build each "links" data from tor_interface_nodes_in_main
-    It is assumed that the generic system interface names are in et-0/0/48-b format
+    The generic system interface names like et-0/0/48-b are translated by interface_name_rules
+    Raise ValueError if the interface name does not match any rule
     '''
     # logging.debug(f"{len(a_link_nodes)=}, {a_link_nodes=}")
 
-    translation_table = {
-        "et-0/0/48-a": { 'system_peer': 'first', 'system_if_name': 'et-0/0/48' },
-        "et-0/0/48-b": { 'system_peer': 'second', 'system_if_name': 'et-0/0/48' },
-        "et-0/0/49-a": { 'system_peer': 'first', 'system_if_name': 'et-0/0/49' },
-        "et-0/0/49-b": { 'system_peer': 'second', 'system_if_name': 'et-0/0/49' },
-
-        "et-0/0/48a": { 'system_peer': 'first', 'system_if_name': 'et-0/0/48' },
-        "et-0/0/48b": { 'system_peer': 'second', 'system_if_name': 'et-0/0/48' },
-        "et-0/0/49a": { 'system_peer': 'first', 'system_if_name': 'et-0/0/49' },
-        "et-0/0/49b": { 'system_peer': 'second', 'system_if_name': 'et-0/0/49' },
-    }
-
     tor_intf_name = a_link_nodes[CkEnum.GENERIC_SYSTEM_INTERFACE]['if_name']
-    if tor_intf_name not in translation_table:
-        logging.warning(f"a_link_nodes[{CkEnum.GENERIC_SYSTEM_INTERFACE}]['if_name']: {tor_intf_name}, none of {[x for x in translation_table.keys()]}")
-        return None
+    system_peer, system_if_name = interface_name_rules.translate(tor_intf_name)
     link_candidate = {
             "lag_mode": "lacp_active",
-            "system_peer": translation_table[tor_intf_name]['system_peer'],
+            "system_peer": system_peer,
             "switch": {
                 "system_id": a_link_nodes[CkEnum.MEMBER_SWITCH]['id'],
                 "transformation_id": 2,
@@ -43,27 +34,20 @@ def build_access_switch_fabric_links_dict(a_link_nodes:dict) -> dict:
             "system": {
                 "system_id": None,
                 "transformation_id": 1,
-                "if_name": translation_table[tor_intf_name]['system_if_name']
+                "if_name": system_if_name
             }
         }
     return link_candidate
 
-def build_switch_pair_spec(tor_interface_nodes_in_main, tor_label) -> dict:
+def build_switch_pair_spec(tor_interface_nodes_in_main, tor_label, template: SwitchPairTemplate) -> dict:
     '''
-    Build the switch pair spec from the links query
+    Build the switch pair spec from the links query and the switch pair template
     '''
     switch_pair_spec = {
-        "links": [build_access_switch_fabric_links_dict(x) for x in tor_interface_nodes_in_main],
-        "new_systems": None
+        "links": [build_access_switch_fabric_links_dict(x, template.interface_name_rules) for x in tor_interface_nodes_in_main],
+        "new_systems": template.build_new_systems(tor_label)
     }
 
-    # TODO: 
-    with open('./tests/fixtures/fixture-switch-system-links-5120.json', 'r') as file:
-        sample_data = json.load(file)
-
-    switch_pair_spec['new_systems'] = sample_data['new_systems']
-    switch_pair_spec['new_systems'][0]['label'] = tor_label
-
     return switch_pair_spec
 
 
@@ -80,29 +64,12 @@ def remove_old_generic_system_from_main(order, tor_ae_id_in_main, tor_interface_
     # remove the connectivity templates assigned to the generic system
     cts_to_remove = order.main_bp.get_interface_cts(tor_ae_id_in_main)
 
-    # damping CTs in chunks
-    while len(cts_to_remove) > 0:
-        throttle_number = 50
-        cts_chunk = cts_to_remove[:throttle_number]
-        logging.debug(f"Removing Connecitivity Templates on this links: {len(cts_chunk)=}")
-        batch_ct_spec = {
-            "operations": [
-                {
-                    "path": "/obj-policy-batch-apply",
-                    "method": "PATCH",
-                    "payload": {
-                        "application_points": [
-                            {
-                                "id": tor_ae_id_in_main,
-                                "policies": [ {"policy": x, "used": False} for x in cts_chunk]
-                            }
-                        ]
-                    }
-                }
-            ]
-        }
-        batch_result = order.main_bp.batch(batch_ct_spec, params={"comment": "batch-api"})
-        del cts_to_remove[:throttle_number]
+    # damping CTs in chunks sized by the controller response
+    apply_ct_assignments(
+        order.main_bp,
+        {tor_ae_id_in_main: {x: False for x in cts_to_remove}},
+        order.ct_batch_sizer,
+        order.ct_batch_max_application_points)
 
     # remove the generic system (links)
     link_remove_spec = {
@@ -129,7 +96,47 @@ def remove_old_generic_system_from_main(order, tor_ae_id_in_main, tor_interface_
     return
 
 
-def create_new_access_switch_pair(order, switch_pair_spec):
+REDUNDANCY_GROUP = 'redundancy_group'
+PATCH_WAIT_ATTEMPTS = 20
+
+
+def build_access_switch_pair_patches(order, new_systems: list) -> list:
+    """
+    The node patches to rename the new pair from the rows of the leafs and their redundancy group
+        the redundancy group to <tor_label>-pair
+        <tor_label>1 and <tor_label>2 to the switch label pair for the label and hostname
+    """
+    tor_a = f"{order.switch_label_pair[0]}"
+    tor_b = f"{order.switch_label_pair[1]}"
+
+    # rename redundancy group with <tor_label>-pair
+    node_patches = [
+        {"id": new_systems[0][REDUNDANCY_GROUP]['id'], "label": f"{order.tor_label}-pair" }
+    ]
+
+    # rename each access switch for the label and hostname
+    for leaf in new_systems:
+        given_label = leaf['leaf']['label']
+        # when the label is <tor_label>1, rename it to <tor_label>a
+        if given_label[-1] == '1':
+            new_label = tor_a
+        # when the labe is <tor_label>2, rename it to <tor_label>b
+        elif given_label[-1] == '2':
+            new_label = tor_b
+        else:
+            logging.warning(f"skipp chaning name {given_label=}")
+            continue
+        node_patches.append({"id": leaf['leaf']['id'], "label": new_label, "hostname": new_label })
+
+    return node_patches
+
+
+def create_new_access_switch_pair(order, switch_pair_spec) -> list:
+    """
+    Create the access switch pair and return the node patches to rename it
+        The patches are sent later with patch_access_switch_pairs
+        A pair created by a previous run but not renamed is not created again. Its patches are returned
+    """
     ########
     # create new access system pair
     # olg logical device is not useful anymore
@@ -139,15 +146,25 @@ def create_new_access_switch_pair(order, switch_pair_spec):
     # rack type _ATL-AS-5100-48T, _ATL-AS-5120-48T created and added
     # ATL-AS-LOOPBACK with 10.29.8.0/22
     
-    REDUNDANCY_GROUP = 'redundancy_group'
-
     # skip if the access switch piar already exists
     tor_a = f"{order.switch_label_pair[0]}"
-    tor_b = f"{order.switch_label_pair[1]}"
     if order.main_bp.get_system_node_from_label(tor_a):
         logging.info(f"{tor_a} already exists in main blueprint")
-        return
-    
+        return []
+    if order.main_bp.query(f"node('redundancy_group', label='{order.tor_label}-pair', name='{REDUNDANCY_GROUP}')"):
+        logging.info(f"{order.tor_label}-pair already exists in main blueprint")
+        return []
+
+    # the pair of a previous run stopped before the renames
+    given_labels = [f"{order.tor_label}1", f"{order.tor_label}2"]
+    new_systems = order.main_bp.query(f"""
+        node('system', label=is_in({given_labels}), name='leaf')
+        .out().node('redundancy_group', name='{REDUNDANCY_GROUP}')
+        """, multiline=True)
+    if new_systems:
+        logging.info(f"{given_labels} already exist in main blueprint - renaming only")
+        return build_access_switch_pair_patches(order, new_systems)
+
     access_switch_pair_created = order.main_bp.add_generic_system(switch_pair_spec)
     logging.info(f"{access_switch_pair_created=}")
 
@@ -166,29 +183,81 @@ def create_new_access_switch_pair(order, switch_pair_spec):
         time.sleep(3)
 
     # The first entry is the peer link
+    return build_access_switch_pair_patches(order, new_systems)
 
-    # rename redundancy group with <tor_label>-pair
-    order.main_bp.patch_node_single(
-        new_systems[0][REDUNDANCY_GROUP]['id'], 
-        {"label": f"{order.tor_label}-pair" }
-        )
 
-    # rename each access switch for the label and hostname
-    for leaf in new_systems:
-        given_label = leaf['leaf']['label']
-        # when the label is <tor_label>1, rename it to <tor_label>a
-        if given_label[-1] == '1':
-            new_label = tor_a
-        # when the labe is <tor_label>2, rename it to <tor_label>b
-        elif given_label[-1] == '2':
-            new_label = tor_b
+def patch_access_switch_pairs(the_bp, node_patches: list) -> None:
+    """
+    Send the node patches of the access switch pairs in one PATCH
+
+    Raise ValueError if the PATCH fails or the new labels do not show up
+    """
+    if not node_patches:
+        return
+    logging.info(f"patching {len(node_patches)} nodes in {the_bp.label}")
+    patched = the_bp.patch_nodes(node_patches)
+    if patched is not None and patched.status_code >= 400:
+        raise ValueError(f"patching nodes in {the_bp.label} failed {patched.status_code}: {patched.text}")
+    # the patch is async. wait for the new labels before the next step looks them up
+    new_labels = [x['label'] for x in node_patches]
+    for i in range(PATCH_WAIT_ATTEMPTS):
+        labels_present = the_bp.query(f"node(label=is_in({new_labels}), name='node')")
+        if len(labels_present) >= len(new_labels):
+            return
+        logging.info(f"waiting for the new labels: {len(labels_present)}/{len(new_labels)}")
+        time.sleep(3)
+    raise ValueError(f"the new labels {new_labels} are not in {the_bp.label} after {PATCH_WAIT_ATTEMPTS * 3} seconds")
+
+
+def get_tor_interface_nodes_from_cabling_maps(cabling_map_index: CkCablingMapIndex, bp_label: str, tor_name: str) -> list:
+    """
+    Build tor_interface_nodes_in_main from the collected cabling maps without querying the blueprint
+        The same keys as get_server_interface_nodes. CkEnum.EVPN_INTERFACE is from evpn_members of the cabling maps
+    """
+    tor_interface_nodes_in_main = []
+    for if_name, endpoint in cabling_map_index.get_system_links(bp_label, tor_name):
+        nodes = {
+            CkEnum.GENERIC_SYSTEM_INTERFACE: {'id': endpoint['interface_id'], 'if_name': if_name},
+            CkEnum.LINK: {'id': endpoint['link_id'], 'speed': endpoint['speed']},
+            CkEnum.MEMBER_INTERFACE: {'id': endpoint['peer_interface_id'], 'if_name': endpoint['peer_if_name']},
+            CkEnum.MEMBER_SWITCH: {'id': endpoint['peer_id'], 'label': endpoint['peer_label']},
+        }
+        if endpoint['peer_evpn_interface_id']:
+            nodes[CkEnum.EVPN_INTERFACE] = {'id': endpoint['peer_evpn_interface_id']}
+        tor_interface_nodes_in_main.append(nodes)
+    return tor_interface_nodes_in_main
+
+
+def pull_tor_interface_nodes_in_main(orders: list) -> dict:
+    """
+    The links of the TOR generic system of each order in the main blueprint
+        From the collected cabling maps for the main blueprints unchanged since the collection
+        Otherwise from the blueprint
+    Call before any write of the orders. The writes of an order change the version of the main blueprint
+
+    Return: { <tor label>: tor_interface_nodes_in_main }
+    """
+    cabling_maps_yaml_file = orders[0].cabling_maps_yaml_file
+    fresh_main_bp_labels = set()
+    if cabling_maps_yaml_file and os.path.exists(cabling_maps_yaml_file):
+        cabling_map_index = CkCablingMapIndex(cabling_maps_yaml_file)
+        # the current versions of all the main blueprints with one listing
+        orders[0].session.blueprint_directory.refresh()
+        for main_bp in {x.main_bp.label: x.main_bp for x in orders}.values():
+            collected_version = cabling_map_index.get_version(main_bp.label)
+            if collected_version is not None and collected_version == main_bp.get_version():
+                fresh_main_bp_labels.add(main_bp.label)
+            else:
+                logging.info(f"{cabling_maps_yaml_file} is stale for {main_bp.label}: {collected_version=}, {main_bp.get_version()=}")
+
+    tor_interface_nodes = {}
+    for order in orders:
+        if order.main_bp.label in fresh_main_bp_labels:
+            tor_interface_nodes[order.tor_label] = get_tor_interface_nodes_from_cabling_maps(cabling_map_index, order.main_bp.label, order.tor_label)
+            logging.info(f"{len(tor_interface_nodes[order.tor_label])} links of {order.tor_label} from {cabling_maps_yaml_file}")
         else:
-            logging.warning(f"skipp chaning name {given_label=}")
-            continue
-        order.main_bp.patch_node_single(
-            leaf['leaf']['id'], 
-            {"label": new_label, "hostname": new_label }
-            )
+            tor_interface_nodes[order.tor_label] = order.main_bp.get_server_interface_nodes(order.tor_label)
+    return tor_interface_nodes
 
 
 def get_tor_ae_id_in_main(tor_interface_nodes_in_main, tor_name):
@@ -207,27 +276,50 @@ def get_tor_ae_id_in_main(tor_interface_nodes_in_main, tor_name):
 
 
 @click.command(name='move-access-switches', help='step 1 - replace the generic system in main blueprint with the access switch pair from tor blueprint')
-def click_move_access_switches():    
+@click.option('--fleet', is_flag=True, help='all the TORs of blueprint.tors in the config')
+def click_move_access_switches(fleet):
+    if fleet:
+        order_move_access_switches_fleet(get_fleet_orders())
+        return
     order = ConsolidationOrder()
     order_move_access_switches(order)
 
 def order_move_access_switches(order):
-    logging.info(f"======== Moving Access Switches for {order.switch_label_pair} from {order.tor_bp.label} to {order.main_bp.label}")
+    order_move_access_switches_fleet([order])
 
-    tor_name = order.config['blueprint']['tor']['torname']
+def order_move_access_switches_fleet(orders: list):
+    """
+    Move the access switches of the orders. The renames of all the new pairs go in one PATCH per main blueprint
+    """
+    # the links of all the TORs before the first write
+    tor_interface_nodes = pull_tor_interface_nodes_in_main(orders)
+    node_patches = {}  # { main_bp label: ( main_bp, [ node patch ] ) }
+    for order in orders:
+        node_patches.setdefault(order.main_bp.label, (order.main_bp, []))[1].extend(
+            move_access_switch_pair(order, tor_interface_nodes[order.tor_label]))
+    for the_bp, bp_node_patches in node_patches.values():
+        patch_access_switch_pairs(the_bp, bp_node_patches)
+
+def move_access_switch_pair(order, tor_interface_nodes_in_main: list) -> list:
+    """
+    Replace the TOR generic system with the access switch pair
+
+    tor_interface_nodes_in_main: the links of the TOR generic system from pull_tor_interface_nodes_in_main
+    Return: the node patches to rename the new pair
+    """
+    logging.info(f"======== Moving Access Switches for {order.switch_label_pair} from {order.tor_bp.label} to {order.main_bp.label}")
 
-    # TODO: use bp/cabling-maps to get live interface names
-    tor_interface_nodes_in_main = order.main_bp.get_server_interface_nodes(tor_name)
-    # logging.warning(f"{tor_interface_nodes_in_main=}")
+    tor_name = order.tor_label
 
     tor_ae_id_in_main = get_tor_ae_id_in_main(tor_interface_nodes_in_main, tor_name)
 
     # build switch pair spec from the main blueprint generic system links
-    switch_pair_spec = build_switch_pair_spec(tor_interface_nodes_in_main, order.tor_label)
+    template = get_switch_template_registry(order.switch_template_files).get(order.access_switch_interface_map_label)
+    switch_pair_spec = build_switch_pair_spec(tor_interface_nodes_in_main, order.tor_label, template)
     
     remove_old_generic_system_from_main(order, tor_ae_id_in_main, tor_interface_nodes_in_main)
 
-    create_new_access_switch_pair(order, switch_pair_spec)
+    return create_new_access_switch_pair(order, switch_pair_spec)
 
 if __name__ == '__main__':
     order = ConsolidationOrder()
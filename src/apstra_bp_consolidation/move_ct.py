@@ -1,127 +1,164 @@
 #!/usr/bin/env python3
 
+import json
 import logging
-import copy
 import uuid
-from typing import Any
-# from typing import List, Optional
-from pydantic import BaseModel
+import hashlib
 
-from apstra_bp_consolidation.consolidation import ConsolidationOrder
+from apstra_bp_consolidation.consolidation import ConsolidationOrder, get_fleet_orders
 
 from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.vlan_set import VlanSet
+from apstra_bp_consolidation.models import InterfaceVlans, intern
+from apstra_bp_consolidation.ct_batch import apply_ct_assignments, diff_ct_assignments
+from apstra_bp_consolidation.ct_batch import DEFAULT_MAX_APPLICATION_POINTS
+from apstra_bp_consolidation.batch_sizer import AdaptiveBatchSizer
+from apstra_bp_consolidation.write_merge import CkMainBlueprintWrites
+
+
+def get_policy_attributes(policy_node: dict) -> dict:
+    """
+    The attributes of an ep_endpoint_policy node. The graph keeps them as a json string
+    """
+    attributes = policy_node.get('attributes') or {}
+    if isinstance(attributes, str):
+        attributes = json.loads(attributes)
+    return attributes
+
+
+def pull_multi_vlan_ai_vlans(the_bp) -> dict:
+    """
+    The VLANs of the application instances of the multiple VLAN CTs
+
+    Return: { <application instance id>: [ (vlan_id, is_tagged) ] }
+    """
+    APPLICATION_INSTANCE_NODE = 'ep_application_instance'
+    MULTI_VLAN_NODE = 'AttachMultipleVLAN'
+    ai_multi_vlan_query = f"""
+        node('ep_application_instance', name='{APPLICATION_INSTANCE_NODE}')
+            .out('ep_nested').node('ep_endpoint_policy', policy_type_name='AttachMultipleVLAN', name='{MULTI_VLAN_NODE}')
+    """
+    ai_multi_vlan_nodes = the_bp.query(ai_multi_vlan_query, multiline=True)
+    if not ai_multi_vlan_nodes:
+        return {}
+    vn_id_2_vlan_id = {
+        x['vn']['id']: int(x['vn']['vn_id']) - 100000
+        # the VLAN type VNs have no vn_id
+        for x in the_bp.query("node('virtual_network', vn_type='vxlan', name='vn')")
+    }
+    ai_vlans = {}
+    for nodes in ai_multi_vlan_nodes:
+        attributes = get_policy_attributes(nodes[MULTI_VLAN_NODE])
+        vlans = [(vn_id_2_vlan_id[x], True) for x in attributes.get('tagged_vn_node_ids') or [] if x in vn_id_2_vlan_id]
+        if attributes.get('untagged_vn_node_id') in vn_id_2_vlan_id:
+            vlans.append((vn_id_2_vlan_id[attributes['untagged_vn_node_id']], False))
+        ai_vlans.setdefault(nodes[APPLICATION_INSTANCE_NODE]['id'], []).extend(vlans)
+    return ai_vlans
 
 
 def pull_interface_vlan_table(the_bp, switch_label_pair: list) -> dict:
     """
-    Pull the single vlan cts for the switch pair
+    Pull the single vlan cts and the multiple vlan cts for the switch pair
+
+    The single match() query over CT, application instance, interface, VLAN policy, VN and the AE members
+    returns the cartesian product of the paths. Pull each relation with a narrow query and join them here.
+        application instance -> VN (the single VLAN CTs)
+        application instance -> VNs (the multiple VLAN CTs of move-cts --multi-vlan)
+        application instance -> interface
+        AE -> member interfaces
 
     The return data
     <system_label>:
-        <if_name>:
-            id: None
-            tagged_vlans: []
-            untagged_vlan: None
+        <if_name>: InterfaceVlans(id=<interface id>)
     redundacy_group:
-        <ae_id>:
-            tagged_vlans: []
-            untagged_vlan: None
-            member_interfaces:
-                <system_label>: [ <member if_name> ]   
+        <ae_id>: InterfaceVlans(member_interfaces={ <system_label>: [ <member if_name> ] })
     """
     interface_vlan_table = {
-        # atl1tor-r5r14a:
-        #     xe-0/0/0:
-        #         id: <interface id>
-        #         tagged_vlans: []
-        #         untagged_vlan: None
-        CkEnum.REDUNDANCY_GROUP: {
-            # <ae_id>:
-            #     tagged_vlans: []
-            #     untagged_vlan: None
-            #     member_interfaces:
-            #         <system_label>: [ <member if_name> ]             
-        }
-
+        CkEnum.REDUNDANCY_GROUP: {}
     }
 
+    APPLICATION_INSTANCE_NODE = 'ep_application_instance'
     INTERFACE_NODE = 'interface'
-    CT_NODE = 'batch'
     SINGLE_VLAN_NODE = 'AttachSingleVLAN'
     VN_NODE = 'virtual_network'
 
-    interface_vlan_query = f"""
+    # application instance -> [ (vlan_id, is_tagged) ]
+    ai_vlan_query = f"""
+        node('ep_application_instance', name='{APPLICATION_INSTANCE_NODE}')
+            .out('ep_nested').node('ep_endpoint_policy', policy_type_name='AttachSingleVLAN', name='{SINGLE_VLAN_NODE}')
+            .out('vn_to_attach').node('virtual_network', name='{VN_NODE}')
+    """
+    ai_vlans = {}
+    for nodes in the_bp.query(ai_vlan_query, multiline=True):
+        vlan_id = int(nodes[VN_NODE]['vn_id']) - 100000
+        is_tagged = 'vlan_tagged' in nodes[SINGLE_VLAN_NODE]['attributes']
+        ai_vlans.setdefault(nodes[APPLICATION_INSTANCE_NODE]['id'], []).append((vlan_id, is_tagged))
+    for ai_id, vlans in pull_multi_vlan_ai_vlans(the_bp).items():
+        ai_vlans.setdefault(ai_id, []).extend(vlans)
+
+    # application instance -> interface (and the switch if the interface is on the switch pair)
+    ai_interface_query = f"""
         match(
-            node('ep_endpoint_policy', policy_type_name='batch', name='{CT_NODE}')
-                .in_().node('ep_application_instance', name='ep_application_instance')
+            node('ep_endpoint_policy', policy_type_name='batch')
+                .in_().node('ep_application_instance', name='{APPLICATION_INSTANCE_NODE}')
                 .out('ep_affected_by').node('ep_group')
                 .in_('ep_member_of').node(name='{INTERFACE_NODE}'),
-            node(name='ep_application_instance')
-                .out('ep_nested').node('ep_endpoint_policy', policy_type_name='AttachSingleVLAN', name='{SINGLE_VLAN_NODE}')
-                .out('vn_to_attach').node('virtual_network', name='virtual_network'),
             optional(
                 node(name='{INTERFACE_NODE}')
-                .out('composed_of').node('interface')
-                .out('composed_of').node('interface', name='{CkEnum.MEMBER_INTERFACE}')
-                .in_('hosted_interfaces').node('system', label=is_in({switch_label_pair}), name='{CkEnum.MEMBER_SWITCH}' )
-                ),
-            optional(
-                node(name='interface')
                 .in_('hosted_interfaces').node('system', label=is_in({switch_label_pair}), name='switch')
-                )            
+                )
         )
     """
-
-    interface_vlan_nodes = the_bp.query(interface_vlan_query, multiline=True)
-    logging.debug(f"BP:{the_bp.label} {len(interface_vlan_nodes)=}")
-    # why so many (3172) entries?
-
-    for nodes in interface_vlan_nodes:
-        if nodes[CkEnum.MEMBER_INTERFACE]:
-            # INTERFACE_NODE is EVPN
-            evpn_id = nodes[INTERFACE_NODE]['id']
-            system_label = nodes[CkEnum.MEMBER_SWITCH]['label']
-            if_name = nodes[CkEnum.MEMBER_INTERFACE]['if_name']
-            if if_name in ['et-0/0/48', 'et-0/0/49']:
-                # skip et-0/0/48 and et-0/0/49 which will be taken care of by Apstra
+    ai_interface_nodes = the_bp.query(ai_interface_query, multiline=True)
+
+    # AE id -> { system_label: [ member if_name ] }
+    ae_member_query = f"""
+        node('interface', po_control_protocol='evpn', name='{CkEnum.EVPN_INTERFACE}')
+            .out('composed_of').node('interface')
+            .out('composed_of').node('interface', name='{CkEnum.MEMBER_INTERFACE}')
+            .in_('hosted_interfaces').node('system', label=is_in({switch_label_pair}), name='{CkEnum.MEMBER_SWITCH}')
+    """
+    ae_members = {}
+    for nodes in the_bp.query(ae_member_query, multiline=True):
+        if_name = nodes[CkEnum.MEMBER_INTERFACE]['if_name']
+        evpn_id = nodes[CkEnum.EVPN_INTERFACE]['id']
+        this_ae_members = ae_members.setdefault(evpn_id, {})
+        if if_name in ['et-0/0/48', 'et-0/0/49']:
+            # skip et-0/0/48 and et-0/0/49 which will be taken care of by Apstra
+            continue
+        system_label = intern(nodes[CkEnum.MEMBER_SWITCH]['label'])
+        this_system_members = this_ae_members.setdefault(system_label, [])
+        if if_name not in this_system_members:
+            this_system_members.append(intern(if_name))
+
+    logging.debug(f"BP:{the_bp.label} {len(ai_vlans)=} {len(ai_interface_nodes)=} {len(ae_members)=}")
+
+    for nodes in ai_interface_nodes:
+        interface_id = nodes[INTERFACE_NODE]['id']
+        vlans = ai_vlans.get(nodes[APPLICATION_INSTANCE_NODE]['id'])
+        if not vlans:
+            # the CT has no VLAN policy
+            continue
+        if interface_id in ae_members:
+            if not ae_members[interface_id]:
+                # the AE of the uplinks
                 continue
-            vlan_id = int(nodes[VN_NODE]['vn_id'] )- 100000
-            is_tagged = 'vlan_tagged' in nodes[SINGLE_VLAN_NODE]['attributes']
-            if evpn_id not in interface_vlan_table[CkEnum.REDUNDANCY_GROUP]:
-                interface_vlan_table[CkEnum.REDUNDANCY_GROUP][evpn_id] = {
-                    CkEnum.TAGGED_VLANS: [],
-                    CkEnum.UNTAGGED_VLAN: None,
-                    CkEnum.MEMBER_INTERFACE: {}
-                }
-            this_evpn_interface_data = interface_vlan_table[CkEnum.REDUNDANCY_GROUP][evpn_id]
-            if system_label not in this_evpn_interface_data[CkEnum.MEMBER_INTERFACE]:
-                this_evpn_interface_data[CkEnum.MEMBER_INTERFACE][system_label] = []
-            if if_name not in this_evpn_interface_data[CkEnum.MEMBER_INTERFACE][system_label]:
-                this_evpn_interface_data[CkEnum.MEMBER_INTERFACE][system_label].append(if_name)
-            if is_tagged:
-                # add vlan_id if not already in the list
-                if vlan_id not in this_evpn_interface_data[CkEnum.TAGGED_VLANS]:
-                    this_evpn_interface_data[CkEnum.TAGGED_VLANS].append(vlan_id)
-            else:
-                this_evpn_interface_data[CkEnum.UNTAGGED_VLAN] = vlan_id
-        else:
-            system_label = nodes['switch']['label']
-            if_name = nodes['interface']['if_name']
-            vlan_id = int(nodes['virtual_network']['vn_id'] )- 100000
-            is_tagged = 'vlan_tagged' in nodes[SINGLE_VLAN_NODE]['attributes']
+            if interface_id not in interface_vlan_table[CkEnum.REDUNDANCY_GROUP]:
+                interface_vlan_table[CkEnum.REDUNDANCY_GROUP][intern(interface_id)] = InterfaceVlans(member_interfaces=ae_members[interface_id])
+            this_interface_data = interface_vlan_table[CkEnum.REDUNDANCY_GROUP][interface_id]
+        elif nodes['switch']:
+            system_label = intern(nodes['switch']['label'])
+            if_name = intern(nodes[INTERFACE_NODE]['if_name'])
             if system_label not in interface_vlan_table:
                 interface_vlan_table[system_label] = {}
             if if_name not in interface_vlan_table[system_label]:
-                interface_vlan_table[system_label][if_name] = {
-                    'id': nodes['interface']['id'],
-                    CkEnum.TAGGED_VLANS: [],
-                    CkEnum.UNTAGGED_VLAN: None,
-                }
+                interface_vlan_table[system_label][if_name] = InterfaceVlans(id=interface_id)
             this_interface_data = interface_vlan_table[system_label][if_name]
-            if is_tagged:
-                this_interface_data[CkEnum.TAGGED_VLANS].append(vlan_id)
-            else:
-                this_interface_data[CkEnum.UNTAGGED_VLAN] = vlan_id
+        else:
+            # the interface is not on the switch pair
+            continue
+        for vlan_id, is_tagged in vlans:
+            this_interface_data.add_vlan(vlan_id, is_tagged)
 
     summary = [f"{x}:{len(interface_vlan_table[x])}" for x in interface_vlan_table.keys()]
     logging.debug(f"BP:{the_bp.label} {summary=}")
@@ -201,13 +238,30 @@ def get_vni_2_ct_id_table(the_bp) -> dict:
     return vni_2_ct_id_table
 
 def update_interface_id(the_bp, interface_vlan_table, switch_label_pair: list) -> dict:
-    # deepcopy to avoid mutation
-    interface_id_vlan_table = copy.deepcopy(interface_vlan_table)
+    """
+    Find the interface ids in the_bp for the interfaces of interface_vlan_table
+
+    interface_vlan_table is not modified. The ids are returned in a separate mapping
+    <system_label>:
+        <if_name>: <interface id>
+    redundacy_group:
+        <tor_ae_id>: <ae_id>
+    """
+    interface_id_table = {
+        CkEnum.REDUNDANCY_GROUP: {}
+    }
 
     EVPN_INTERFACE_NODE = 'evpn-interface'
     MEMBER_SWITCH_NODE = 'switch'
     MEMBER_INTERFACE_NODE = 'member-interface'
 
+    # reverse index (system_label, member if_name) -> tor_ae_id
+    member_2_ae = {}
+    for tor_ae_id, ae_data in interface_vlan_table[CkEnum.REDUNDANCY_GROUP].items():
+        for system_label, member_if_names in ae_data.member_interfaces.items():
+            for if_name in member_if_names:
+                member_2_ae[(system_label, if_name)] = tor_ae_id
+
     interface_id_query = f"""
         match(
             node('system', label=is_in({list(interface_vlan_table.keys())}), name='{MEMBER_SWITCH_NODE}')
@@ -225,94 +279,204 @@ def update_interface_id(the_bp, interface_vlan_table, switch_label_pair: list) -
         if_name = nodes[MEMBER_INTERFACE_NODE]['if_name']
         if nodes[EVPN_INTERFACE_NODE]:
             # the node is not null - it is an EVPN interface
-            evpn_id = nodes[EVPN_INTERFACE_NODE]['id']
-            # loop through the interface_vlan_table to update
-            for ae_id, ae_data in interface_id_vlan_table[CkEnum.REDUNDANCY_GROUP].items():
-                if system_label in ae_data[CkEnum.MEMBER_INTERFACE]:
-                    if if_name in ae_data[CkEnum.MEMBER_INTERFACE][system_label]:
-                        ae_data['id'] = evpn_id
-                        break
+            tor_ae_id = member_2_ae.get((system_label, if_name))
+            if tor_ae_id:
+                interface_id_table[CkEnum.REDUNDANCY_GROUP][tor_ae_id] = nodes[EVPN_INTERFACE_NODE]['id']
         else:
             # no EVPN_INTERFACE_NODE - non-LAG interface
-            if if_name in interface_vlan_table[system_label]:
+            if if_name in interface_vlan_table.get(system_label, {}):
                 # skip if the interface does not have vlan assignment
-                interface_id_vlan_table[system_label][if_name]['id'] = nodes[MEMBER_INTERFACE_NODE]['id']
-    return interface_id_vlan_table
+                interface_id_table.setdefault(system_label, {})[if_name] = nodes[MEMBER_INTERFACE_NODE]['id']
+    return interface_id_table
 
 
-def associate_cts(the_bp, interface_vlan_table, switch_label_pair: list):
+def iter_target_interfaces(interface_vlan_table, interface_id_table):
     """
+    Yield (interface id, intf_data) of the interfaces found in the blueprint
+    """
+    for system_label, system_data in interface_vlan_table.items():
+        for intf_label, intf_data in system_data.items():
+            interface_id = interface_id_table.get(system_label, {}).get(intf_label)
+            if interface_id is None:
+                logging.warning(f"{system_label}:{intf_label} not found - skipping")
+                continue
+            yield interface_id, intf_data
+
+
+def build_single_vlan_assignments(the_bp, interface_vlan_table, interface_id_table, vni_2_ct_id_table: dict) -> dict:
+    """
+    The single VLAN CTs of each interface. The missing tagged or untagged CT of a VN is created
+
+    vni_2_ct_id_table: from get_vni_2_ct_id_table
+    Return: { <interface id>: { <ct id>: True } }
     """
-    # switch_interface_nodes = the_bp.get_switch_interface_nodes(switch_label_pair)
-    vni_2_ct_id_table = get_vni_2_ct_id_table(the_bp)
     # from apstra_bp_consolidation.consolidation import pretty_yaml
     # pretty_yaml(vni_2_ct_id_table, "vni_2_ct_id_table")
 
-    interface_id_vlan_table = update_interface_id(the_bp, interface_vlan_table, switch_label_pair)
-    # pretty_yaml(interface_id_vlan_table, "interface_id_vlan_table")
+    assignments = {}  # { interface_id: { ct_id: True } }
+    for interface_id, intf_data in iter_target_interfaces(interface_vlan_table, interface_id_table):
+        ct_id_list = [ vni_2_ct_id_table[100000+x].get_id() for x in intf_data.tagged_vlans ]
+        if intf_data.untagged_vlan:
+            # if untagged vlan is configure
+            ct_id_list.append(vni_2_ct_id_table[100000+intf_data.untagged_vlan].get_id(False))
+        assignments[interface_id] = {x: True for x in ct_id_list}
+    return assignments
+
+
+MULTI_VLAN_CT_PREFIX = 'vlans-'
 
 
+def get_multi_vlan_ct_label(tagged_vlans: VlanSet, untagged_vlan: int = None) -> str:
     """
-    <system_label>:
-        <if_name>:
-            id: <interface id>
-            tagged_vlans: []
-            untagged_vlan: None
-    redundacy_group:
-        <tor_ae_id>:
-            id: <ae_id>
-            tagged_vlans: []
-            untagged_vlan: None
-            member_interfaces:
-                <system_label>: [ <member if_name> ]   
+    The CT label from the hash of the VLAN set. The same VLAN set makes the same label
     """
+    digest = hashlib.sha1(f"{tagged_vlans.bits:x}/{untagged_vlan or 0}".encode()).hexdigest()
+    return f"{MULTI_VLAN_CT_PREFIX}{digest[:16]}"
+
+
+def get_multi_vlan_ct_ids(the_bp) -> dict:
+    """
+    The multiple VLAN CTs created by move-cts in the blueprint
+
+    Return: { <ct label>: <ct id> }
+    """
+    ct_query = f"""
+        node('ep_endpoint_policy', policy_type_name='batch', name='batch')
+            .out('ep_subpolicy').node('ep_endpoint_policy')
+            .out('ep_first_subpolicy').node('ep_endpoint_policy', policy_type_name='AttachMultipleVLAN')
+    """
+    return {
+        x['batch']['label']: x['batch']['id']
+        for x in the_bp.query(ct_query, multiline=True)
+        if x['batch']['label'].startswith(MULTI_VLAN_CT_PREFIX)
+    }
+
+
+def get_managed_ct_ids(the_bp, vni_2_ct_id_table: dict) -> set:
+    """
+    The ids of the CTs move-cts applies - the single VLAN CTs and the multiple VLAN CTs of MULTI_VLAN_CT_PREFIX
+
+    vni_2_ct_id_table: from get_vni_2_ct_id_table
+    """
+    managed_ct_ids = set(get_multi_vlan_ct_ids(the_bp).values())
+    for vni_ct in vni_2_ct_id_table.values():
+        managed_ct_ids.update(x for x in [vni_ct.tagged_id, vni_ct.untagged_id] if x)
+    return managed_ct_ids
+
+
+def get_single_vlan_ct_ids(vni_2_ct_id_table: dict, tagged_vlans: VlanSet, untagged_vlan: int = None) -> list:
+    """
+    The ids of the present single VLAN CTs a single VLAN run assigns for the VLANs. The missing CTs are not created
+    """
+    ct_ids = [vni_2_ct_id_table[100000 + x].tagged_id for x in tagged_vlans if 100000 + x in vni_2_ct_id_table]
+    if untagged_vlan and 100000 + untagged_vlan in vni_2_ct_id_table:
+        ct_ids.append(vni_2_ct_id_table[100000 + untagged_vlan].untagged_id)
+    return [x for x in ct_ids if x]
+
+
+def build_multi_vlan_assignments(the_bp, interface_vlan_table, interface_id_table, vni_2_ct_id_table: dict = None) -> dict:
+    """
+    One multiple VLAN CT per distinct VLAN set of the interfaces. The CTs are reused by the label
+
+    vni_2_ct_id_table: detach the single VLAN CTs of the VLANs, superseded by the multiple VLAN CT
+    Return: { <interface id>: { <ct id>: <used> } }
+    """
+    label_2_ct_id = get_multi_vlan_ct_ids(the_bp)
+    vni_2_vn_id = {
+        int(x['vn']['vn_id']): x['vn']['id']
+        # the VLAN type VNs have no vn_id
+        for x in the_bp.query("node('virtual_network', vn_type='vxlan', name='vn')")
+    }
+
+    assignments = {}  # { interface_id: { ct_id: True } }
+    created = 0
+    for interface_id, intf_data in iter_target_interfaces(interface_vlan_table, interface_id_table):
+        tagged_vlans = intf_data.tagged_vlans
+        untagged_vlan = intf_data.untagged_vlan
+        if not tagged_vlans and not untagged_vlan:
+            continue
+        ct_label = get_multi_vlan_ct_label(tagged_vlans, untagged_vlan)
+        if ct_label not in label_2_ct_id:
+            missing = [x for x in list(tagged_vlans) + [untagged_vlan] if x and 100000 + x not in vni_2_vn_id]
+            if missing:
+                logging.warning(f"VLANs {VlanSet(missing)} have no VN in {the_bp.label} - skipping {interface_id}")
+                continue
+            label_2_ct_id[ct_label] = the_bp.add_multiple_vlan_ct(
+                ct_label,
+                [vni_2_vn_id[100000 + x] for x in tagged_vlans],
+                vni_2_vn_id[100000 + untagged_vlan] if untagged_vlan else None,
+                f"tagged {tagged_vlans} untagged {untagged_vlan}")
+            created += 1
+        assignments[interface_id] = {label_2_ct_id[ct_label]: True}
+        if vni_2_ct_id_table is not None:
+            # used False on a CT not on the interface changes nothing
+            assignments[interface_id].update({x: False for x in get_single_vlan_ct_ids(vni_2_ct_id_table, tagged_vlans, untagged_vlan)})
+    logging.info(f"{the_bp.label}: {len(assignments)} interfaces on {len(set(x for y in assignments.values() for x in y))} multiple VLAN CTs, {created} created")
+    return assignments
+
+
+def associate_cts(the_bp, interface_vlan_table, switch_label_pair: list, max_application_points: int = DEFAULT_MAX_APPLICATION_POINTS, sizer: AdaptiveBatchSizer = None, delta: bool = False, multi_vlan: bool = False):
+    """
+    Apply the VLAN CTs of interface_vlan_table to the interfaces of the_bp
+
+    The interfaces are grouped by their CT set and packed into obj-policy-batch-apply payloads
+    of up to max_application_points application points. The policies per payload follow the sizer
+
+    With delta, only the CTs missing on the interfaces are added and the extra CTs removed.
+    Only the single VLAN CTs and the multiple VLAN CTs of move-cts are removed. The other CTs are left as is
+    With multi_vlan, each interface gets one multiple VLAN CT instead of a single VLAN CT per VLAN.
+    The single VLAN CTs of its VLANs are detached
+    """
+    assignments = build_ct_assignments(the_bp, interface_vlan_table, switch_label_pair, delta, multi_vlan)
+
+    # pack the application points of many interfaces into each batch
+    requests = apply_ct_assignments(the_bp, assignments, sizer, max_application_points)
+    logging.info(f"applied CTs on {len(assignments)} interfaces with {requests} batches")
+
+
+def build_ct_assignments(the_bp, interface_vlan_table, switch_label_pair: list, delta: bool = False, multi_vlan: bool = False) -> dict:
+    """
+    The CT assignments of interface_vlan_table onto the interfaces of the_bp. See associate_cts
+
+    Return: { <interface id>: { <ct id>: <used> } }
+    """
+    # switch_interface_nodes = the_bp.get_switch_interface_nodes(switch_label_pair)
+
+    # the interface ids in the_bp: <system_label>: { <if_name>: <id> }, redundancy_group: { <tor_ae_id>: <ae_id> }
+    interface_id_table = update_interface_id(the_bp, interface_vlan_table, switch_label_pair)
+
+    # the single VLAN CTs. pulled once for the assignments and the managed CTs
+    vni_2_ct_id_table = get_vni_2_ct_id_table(the_bp)
+    if multi_vlan:
+        # without delta, the single VLAN CTs of a previous single VLAN run are detached explicitly
+        assignments = build_multi_vlan_assignments(the_bp, interface_vlan_table, interface_id_table, None if delta else vni_2_ct_id_table)
+    else:
+        assignments = build_single_vlan_assignments(the_bp, interface_vlan_table, interface_id_table, vni_2_ct_id_table)
+
+    if delta:
+        # the CTs already on the interfaces - from a previous or a partial run
+        current = the_bp.get_interfaces_cts(list(assignments))
+        total_interfaces = len(assignments)
+        assignments = diff_ct_assignments(assignments, current, get_managed_ct_ids(the_bp, vni_2_ct_id_table))
+        logging.info(f"{len(assignments)} of {total_interfaces} interfaces need CT changes")
+    return assignments
 
-    for system_label, system_data in interface_id_vlan_table.items():
-        for intf_label, intf_data in system_data.items():
-            interface_id = intf_data['id']
-            # logging.debug(f"{system_label=}, {intf_label=}, {interface_id=}, {intf_data[CkEnum.TAGGED_VLANS]=}")
-            ct_id_list = []
-            for i in intf_data[CkEnum.TAGGED_VLANS]:
-                # logging.debug(f"{i=}, {vni_2_ct_id_table[100000+i]=}")
-                ct_id_list.append(vni_2_ct_id_table[100000+i].get_id())
-            # ct_id_list = [ vni_2_ct_id_table[100000+x].get_id() for x in intf_data[CkEnum.TAGGED_VLANS] ]
-            if intf_data[CkEnum.UNTAGGED_VLAN]:
-                # if untagged vlan is configure
-                ct_id_list.append(vni_2_ct_id_table[100000+intf_data[CkEnum.UNTAGGED_VLAN]].get_id(False))
-
-            while len(ct_id_list) > 0:
-                throttle_number = 50
-                cts_chunk = ct_id_list[:throttle_number]
-                # logging.debug(f"Adding Connecitivity Templates on this links: {len(cts_chunk)=}")
-                batch_ct_spec = {
-                    "operations": [
-                        {
-                            "path": "/obj-policy-batch-apply",
-                            "method": "PATCH",
-                            "payload": {
-                                "application_points": [
-                                    {
-                                        "id": interface_id,
-                                        "policies": [ {"policy": x, "used": True} for x in cts_chunk]
-                                    }
-                                ]
-                            }
-                        }
-                    ]
-                }
-                batch_result = the_bp.batch(batch_ct_spec, params={"comment": "batch-api"})
-                del ct_id_list[:throttle_number]
-        
 
 import click
 @click.command(name='move-cts', help='step 4 - assign CTs to new generic systems')
-def click_move_cts():
+@click.option('--delta', is_flag=True, help='apply only the CT changes against the main blueprint')
+@click.option('--multi-vlan', is_flag=True, help='one multiple VLAN CT per distinct VLAN set instead of single VLAN CTs')
+@click.option('--fleet', is_flag=True, help='all the TORs of blueprint.tors in the config. The CT changes are merged per main blueprint')
+def click_move_cts(delta, multi_vlan, fleet):
+    if fleet:
+        order_move_cts_fleet(get_fleet_orders(), multi_vlan, delta=delta)
+        return
     order = ConsolidationOrder()
-    order_move_cts(order)
+    order_move_cts(order, delta, multi_vlan)
 
 
 
-def order_move_cts(order):
+def order_move_cts(order, delta: bool = False, multi_vlan: bool = False):
     logging.info(f"======== Moving Connectivity Templated for {order.switch_label_pair} from {order.tor_bp.label} to {order.main_bp.label}")
     ########
     # pull CT assignment data
@@ -320,7 +484,27 @@ def order_move_cts(order):
     interface_vlan_table = pull_interface_vlan_table(order.tor_bp, order.switch_label_pair)
     # pretty_yaml(interface_vlan_table, "interface_vlan_table")
 
-    associate_cts(order.main_bp, interface_vlan_table, order.switch_label_pair)
+    associate_cts(order.main_bp, interface_vlan_table, order.switch_label_pair, order.ct_batch_max_application_points, order.ct_batch_sizer, delta, multi_vlan)
+
+
+def order_move_cts_fleet(orders: list, multi_vlan: bool = False, interface_vlan_tables: dict = None, delta: bool = False):
+    """
+    Merge the CT assignments of all the orders and apply the changes against the current CTs once per main blueprint
+
+    interface_vlan_tables: { <tor label>: interface_vlan_table } from a plan. Pulled from the TOR blueprints by default
+    delta: remove the extra managed CTs too, as move-cts --delta
+    """
+    writes = {}  # { main_bp label: CkMainBlueprintWrites }
+    for order in orders:
+        logging.info(f"======== Planning Connectivity Templates for {order.switch_label_pair} from {order.tor_bp.label} to {order.main_bp.label}")
+        if interface_vlan_tables is not None:
+            interface_vlan_table = interface_vlan_tables[order.tor_label]
+        else:
+            interface_vlan_table = pull_interface_vlan_table(order.tor_bp, order.switch_label_pair)
+        this_writes = writes.setdefault(order.main_bp.label, CkMainBlueprintWrites(order.main_bp))
+        this_writes.add_ct_assignments(build_ct_assignments(order.main_bp, interface_vlan_table, order.switch_label_pair, delta, multi_vlan))
+    for this_writes in writes.values():
+        this_writes.flush_cts(orders[0].ct_batch_sizer, orders[0].ct_batch_max_application_points)
 
 
 if __name__ == '__main__':
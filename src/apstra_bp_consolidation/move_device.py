@@ -3,54 +3,40 @@
 import logging
 import click
 
-from apstra_bp_consolidation.consolidation import ConsolidationOrder
+from apstra_bp_consolidation.consolidation import ConsolidationOrder, get_fleet_orders
+from apstra_bp_consolidation.device_move import CkDeviceMoveEngine
 
 @click.command(name='move-devices', help='setp 5 - undeploy device from tor blueprint and deploy to main blueprint')
-def click_move_devices():
-    order = ConsolidationOrder()
-    order_move_devices(order)
+@click.option('--fleet', is_flag=True, help='all the TORs of blueprint.tors in the config')
+def click_move_devices(fleet):
+    orders = get_fleet_orders() if fleet else [ConsolidationOrder()]
+    moves = order_move_devices_fleet(orders)
+    failed = [x.label for x in moves if x.state == 'failed']
+    if failed:
+        raise click.ClickException(f"failed to move {failed}")
 
 
 def order_move_devices(order):
-    logging.info(f"======== Moving Devices for {order.switch_label_pair} from {order.tor_bp.label} to {order.main_bp.label}")
-    ########
-    # 
-    system_snapshot = {} # label: sn
-    remove_spec = []
-    for switch_label in order.switch_label_pair:
-        systems_got = order.tor_bp.get_system_node_from_label(switch_label)
-        id = systems_got['id']
-        system_id = systems_got['system_id']
-        # deploy_mode = systems_got['deploy_mode']
-        if system_id is not None:
-            system_snapshot[switch_label] = system_id
-            remove_spec.append({
-                'system_id': None,
-                'id': id,
-                'deploy_mode': None
-            })
-    if len(remove_spec) == 0:
-        logging.info("No devices to remove")
-    else:
-        device_removed = order.tor_bp.patch_nodes(remove_spec)
-    logging.debug(f"{system_snapshot=}")
-
-    add_spec = []
-    for switch_label in order.switch_label_pair:
-        system_got = order.main_bp.get_system_node_from_label(switch_label)
-        id = system_got['id']
-        # system_id = system_got['system_id']
-        # deploy_mode = system_got['deploy_mode']
-        add_spec.append({
-            'id': id,
-            'deploy_mode': 'deploy',
-            'system_id': system_snapshot[switch_label],
-        })
-    device_added = order.main_bp.patch_nodes(add_spec)
-
-
-
-    # add_device_to_bp(order.main_bp, order.switch_label_pair)
+    return order_move_devices_fleet([order])
+
+
+def order_move_devices_fleet(orders: list) -> list:
+    """
+    Move the devices of the orders. Undeploy all from the TOR blueprints, confirm, then deploy all into the main blueprints
+
+    Return: the DeviceMove list with the state and the timings of each device
+    """
+    engine = CkDeviceMoveEngine(orders[0].device_move_timeout)
+    for order in orders:
+        logging.info(f"======== Moving Devices for {order.switch_label_pair} from {order.tor_bp.label} to {order.main_bp.label}")
+        engine.add_pair(order.switch_label_pair, order.tor_bp, order.main_bp)
+    moves = engine.run()
+
+    # system_id and deploy_mode of the cached system nodes changed
+    for order in orders:
+        order.tor_bp.clear_system_cache()
+        order.main_bp.clear_system_cache()
+    return moves
 
 
 if __name__ == '__main__':
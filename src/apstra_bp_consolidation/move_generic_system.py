@@ -7,6 +7,13 @@ import time
 
 from apstra_bp_consolidation.consolidation import ConsolidationOrder
 from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.models import GsLink, intern
+from apstra_bp_consolidation.logical_devices import CkLogicalDeviceShapes, get_shapes
+from apstra_bp_consolidation.write_merge import CkMainBlueprintWrites
+
+# the size limits of a leaf-server-link-labels PATCH
+LAG_PATCH_MAX_LINKS = 500
+LAG_PATCH_MAX_BYTES = 256 * 1024
 
 
 def pull_generic_system_off_switch(the_bp, switch_label_pair: list) -> dict:
@@ -18,13 +25,7 @@ def pull_generic_system_off_switch(the_bp, switch_label_pair: list) -> dict:
         switch_label_pair: The switch pair to pull the generic system from.    
 
     <generic_system_label>:
-        <link_id>:
-            gs_if_name: None
-            sw_if_name: xe-0/0/15
-            sw_label: leaf15
-            speed: 10G
-            aggregate_link: <aggregate_link_id>
-            tags: []
+        <link_id>: GsLink(sw_label=leaf15, sw_if_name=xe-0/0/15, speed=10G, aggregate_link=<aggregate_link_id>, tags=[])
     """
     logging.info(f"{switch_label_pair=} of blueprint {the_bp.label}")
     generic_systems_data = {}
@@ -37,7 +38,7 @@ def pull_generic_system_off_switch(the_bp, switch_label_pair: list) -> dict:
         if link[CkEnum.MEMBER_INTERFACE]['if_name'] in ["et-0/0/48", "et-0/0/49"]:
             logging.debug(f"skipping uplink: {link[CkEnum.MEMBER_SWITCH]['label']}:{link[CkEnum.MEMBER_INTERFACE]['if_name']}")
             continue
-        generic_system_label = link[CkEnum.GENERIC_SYSTEM]['label']
+        generic_system_label = intern(link[CkEnum.GENERIC_SYSTEM]['label'])
         link_id = link[CkEnum.LINK]['id']
         # create entry for this generic system if it doesn't exist
         if generic_system_label not in generic_systems_data.keys():
@@ -47,30 +48,115 @@ def pull_generic_system_off_switch(the_bp, switch_label_pair: list) -> dict:
             # this happens when the link has multiple tags
             this_data = generic_systems_data[generic_system_label][link_id]
         else:
-            this_data = {'tags': []}
-            this_data['sw_label'] = link[CkEnum.MEMBER_SWITCH]['label']
-            this_data['sw_if_name'] = link[CkEnum.MEMBER_INTERFACE]['if_name']
-            this_data['speed'] = link[CkEnum.LINK]['speed']
-            if link[CkEnum.EVPN_INTERFACE]:
-                this_data['aggregate_link'] = link[CkEnum.EVPN_INTERFACE]['id']
+            this_data = GsLink(
+                link_id,
+                link[CkEnum.MEMBER_SWITCH]['label'],
+                link[CkEnum.MEMBER_INTERFACE]['if_name'],
+                link[CkEnum.LINK]['speed'],
+                link[CkEnum.EVPN_INTERFACE] and link[CkEnum.EVPN_INTERFACE]['id'])
         if link['tag']:
-            this_data['tags'].append(link[CkEnum.TAG]['label'])
+            this_data.add_tag(link[CkEnum.TAG]['label'])
         generic_systems_data[generic_system_label][link_id] = this_data
 
     return generic_systems_data
 
+def chunk_lag_links(lag_links: dict, max_links: int = LAG_PATCH_MAX_LINKS, max_bytes: int = LAG_PATCH_MAX_BYTES):
+    """
+    Split the links of leaf-server-link-labels into the specs of up to max_links links and about max_bytes
+        The links of a group stay in the same spec
+    """
+    groups = {}
+    for link_id, link_data in lag_links.items():
+        groups.setdefault(link_data['group_label'], {})[link_id] = link_data
+    spec_links = {}
+    spec_bytes = 0
+    for group_links in groups.values():
+        group_bytes = len(json.dumps(group_links))
+        if spec_links and (len(spec_links) + len(group_links) > max_links or spec_bytes + group_bytes > max_bytes):
+            yield {'links': spec_links}
+            spec_links = {}
+            spec_bytes = 0
+        spec_links.update(group_links)
+        spec_bytes += group_bytes
+    if spec_links:
+        yield {'links': spec_links}
+
+
+def patch_lag_modes(the_bp, lag_links: dict) -> None:
+    """
+    Update the LAG mode of the links in the chunks of chunk_lag_links
+    """
+    if not lag_links:
+        return
+    lag_specs = list(chunk_lag_links(lag_links))
+    logging.info(f"updating LAG mode of {len(lag_links)} links in {len(lag_specs)} requests")
+    for lag_spec in lag_specs:
+        lag_updated = the_bp.patch_leaf_server_link_labels(lag_spec)
+        logging.debug(f"lag_updated: {lag_updated}")
+
+
+def preflight_generic_system_labels(order, tor_generic_systems_data: dict) -> dict:
+    """
+    Resolve the new labels of the whole generic system set against the main blueprint before any write
+
+    The labels of the main blueprint are pulled with one query.
+    A new label present in the main blueprint is skipped if it is connected to the access switch pair (moved before)
+    and is a collision otherwise. A collided label kept long by rename_generic_system takes rename_generic_system_tail.
+    Raise ValueError with the report of the unresolved collisions
+
+    Return: { <new label>: <generic system data> } of the generic systems to create
+    """
+    main_bp = order.main_bp
+    existing_labels = {x['system']['label'] for x in main_bp.query("node('system', name='system')")}
+    on_pair_query = f"""
+        match(
+            node('system', system_type='server', name='{CkEnum.GENERIC_SYSTEM}')
+                .out('hosted_interfaces').node('interface')
+                .out('link').node('link')
+                .in_('link').node('interface')
+                .in_('hosted_interfaces').node('system', label=is_in({order.switch_label_pair}))
+        ).distinct(['{CkEnum.GENERIC_SYSTEM}'])
+    """
+    labels_on_pair = {x[CkEnum.GENERIC_SYSTEM]['label'] for x in main_bp.query(on_pair_query, multiline=True)}
+
+    to_create = {}
+    new_2_old = {}  # { new label: old label }
+    present = []
+    conflicts = []
+    for old_label, data in tor_generic_systems_data.items():
+        new_label = order.rename_generic_system(old_label)
+        if new_label in labels_on_pair:
+            present.append(new_label)
+            continue
+        if new_label in existing_labels or new_label in new_2_old:
+            alternative = order.rename_generic_system_tail(old_label)
+            if alternative in labels_on_pair:
+                present.append(alternative)
+                continue
+            if alternative in existing_labels or alternative in new_2_old:
+                conflicts.append(f"{old_label} -> {new_label}: taken by {new_2_old.get(new_label, 'the main blueprint')}, {alternative} also taken")
+                continue
+            logging.warning(f"{old_label} -> {new_label} is taken. Using {alternative}")
+            new_label = alternative
+        new_2_old[new_label] = old_label
+        to_create[new_label] = data
+
+    logging.info(f"{len(tor_generic_systems_data)} generic systems: {len(to_create)} to create, {len(present)} present, {len(conflicts)} conflicts")
+    if present:
+        logging.info(f"skipping the generic systems present in {main_bp.label}: {present}")
+    if conflicts:
+        for conflict in conflicts:
+            logging.error(conflict)
+        raise ValueError(f"{len(conflicts)} generic system label conflicts in {main_bp.label}")
+    return to_create
+
+
 # generic system data: generic_system_label.link.dict
 def new_generic_systems(order, generic_system_data:dict) -> dict:
     """
     Create new generic systems in the main blueprint based on the generic systems in the TOR blueprint. 
         <generic_system_label>:
-            <link_id>:
-                gs_if_name: None
-                sw_if_name: xe-0/0/15
-                sw_label: atl1tor-r5r14a
-                speed: 10G
-                aggregate_link: <aggregate_link_id>
-                tags: []
+            <link_id>: GsLink(sw_label=atl1tor-r5r14a, sw_if_name=xe-0/0/15, speed=10G, aggregate_link=<aggregate_link_id>, tags=[])
 
     """
     # to cache the system id of the systems includin leaf
@@ -90,126 +176,100 @@ def new_generic_systems(order, generic_system_data:dict) -> dict:
             time.sleep(3)
     logging.info(f"{order.switch_label_pair} present in {main_bp.label}")
 
-    # itrerate through the generic systems retrived from the TOR blueprint
-    for generic_system_label, gs_data in generic_system_data.items():
-        # working with a generic system 
-        logging.debug(f"Creating {generic_system_label=} {gs_data=}")
-        # this generic system is present in the main blueprint
-        if main_bp.get_system_node_from_label(generic_system_label):
-            logging.info(f"skipping: {generic_system_label} is present in the main blueprint")
-            continue
-        # this generic system is absent in main blueprint. Create it.
-        lag_group = {}
-        generic_system_spec = {
-            'links': [],
-            'new_systems': [],
-        }
-
-        # the link data has dependancy on the order
-        link_list = [ v for k, v in gs_data.items()]
-        for i in range(len(link_list)):
-        # for _, link_data in generic_system_data.items():
-            link_data = link_list[i]
-            link_spec = {
-                'lag_mode': None,
-                'system': {
-                    'system_id': None
-                },
-                'switch': {
-                    # TODO: this might need to wait for the system to be created
-                    'system_id': main_bp.get_system_node_from_label(link_data['sw_label'])['id'],
-                    'transformation_id': main_bp.get_transformation_id(link_data['sw_label'], link_data['sw_if_name'] , link_data['speed']),
-                    'if_name': link_data['sw_if_name'],
-                }                
-            }
-            if 'aggregate_link' in link_data:
-                old_aggregate_link_id = link_data['aggregate_link']
-                if old_aggregate_link_id not in lag_group:
-                    lag_group[old_aggregate_link_id] = f"link{len(lag_group)+1}"
-                # link_spec['lag_mode'] = 'lacp_active' # this should not set in 4.1.2
-                # link_spec['group_label'] = lag_group[old_aggregate_link_id] # this should not exist in 4.1.2
-            generic_system_spec['links'].append(link_spec)
-        new_system = {
-            'system_type': 'server',
-            'label': generic_system_label,
-            # 'hostname': None, # hostname should not have '_' in it
-            'port_channel_id_min': 0,
-            'port_channel_id_max': 0,
-            'logical_device': {
-                'display_name': f"auto-{link_data['speed']}x{len(gs_data)}",
-                'id': f"auto-{link_data['speed']}x{len(gs_data)}",
-                'panels': [
-                    {
-                        'panel_layout': {
-                            'row_count': 1,
-                            'column_count': len(gs_data),
-                        },
-                        'port_indexing': {
-                            'order': 'T-B, L-R',
-                            'start_index': 1,
-                            'schema': 'absolute'
-                        },
-                        'port_groups': [
-                            {
-                                'count': len(gs_data),
-                                'speed': {
-                                    'unit': link_data['speed'][-1:],
-                                    'value': int(link_data['speed'][:-1])
-                                },
-                                'roles': [
-                                    'leaf',
-                                    'access'
-                                ]
-                            }
-                        ]
-                    }
-                ]
-            }
-        }
-        generic_system_spec['new_systems'].append(new_system)
-        ethernet_interfaces = [f"{main_bp.get_system_label(x['switch']['system_id'])}:{x['switch']['if_name']}" for x in generic_system_spec['links']]
-        logging.info(f"adding {current_generic_system_count}/{total_generic_system_count} {generic_system_label} with {ethernet_interfaces} {len(lag_group)} LAG in the blueprint {main_bp.label}")
-        generic_system_created = main_bp.add_generic_system(generic_system_spec)
-        logging.debug(f"generic_system_created: {generic_system_created}")
-
-        # update the lag mode
-        """
-        lag_spec example:
-            "links": {
-                "atl1tor-r5r14a<->_atl_rack_1_001_sys072(link-000000001)[1]": {
-                    "group_label": "link1",
-                    "lag_mode": "lacp_active"
-                },
-                "atl1tor-r5r14b<->_atl_rack_1_001_sys072(link-000000002)[1]": {
-                    "group_label": "link1",
-                    "lag_mode": "lacp_active"
-                }
-            }            
-        """
-        lag_spec = {
-            'links': {}
-        }
+    # the LAG mode of the new links: { <link id>: { group_label: <group label>, lag_mode: lacp_active } }
+    lag_links = {}
+    # the tags of the new links
+    writes = CkMainBlueprintWrites(main_bp)
 
-        for i in range(len(link_list)):
-        # for _, link_data in generic_system_data.items():
-            link_data = link_list[i]
-            if 'aggregate_link' in link_data and link_data['aggregate_link']:
-                lag_spec['links'][generic_system_created[i]] = {
-                    'group_label': link_data['aggregate_link'],
-                    'lag_mode': 'lacp_active' }
+    # the distinct (speed, port count) shapes exist once as logical devices
+    logical_device_shapes = CkLogicalDeviceShapes(main_bp.session)
+    logical_device_shapes.ensure(get_shapes(generic_system_data))
 
-            # tag the link
-            if len(link_data['tags']):
-                tagged = main_bp.post_tagging([generic_system_created[i]], tags_to_add=link_data['tags'])
-                logging.debug(f"{tagged=}")
+    try:
+        # itrerate through the generic systems retrived from the TOR blueprint
+        for generic_system_label, gs_data in generic_system_data.items():
+            # working with a generic system 
+            logging.debug(f"Creating {generic_system_label=} {gs_data=}")
+            # this generic system is absent in main blueprint (preflight_generic_system_labels). Create it.
+            lag_group = {}
+            generic_system_spec = {
+                'links': [],
+                'new_systems': [],
+            }
 
-        if len(lag_spec['links']):
-            lag_updated = main_bp.patch_leaf_server_link_labels(lag_spec)
-            logging.debug(f"lag_updated: {lag_updated}")
+            # the link data has dependancy on the order
+            link_list = [ v for k, v in gs_data.items()]
+            for i in range(len(link_list)):
+            # for _, link_data in generic_system_data.items():
+                link_data = link_list[i]
+                link_spec = {
+                    'lag_mode': None,
+                    'system': {
+                        'system_id': None
+                    },
+                    'switch': {
+                        # TODO: this might need to wait for the system to be created
+                        'system_id': main_bp.get_system_node_from_label(link_data.sw_label)['id'],
+                        'transformation_id': main_bp.get_transformation_id(link_data.sw_label, link_data.sw_if_name , link_data.speed),
+                        'if_name': link_data.sw_if_name,
+                    }                
+                }
+                if link_data.aggregate_link:
+                    old_aggregate_link_id = link_data.aggregate_link
+                    if old_aggregate_link_id not in lag_group:
+                        lag_group[old_aggregate_link_id] = f"link{len(lag_group)+1}"
+                    # link_spec['lag_mode'] = 'lacp_active' # this should not set in 4.1.2
+                    # link_spec['group_label'] = lag_group[old_aggregate_link_id] # this should not exist in 4.1.2
+                generic_system_spec['links'].append(link_spec)
+            new_system = {
+                'system_type': 'server',
+                'label': generic_system_label,
+                # 'hostname': None, # hostname should not have '_' in it
+                'port_channel_id_min': 0,
+                'port_channel_id_max': 0,
+            }
+            # the shared logical device of the shape
+            new_system.update(logical_device_shapes.get_spec(link_data.speed, len(gs_data)))
+            generic_system_spec['new_systems'].append(new_system)
+            ethernet_interfaces = [f"{main_bp.get_system_label(x['switch']['system_id'])}:{x['switch']['if_name']}" for x in generic_system_spec['links']]
+            logging.info(f"adding {current_generic_system_count}/{total_generic_system_count} {generic_system_label} with {ethernet_interfaces} {len(lag_group)} LAG in the blueprint {main_bp.label}")
+            # the label is resolved by preflight_generic_system_labels. No existence query per generic system
+            generic_system_created = main_bp.add_generic_system(generic_system_spec, check_existing=False)
+            logging.debug(f"generic_system_created: {generic_system_created}")
 
+            # update the lag mode
+            """
+            lag_spec example:
+                "links": {
+                    "atl1tor-r5r14a<->_atl_rack_1_001_sys072(link-000000001)[1]": {
+                        "group_label": "link1",
+                        "lag_mode": "lacp_active"
+                    },
+                    "atl1tor-r5r14b<->_atl_rack_1_001_sys072(link-000000002)[1]": {
+                        "group_label": "link1",
+                        "lag_mode": "lacp_active"
+                    }
+                }            
+            """
+            for i in range(len(link_list)):
+            # for _, link_data in generic_system_data.items():
+                link_data = link_list[i]
+                if link_data.aggregate_link:
+                    lag_links[generic_system_created[i]] = {
+                        'group_label': link_data.aggregate_link,
+                        'lag_mode': 'lacp_active' }
 
+                # tag the link. The links of the same tags are tagged together at the end
+                if len(link_data.tags):
+                    writes.add_tags([generic_system_created[i]], link_data.tags)
 
-        current_generic_system_count += 1
+            current_generic_system_count += 1
+    finally:
+        # the LAG modes of all the new generic systems in a few large PATCHes
+        #   also on a failure so that the generic systems created so far get their LAG and tags
+        patch_lag_modes(main_bp, lag_links)
+        tagging_requests = writes.flush_tags()
+        logging.info(f"tagged {len(writes.tags)} links with {tagging_requests} requests")
 
 
 @click.command(name='move-generic-systems', help='step 2 - create the generic systems under new access switches')
@@ -217,15 +277,19 @@ def click_move_generic_systems():
     order = ConsolidationOrder()
     order_move_generic_systems(order)
 
-def order_move_generic_systems(order):
+def order_move_generic_systems(order, tor_generic_systems_data: dict = None):
+    """
+    tor_generic_systems_data: the generic systems from a plan. Pulled from the TOR blueprint by default
+    """
     logging.info(f"======== Moving Generic Systems for {order.switch_label_pair} from {order.tor_bp.label} to {order.main_bp.label}")
 
     ########
     # create new generic systems
-    tor_generic_systems_data = pull_generic_system_off_switch(order.tor_bp, order.switch_label_pair)
+    if tor_generic_systems_data is None:
+        tor_generic_systems_data = pull_generic_system_off_switch(order.tor_bp, order.switch_label_pair)
 
-    # rename the generic system label
-    access_switch_generic_systems_data = {order.rename_generic_system(old_label): data for old_label, data in tor_generic_systems_data.items()}
+    # rename the generic system label and drop the ones present in the main blueprint
+    access_switch_generic_systems_data = preflight_generic_system_labels(order, tor_generic_systems_data)
 
     new_generic_systems(order, access_switch_generic_systems_data)
 
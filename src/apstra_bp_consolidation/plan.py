@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import logging
+import click
+
+from apstra_bp_consolidation.consolidation import get_fleet_orders
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.vlan_set import VlanSet
+from apstra_bp_consolidation.models import InterfaceVlans, GsLink
+from apstra_bp_consolidation.fleet import map_concurrently
+from apstra_bp_consolidation.move_ct import pull_interface_vlan_table, order_move_cts_fleet
+from apstra_bp_consolidation.move_generic_system import pull_generic_system_off_switch, order_move_generic_systems
+from apstra_bp_consolidation.move_access_switch import order_move_access_switches_fleet
+from apstra_bp_consolidation.move_vn import order_move_virtual_networks_fleet
+from apstra_bp_consolidation.move_device import order_move_devices_fleet
+
+PLAN_VERSION = 1
+DEFAULT_PLAN_FILE = './consolidation-plan.json'
+
+
+def encode_interface_vlans(interface_vlans: InterfaceVlans) -> dict:
+    data = {'tagged': interface_vlans.tagged_vlans.to_ranges()}
+    if interface_vlans.untagged_vlan is not None:
+        data['untagged'] = interface_vlans.untagged_vlan
+    if interface_vlans.id is not None:
+        data['id'] = interface_vlans.id
+    if interface_vlans.member_interfaces is not None:
+        data['members'] = interface_vlans.member_interfaces
+    return data
+
+
+def decode_interface_vlans(data: dict) -> InterfaceVlans:
+    interface_vlans = InterfaceVlans(id=data.get('id'), member_interfaces=data.get('members'))
+    interface_vlans.tagged_vlans = VlanSet.from_ranges(data['tagged'])
+    interface_vlans.untagged_vlan = data.get('untagged')
+    return interface_vlans
+
+
+def encode_interface_vlan_table(interface_vlan_table: dict) -> dict:
+    return {
+        system_label: {key: encode_interface_vlans(x) for key, x in interfaces.items()}
+        for system_label, interfaces in interface_vlan_table.items()
+    }
+
+
+def decode_interface_vlan_table(data: dict) -> dict:
+    interface_vlan_table = {CkEnum.REDUNDANCY_GROUP: {}}
+    for system_label, interfaces in data.items():
+        interface_vlan_table[system_label] = {key: decode_interface_vlans(x) for key, x in interfaces.items()}
+    return interface_vlan_table
+
+
+def encode_generic_systems(generic_systems_data: dict) -> dict:
+    return {
+        generic_system_label: {link_id: gs_link.to_dict() for link_id, gs_link in links.items()}
+        for generic_system_label, links in generic_systems_data.items()
+    }
+
+
+def decode_generic_systems(data: dict) -> dict:
+    generic_systems_data = {}
+    for generic_system_label, links in data.items():
+        for link_id, link_data in links.items():
+            gs_link = GsLink(link_id, link_data['sw_label'], link_data['sw_if_name'], link_data['speed'], link_data.get('aggregate_link'))
+            for tag in link_data['tags']:
+                gs_link.add_tag(tag)
+            generic_systems_data.setdefault(generic_system_label, {})[link_id] = gs_link
+    return generic_systems_data
+
+
+def build_order_plan(order) -> dict:
+    """
+    Run the discovery of the TOR blueprint for an order. The version is read before the queries
+    so that a change during the discovery makes the plan stale
+    """
+    tor_version = order.tor_bp.get_version()
+    interface_vlan_table = pull_interface_vlan_table(order.tor_bp, order.switch_label_pair)
+    generic_systems_data = pull_generic_system_off_switch(order.tor_bp, order.switch_label_pair)
+    return {
+        'tor_label': order.tor_label,
+        'switch_label_pair': order.switch_label_pair,
+        'tor_bp': {'label': order.tor_bp.label, 'id': order.tor_bp.id, 'version': tor_version},
+        'main_bp': {'label': order.main_bp.label, 'id': order.main_bp.id, 'version': order.main_bp.get_version()},
+        'vni_list': order.vni_list,
+        'interface_vlan_table': encode_interface_vlan_table(interface_vlan_table),
+        'generic_systems': encode_generic_systems(generic_systems_data),
+    }
+
+
+def write_plan(plan_file: str, order_plans: list) -> None:
+    plan = {
+        'plan_version': PLAN_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'orders': order_plans,
+    }
+    with open(plan_file, 'w') as f:
+        json.dump(plan, f, separators=(',', ':'))
+
+
+def read_plan(plan_file: str) -> dict:
+    """
+    Return the plan. Raise ValueError if the plan version is not PLAN_VERSION
+    """
+    with open(plan_file, 'r') as f:
+        plan = json.load(f)
+    if plan.get('plan_version') != PLAN_VERSION:
+        raise ValueError(f"{plan_file}: plan version {plan.get('plan_version')} != {PLAN_VERSION}. Run plan again")
+    return plan
+
+
+def check_plan(orders: list, plan: dict) -> dict:
+    """
+    Match the orders to the plan by the TOR label and check the TOR blueprint versions
+
+    Return: { <tor label>: <order plan> }
+    Raise ValueError if an order is not planned, or the TOR blueprint changed since the plan
+    """
+    order_plans = {x['tor_label']: x for x in plan['orders']}
+    orders[0].session.blueprint_directory.refresh()
+    stale = []
+    for order in orders:
+        order_plan = order_plans.get(order.tor_label)
+        if order_plan is None:
+            raise ValueError(f"{order.tor_label} is not in the plan")
+        if order_plan['switch_label_pair'] != order.switch_label_pair:
+            raise ValueError(f"{order.tor_label} switch pair {order.switch_label_pair} != {order_plan['switch_label_pair']} in the plan")
+        current_version = order.tor_bp.get_version()
+        if current_version != order_plan['tor_bp']['version']:
+            stale.append(f"{order.tor_bp.label} {order_plan['tor_bp']['version']} -> {current_version}")
+    if stale:
+        raise ValueError(f"the plan is stale: {stale}. Run plan again")
+    return order_plans
+
+
+@click.command(name='plan', help='run the discovery of the tor blueprints and write the plan file')
+@click.option('--plan-file', envvar='plan_file', default=DEFAULT_PLAN_FILE, show_default=True, help='the plan file to write')
+def click_plan(plan_file):
+    order_plan(get_fleet_orders(), plan_file)
+
+
+def order_plan(orders: list, plan_file: str = DEFAULT_PLAN_FILE) -> None:
+    logging.info(f"======== Planning {[x.tor_label for x in orders]} into {plan_file}")
+    order_plans = {}
+    for order, result, exception in map_concurrently(build_order_plan, orders, orders[0].max_workers):
+        if exception is not None:
+            raise exception
+        order_plans[order.tor_label] = result
+    # keep the order of the config
+    write_plan(plan_file, [order_plans[x.tor_label] for x in orders])
+    logging.info(f"wrote {plan_file} {os.path.getsize(plan_file)} bytes")
+
+
+@click.command(name='apply', help='run all the steps with the plan file')
+@click.option('--plan-file', envvar='plan_file', default=DEFAULT_PLAN_FILE, show_default=True, help='the plan file to apply')
+@click.option('--multi-vlan', is_flag=True, help='one multiple VLAN CT per distinct VLAN set instead of single VLAN CTs')
+def click_apply(plan_file, multi_vlan):
+    order_apply(get_fleet_orders(), read_plan(plan_file), multi_vlan)
+
+
+def order_apply(orders: list, plan: dict, multi_vlan: bool = False) -> list:
+    """
+    Run the steps of move-all over the orders with the TOR blueprint data from the plan
+
+    Return: the DeviceMove list of move-devices
+    """
+    order_plans = check_plan(orders, plan)
+    logging.info(f"======== Applying the plan of {plan['created_at']} for {list(order_plans)}")
+    # the VNs from the plan. The orders do not pull them again
+    for order in orders:
+        order.vni_list = order_plans[order.tor_label]['vni_list']
+
+    order_move_access_switches_fleet(orders)
+
+    for order in orders:
+        order_move_generic_systems(order, decode_generic_systems(order_plans[order.tor_label]['generic_systems']))
+
+    order_move_virtual_networks_fleet(orders)
+
+    interface_vlan_tables = {x.tor_label: decode_interface_vlan_table(order_plans[x.tor_label]['interface_vlan_table']) for x in orders}
+    order_move_cts_fleet(orders, multi_vlan, interface_vlan_tables)
+
+    return order_move_devices_fleet(orders)
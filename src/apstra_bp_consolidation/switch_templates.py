@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import re
+import json
+import logging
+import functools
+import importlib.resources
+
+# shipped as the package data. independent of the current directory
+DEFAULT_SWITCH_TEMPLATE_FILES = [
+    str(importlib.resources.files('apstra_bp_consolidation') / 'switch_templates_data' / 'switch-system-links-5120.json'),
+]
+
+# the generic system interface names of the old TOR et-0/0/48-a, et-0/0/49b and so on
+#   the letter selects the access switch and the rest is the interface name on it
+DEFAULT_INTERFACE_NAME_RULES = [
+    (r'^(?P<if_name>et-0/0/4[89])-?(?P<peer>[ab])$', {'a': 'first', 'b': 'second'}),
+]
+
+
+class InterfaceNameRules:
+    """
+    Translate the generic system interface name in the main blueprint into the access switch interface
+
+    rules: [ ( <pattern with if_name and peer groups>, { <peer group value>: first|second } ) ]
+    """
+    __slots__ = ('rules', 'cache')
+
+    def __init__(self, rules: list = None) -> None:
+        self.rules = [(re.compile(pattern), peer_map) for pattern, peer_map in (rules or DEFAULT_INTERFACE_NAME_RULES)]
+        self.cache = {}
+
+    def translate(self, if_name: str) -> tuple:
+        """
+        Return (system_peer, system_if_name). Raise ValueError if no rule matches
+        """
+        if if_name in self.cache:
+            return self.cache[if_name]
+        for pattern, peer_map in self.rules:
+            matched = pattern.match(if_name)
+            if matched and matched.group('peer') in peer_map:
+                self.cache[if_name] = (peer_map[matched.group('peer')], matched.group('if_name'))
+                return self.cache[if_name]
+        raise ValueError(f"interface name {if_name} matches none of {[x.pattern for x, _ in self.rules]}")
+
+
+class SwitchPairTemplate:
+    """
+    The new_systems of a switch pair spec, keyed by the interface map label
+    """
+    __slots__ = ('model', 'file', 'new_systems', 'interface_name_rules')
+
+    def __init__(self, file: str, data: dict, interface_name_rules: InterfaceNameRules) -> None:
+        self.file = file
+        self.new_systems = data['new_systems']
+        self.model = self.new_systems[0]['interface_map']['label']
+        self.interface_name_rules = interface_name_rules
+
+    @staticmethod
+    def validate(file: str, data: dict) -> None:
+        new_systems = data.get('new_systems')
+        if not isinstance(new_systems, list) or len(new_systems) != 1:
+            raise ValueError(f"{file}: new_systems should have one system")
+        for key in ['peer_links', 'redundancy_protocol', 'interface_map', 'logical_device']:
+            if key not in new_systems[0]:
+                raise ValueError(f"{file}: new_systems[0] has no {key}")
+        if not new_systems[0]['interface_map'].get('label'):
+            raise ValueError(f"{file}: new_systems[0].interface_map has no label")
+
+    def build_new_systems(self, tor_label: str) -> list:
+        """
+        The new_systems with the label. The nested data is shared with the template - do not modify
+        """
+        return [dict(self.new_systems[0], label=tor_label)]
+
+
+class CkSwitchTemplateRegistry:
+    """
+    The switch pair templates loaded and validated once, keyed by the interface map label
+    """
+
+    def __init__(self, files: list = None, interface_name_rules: list = None) -> None:
+        self.logger = logging.getLogger('CkSwitchTemplateRegistry')
+        self.interface_name_rules = InterfaceNameRules(interface_name_rules)
+        self.templates = {}  # { model: SwitchPairTemplate }
+        for file in (files or DEFAULT_SWITCH_TEMPLATE_FILES):
+            self.load(file)
+
+    def load(self, file: str) -> SwitchPairTemplate:
+        try:
+            with open(file, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"switch pair template file {file} not found. check switch_template_files")
+        SwitchPairTemplate.validate(file, data)
+        template = SwitchPairTemplate(file, data, self.interface_name_rules)
+        if template.model in self.templates:
+            raise ValueError(f"{file}: {template.model} is already loaded from {self.templates[template.model].file}")
+        self.templates[template.model] = template
+        self.logger.debug(f"loaded {template.model} from {file}")
+        return template
+
+    def get(self, model: str) -> SwitchPairTemplate:
+        """
+        Return the template of the interface map label. Raise ValueError if absent
+        """
+        if model not in self.templates:
+            raise ValueError(f"no switch pair template for {model}. loaded: {list(self.templates)}")
+        return self.templates[model]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_registry(files: tuple) -> CkSwitchTemplateRegistry:
+    return CkSwitchTemplateRegistry(list(files))
+
+
+def get_switch_template_registry(files: str = None) -> CkSwitchTemplateRegistry:
+    """
+    The registry of the comma separated template files, loaded once per process
+    """
+    files = tuple(x.strip() for x in files.split(',') if x.strip()) if files else tuple(DEFAULT_SWITCH_TEMPLATE_FILES)
+    return _get_registry(files)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import logging
+import click
+
+from apstra_bp_consolidation.consolidation import ConsolidationOrder
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.diff_engine import build_tree, iter_diff
+from apstra_bp_consolidation.move_ct import pull_interface_vlan_table
+from apstra_bp_consolidation.move_generic_system import pull_generic_system_off_switch
+
+
+def build_interface_records(interface_vlan_table: dict, generic_systems_data: dict) -> dict:
+    """
+    The canonical record of each switch interface of the switch pair, from the bulk pulled tables
+
+    The AE id differs between the blueprints. A LAG member carries the VLANs of the AE and the member list instead.
+
+    <system_label>:
+        <if_name>: { tagged_vlans, untagged_vlan, lag, peer, tags }
+    """
+    records = {}
+
+    def get_record(system_label: str, if_name: str) -> dict:
+        return records.setdefault(system_label, {}).setdefault(if_name, {
+            'tagged_vlans': None,
+            'untagged_vlan': None,
+            'lag': None,
+            'peer': None,
+            'tags': [],
+        })
+
+    for system_label, interfaces in interface_vlan_table.items():
+        if system_label == CkEnum.REDUNDANCY_GROUP:
+            continue
+        for if_name, interface_vlans in interfaces.items():
+            record = get_record(system_label, if_name)
+            record['tagged_vlans'] = interface_vlans.tagged_vlans
+            record['untagged_vlan'] = interface_vlans.untagged_vlan
+    for ae_data in interface_vlan_table[CkEnum.REDUNDANCY_GROUP].values():
+        members = sorted(f"{system_label}:{if_name}" for system_label, if_names in ae_data.member_interfaces.items() for if_name in if_names)
+        for system_label, if_names in ae_data.member_interfaces.items():
+            for if_name in if_names:
+                record = get_record(system_label, if_name)
+                record['tagged_vlans'] = ae_data.tagged_vlans
+                record['untagged_vlan'] = ae_data.untagged_vlan
+                record['lag'] = members
+
+    for generic_system_label, links in generic_systems_data.items():
+        for gs_link in links.values():
+            record = get_record(gs_link.sw_label, gs_link.sw_if_name)
+            record['peer'] = generic_system_label
+            record['tags'] = sorted(gs_link.tags)
+    return records
+
+
+def fingerprint_records(records: dict) -> dict:
+    """
+    { ( <system_label>, <if_name> ): <digest of the record> }
+    """
+    return {
+        (system_label, if_name): build_tree(record).digest
+        for system_label, interfaces in records.items()
+        for if_name, record in interfaces.items()
+    }
+
+
+def pull_interface_records(the_bp, switch_label_pair: list) -> dict:
+    """
+    Pull the interface records of the switch pair with the bulk queries of move-cts and move-generic-systems
+    """
+    interface_vlan_table = pull_interface_vlan_table(the_bp, switch_label_pair)
+    generic_systems_data = pull_generic_system_off_switch(the_bp, switch_label_pair)
+    return build_interface_records(interface_vlan_table, generic_systems_data)
+
+
+def compare_interface_records(tor_records: dict, main_records: dict) -> dict:
+    """
+    Compare the fingerprints of the interfaces and detail the mismatches only
+
+    Return: { ( <system_label>, <if_name> ): [ DiffRecord ] } of the mismatched interfaces
+    """
+    tor_fingerprints = fingerprint_records(tor_records)
+    main_fingerprints = fingerprint_records(main_records)
+    mismatches = {}
+    for key in sorted(tor_fingerprints.keys() | main_fingerprints.keys()):
+        if tor_fingerprints.get(key) == main_fingerprints.get(key):
+            continue
+        system_label, if_name = key
+        mismatches[key] = list(iter_diff(
+            tor_records.get(system_label, {}).get(if_name, {}),
+            main_records.get(system_label, {}).get(if_name, {})))
+    return mismatches
+
+
+@click.command(name='verify', help='compare the moved switch interfaces of the main blueprint against the tor blueprint')
+def click_verify():
+    order = ConsolidationOrder()
+    mismatches = order_verify(order)
+    if mismatches:
+        raise click.ClickException(f"{len(mismatches)} interfaces mismatch")
+
+
+def order_verify(order) -> dict:
+    """
+    Verify VLANs, LAG membership, tags and the generic system peer of each switch interface
+
+    The generic system labels of the TOR blueprint are renamed as move-generic-systems does.
+    The VLANs are read from the single VLAN CTs.
+    """
+    logging.info(f"======== Verifying {order.switch_label_pair} of {order.main_bp.label} against {order.tor_bp.label}")
+    tor_records = pull_interface_records(order.tor_bp, order.switch_label_pair)
+    main_records = pull_interface_records(order.main_bp, order.switch_label_pair)
+
+    # rename the peers. Or the label taken by the collision fallback of preflight_generic_system_labels
+    for system_label, interfaces in tor_records.items():
+        for if_name, record in interfaces.items():
+            if not record['peer']:
+                continue
+            main_record = main_records.get(system_label, {}).get(if_name)
+            tail_label = order.rename_generic_system_tail(record['peer'])
+            record['peer'] = tail_label if main_record and main_record['peer'] == tail_label else order.rename_generic_system(record['peer'])
+
+    mismatches = compare_interface_records(tor_records, main_records)
+    total = sum(len(x) for x in tor_records.values())
+    for (system_label, if_name), records in mismatches.items():
+        for record in records:
+            logging.warning(f"{system_label}:{if_name} {record}")
+    logging.info(f"{total} interfaces in {order.tor_bp.label}, {len(mismatches)} mismatches")
+    return mismatches
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+
+class VlanSet:
+    """
+    Set of VLAN ids (1-4094) as a 4096-bit bitmap
+
+    The union, difference and equality are single integer operations.
+    The hash follows the bitmap. Do not modify a set used as a dict key.
+    """
+    __slots__ = ('bits',)
+
+    MIN_VLAN = 1
+    MAX_VLAN = 4094
+
+    def __init__(self, vlans=None) -> None:
+        self.bits = 0
+        if vlans:
+            self.update(vlans)
+
+    @classmethod
+    def from_bits(cls, bits: int) -> 'VlanSet':
+        vlan_set = cls()
+        vlan_set.bits = bits
+        return vlan_set
+
+    @classmethod
+    def from_ranges(cls, ranges: str) -> 'VlanSet':
+        """
+        Build from the range compressed string like '10-20,30'
+        """
+        vlan_set = cls()
+        for vlan_range in ranges.split(','):
+            vlan_range = vlan_range.strip()
+            if vlan_range:
+                vlan_set.add_range(vlan_range)
+        return vlan_set
+
+    def add(self, vlan) -> None:
+        vlan = int(vlan)
+        if vlan < self.MIN_VLAN or vlan > self.MAX_VLAN:
+            raise ValueError(f"VLAN {vlan} out of range")
+        self.bits |= 1 << vlan
+
+    def add_range(self, vlan_range: str) -> None:
+        """
+        Add '10-20' or '10'
+        """
+        first, _, last = vlan_range.partition('-')
+        first = int(first)
+        last = int(last) if last else first
+        if first < self.MIN_VLAN or last > self.MAX_VLAN or first > last:
+            raise ValueError(f"VLAN range {vlan_range} out of range")
+        self.bits |= ((1 << (last - first + 1)) - 1) << first
+
+    def update(self, vlans) -> None:
+        """
+        Add the VLANs of a VlanSet or an iterable of ids, numeric strings or range strings
+        """
+        if isinstance(vlans, VlanSet):
+            self.bits |= vlans.bits
+            return
+        for vlan in vlans:
+            if isinstance(vlan, str) and '-' in vlan:
+                self.add_range(vlan)
+            else:
+                self.add(vlan)
+
+    def discard(self, vlan) -> None:
+        self.bits &= ~(1 << int(vlan))
+
+    def copy(self) -> 'VlanSet':
+        return VlanSet.from_bits(self.bits)
+
+    def __contains__(self, vlan) -> bool:
+        return bool(self.bits >> int(vlan) & 1)
+
+    def __iter__(self):
+        # ascending order
+        bits = self.bits
+        while bits:
+            lowest = bits & -bits
+            yield lowest.bit_length() - 1
+            bits ^= lowest
+
+    def __len__(self) -> int:
+        return bin(self.bits).count('1')
+
+    def __bool__(self) -> bool:
+        return self.bits != 0
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, VlanSet):
+            return NotImplemented
+        return self.bits == other.bits
+
+    def __hash__(self) -> int:
+        return hash(self.bits)
+
+    def __or__(self, other: 'VlanSet') -> 'VlanSet':
+        return VlanSet.from_bits(self.bits | other.bits)
+
+    def __and__(self, other: 'VlanSet') -> 'VlanSet':
+        return VlanSet.from_bits(self.bits & other.bits)
+
+    def __sub__(self, other: 'VlanSet') -> 'VlanSet':
+        return VlanSet.from_bits(self.bits & ~other.bits)
+
+    def __xor__(self, other: 'VlanSet') -> 'VlanSet':
+        return VlanSet.from_bits(self.bits ^ other.bits)
+
+    def __ior__(self, other: 'VlanSet') -> 'VlanSet':
+        self.bits |= other.bits
+        return self
+
+    def __le__(self, other: 'VlanSet') -> bool:
+        return self.bits & ~other.bits == 0
+
+    def to_ranges(self) -> str:
+        """
+        The range compressed string like '10-20,30'
+        """
+        ranges = []
+        first = last = None
+        for vlan in self:
+            if last is not None and vlan == last + 1:
+                last = vlan
+                continue
+            if first is not None:
+                ranges.append(f"{first}-{last}" if first != last else f"{first}")
+            first = last = vlan
+        if first is not None:
+            ranges.append(f"{first}-{last}" if first != last else f"{first}")
+        return ','.join(ranges)
+
+    def __str__(self) -> str:
+        return self.to_ranges()
+
+    def __repr__(self) -> str:
+        return f"VlanSet('{self.to_ranges()}')"
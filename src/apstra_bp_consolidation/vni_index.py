@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import logging
+
+from apstra_bp_consolidation.apstra_blueprint import CkApstraBlueprint
+from apstra_bp_consolidation.fleet import map_concurrently, DEFAULT_MAX_WORKERS
+
+INDEX_FORMAT = 1
+DEFAULT_VNI_INDEX_FILE = 'vni_index.json'
+
+
+class CkVniIndex:
+    """
+    Persistent VNI -> { bp_label: [ vn node id ] } index across all the blueprints
+
+    The file keeps the per blueprint data with the blueprint version.
+    Only the blueprints whose version changed are pulled again on refresh.
+    """
+
+    def __init__(self, index_file: str = None) -> None:
+        self.index_file = index_file or DEFAULT_VNI_INDEX_FILE
+        self.logger = logging.getLogger('CkVniIndex')
+        self.blueprints = {}  # { bp_id: { label: <label>, version: <version>, vns: { vni: [ vn node id ] } } }
+        self.vni_2_blueprints = {}  # { vni: { bp_label: [ vn node id ] } }
+        self.load()
+
+    def load(self) -> None:
+        """
+        Load the index file if present
+        """
+        if not os.path.exists(self.index_file):
+            return
+        with open(self.index_file, 'r') as file:
+            data = json.load(file)
+        if data.get('format') != INDEX_FORMAT:
+            self.logger.warning(f"ignoring {self.index_file} of format {data.get('format')}")
+            return
+        # json keys are strings
+        self.blueprints = {
+            bp_id: dict(bp_data, vns={int(vni): vn_ids for vni, vn_ids in bp_data['vns'].items()})
+            for bp_id, bp_data in data['blueprints'].items()
+        }
+        self._build_inverted()
+
+    def save(self) -> None:
+        temp_file = f"{self.index_file}.tmp"
+        with open(temp_file, 'w') as file:
+            json.dump({'format': INDEX_FORMAT, 'blueprints': self.blueprints}, file)
+        os.replace(temp_file, self.index_file)
+
+    def _build_inverted(self) -> None:
+        vni_2_blueprints = {}
+        for bp_data in self.blueprints.values():
+            for vni, vn_ids in bp_data['vns'].items():
+                vni_2_blueprints.setdefault(vni, {})[bp_data['label']] = vn_ids
+        self.vni_2_blueprints = vni_2_blueprints
+
+    def refresh(self, session, max_workers: int = DEFAULT_MAX_WORKERS) -> int:
+        """
+        Pull the virtual networks of the new or changed blueprints concurrently and save the index
+
+        Return: the number of the blueprints pulled
+        """
+        bp_directory = session.blueprint_directory
+        bp_directory.refresh()
+        bp_id_list = bp_directory.list_ids()
+
+        # drop the deleted blueprints
+        for bp_id in [x for x in self.blueprints if x not in bp_id_list]:
+            del self.blueprints[bp_id]
+        bp_ids_to_pull = [
+            x for x in bp_id_list
+            if x not in self.blueprints or self.blueprints[x]['version'] is None or self.blueprints[x]['version'] != bp_directory.get_version(x)
+            ]
+        self.logger.info(f"{len(bp_id_list)=} {len(bp_ids_to_pull)=}")
+
+        def pull_vns(bp_id):
+            VN_ID = 'virtual_network'
+            this_bp = CkApstraBlueprint(session, None, bp_id)
+            vns = {}
+            # the VLAN type VNs have no vn_id
+            for vn_node in this_bp.query(f"node('{VN_ID}', vn_type='vxlan', name='{VN_ID}')"):
+                vns.setdefault(int(vn_node[VN_ID]['vn_id']), []).append(vn_node[VN_ID]['id'])
+            return vns
+
+        for bp_id, vns, exception in map_concurrently(pull_vns, bp_ids_to_pull, max_workers):
+            if exception is not None:
+                # keep the previous data. it will be pulled again next time
+                continue
+            self.blueprints[bp_id] = {
+                'label': bp_directory.get_label(bp_id),
+                'version': bp_directory.get_version(bp_id),
+                'vns': vns,
+            }
+
+        self._build_inverted()
+        self.save()
+        return len(bp_ids_to_pull)
+
+    def lookup(self, vni: int) -> dict:
+        """
+        Return { bp_label: [ vn node id ] } of the blueprints having the vni
+        """
+        return self.vni_2_blueprints.get(int(vni), {})
+
+    def has_blueprint(self, bp_label: str) -> bool:
+        return any(x['label'] == bp_label for x in self.blueprints.values())
+
+    def get_vnis(self, bp_label: str) -> set:
+        """
+        Return the set of the vnis of the blueprint
+        """
+        for bp_data in self.blueprints.values():
+            if bp_data['label'] == bp_label:
+                return set(bp_data['vns'])
+        return set()
+
+    def find_missing_vns(self, main_bp_label: str) -> dict:
+        """
+        Return { bp_label: [ vni ] } of the vnis absent in the main blueprint
+
+        Raise ValueError if the main blueprint is not in the index - every vni would be reported missing
+        """
+        if not self.has_blueprint(main_bp_label):
+            raise ValueError(f"{main_bp_label} is not in the vni index {self.index_file}")
+        main_vnis = self.get_vnis(main_bp_label)
+        missing = {}
+        for bp_data in self.blueprints.values():
+            missing_vnis = sorted(x for x in bp_data['vns'] if x not in main_vnis)
+            if missing_vnis:
+                missing[bp_data['label']] = missing_vnis
+        return missing
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import logging
+
+from apstra_bp_consolidation.batch_sizer import AdaptiveBatchSizer
+from apstra_bp_consolidation.ct_batch import apply_ct_assignments, DEFAULT_MAX_APPLICATION_POINTS
+
+
+class CkMainBlueprintWrites:
+    """
+    The planned mutations of many orders on the same main blueprint, folded into one write per target object
+
+    vn_access_switches: { <vni>: { <leaf rg id>: [ <access switch rg id> ] } } - the bound_to additions
+    ct_assignments: { <interface id>: { <ct id>: <used> } }
+    tags: { <node id>: set of <tag label> } - the tags to add
+    Each merged write is validated against the current spec before sending.
+    """
+
+    def __init__(self, the_bp) -> None:
+        self.the_bp = the_bp
+        self.logger = logging.getLogger(f"CkMainBlueprintWrites({the_bp.label})")
+        self.vn_access_switches = {}
+        self.ct_assignments = {}
+        self.tags = {}
+
+    def add_vn_access_switch(self, vni, leaf_rg_id: str, rg_id: str) -> None:
+        rg_ids = self.vn_access_switches.setdefault(vni, {}).setdefault(leaf_rg_id, [])
+        if rg_id not in rg_ids:
+            rg_ids.append(rg_id)
+
+    def add_ct_assignments(self, assignments: dict) -> None:
+        """
+        Merge { <interface id>: { <ct id>: <used> } }. Raise ValueError if two orders disagree on a CT of an interface
+        """
+        for interface_id, policies in assignments.items():
+            merged = self.ct_assignments.setdefault(interface_id, {})
+            for ct_id, used in policies.items():
+                if merged.get(ct_id, used) != used:
+                    raise ValueError(f"CT {ct_id} on {interface_id} is both applied and removed")
+                merged[ct_id] = used
+
+    def add_tags(self, node_ids: list, tags: list) -> None:
+        for node_id in node_ids:
+            self.tags.setdefault(node_id, set()).update(tags)
+
+    def flush_virtual_networks(self) -> int:
+        """
+        Fetch each VN once, add all the access switches to its bound_to and patch once
+
+        A VN is skipped if absent, if not a VXLAN VN, if a leaf pair is not in bound_to or has no access_switch_node_ids,
+        or if all the access switches are in already.
+        Raise ValueError with the VNIs of the failed PATCHes after trying all the VNs
+        Return: the number of the patched VNs
+        """
+        total_vni = len(self.vn_access_switches)
+        total_patched = 0
+        failed_vnis = []
+        for vni_count, (vni, leaf_additions) in enumerate(self.vn_access_switches.items(), start=1):
+            vn_spec = self.the_bp.get_virtual_network(vni)
+            if vn_spec is None:
+                self.logger.warning(f"{vni_count}/{total_vni} {vni=} absent -- skipping")
+                continue
+            if vn_spec.get('vn_type') != 'vxlan':
+                self.logger.error(f"{vni_count}/{total_vni} {vni=} is {vn_spec.get('vn_type')} -- skipping")
+                continue
+            bound_to_by_leaf = {x['system_id']: x for x in vn_spec['bound_to']}
+            missing_leafs = [x for x in leaf_additions if x not in bound_to_by_leaf]
+            if missing_leafs:
+                self.logger.warning(f"{vni_count}/{total_vni} {vni=} leaf pairs {missing_leafs} not found -- skipping")
+                continue
+            no_access_switch_leafs = [x for x in leaf_additions if not isinstance(bound_to_by_leaf[x].get('access_switch_node_ids'), list)]
+            if no_access_switch_leafs:
+                self.logger.error(f"{vni_count}/{total_vni} {vni=} leaf pairs {no_access_switch_leafs} have no access_switch_node_ids -- skipping")
+                continue
+            added = 0
+            for leaf_rg_id, rg_ids in leaf_additions.items():
+                access_switch_node_ids = bound_to_by_leaf[leaf_rg_id]['access_switch_node_ids']
+                new_rg_ids = [x for x in rg_ids if x not in access_switch_node_ids]
+                access_switch_node_ids.extend(new_rg_ids)
+                added += len(new_rg_ids)
+            if not added:
+                self.logger.debug(f"{vni_count}/{total_vni} {vni=} already in - skipping")
+                continue
+            # endpoint would fail due to missing label
+            del vn_spec['endpoints']
+            vn_patched = self.the_bp.patch_virtual_network(vn_spec)
+            if vn_patched.status_code >= 400:
+                self.logger.error(f"{vni_count}/{total_vni} {vni=} PATCH {vn_patched.status_code}: {vn_patched.text}")
+                failed_vnis.append(vni)
+                continue
+            total_patched += 1
+            self.logger.info(f"{vni_count}/{total_vni} {vni=} {added} access switches, {vn_patched.status_code=}")
+        self.logger.info(f"{total_vni=}, {total_patched=}")
+        if failed_vnis:
+            raise ValueError(f"failed to patch {len(failed_vnis)} VNs in {self.the_bp.label}: {failed_vnis}")
+        return total_patched
+
+    def flush_cts(self, sizer: AdaptiveBatchSizer = None, max_application_points: int = DEFAULT_MAX_APPLICATION_POINTS) -> int:
+        """
+        Apply the merged CT assignments, dropping the ones already in effect
+
+        Return: the number of the batch requests
+        """
+        if not self.ct_assignments:
+            return 0
+        current = self.the_bp.get_interfaces_cts(list(self.ct_assignments))
+        assignments = {}
+        for interface_id, policies in self.ct_assignments.items():
+            current_cts = current.get(interface_id, set())
+            changes = {ct_id: used for ct_id, used in policies.items() if used != (ct_id in current_cts)}
+            if changes:
+                assignments[interface_id] = changes
+        self.logger.info(f"{len(assignments)} of {len(self.ct_assignments)} interfaces need CT changes")
+        return apply_ct_assignments(self.the_bp, assignments, sizer, max_application_points)
+
+    def flush_tags(self) -> int:
+        """
+        Post the tags with one tagging request per distinct tag set
+
+        Return: the number of the tagging requests
+        """
+        nodes_by_tags = {}
+        for node_id, tags in self.tags.items():
+            nodes_by_tags.setdefault(frozenset(tags), []).append(node_id)
+        for tags, node_ids in nodes_by_tags.items():
+            # post_tagging skips if the tags are present on the nodes
+            self.the_bp.post_tagging(node_ids, tags_to_add=sorted(tags), tags_to_remove=[])
+        return len(nodes_by_tags)
+
+    def flush(self, sizer: AdaptiveBatchSizer = None, max_application_points: int = DEFAULT_MAX_APPLICATION_POINTS) -> None:
+        self.flush_virtual_networks()
+        self.flush_cts(sizer, max_application_points)
+        self.flush_tags()
+        self.vn_access_switches = {}
+        self.ct_assignments = {}
+        self.tags = {}
@@ -1,6 +1,6 @@
 import pytest
 
-from apstra_bp_consolidation.apstra_session import CkApstraSession
+from apstra_bp_consolidation.apstra_session import CkApstraSession, CkBlueprintDirectory
 
 class Data:
     apstra_host: str = '10.85.192.61'  # 4.1.2
@@ -34,3 +34,116 @@ def tor_bp():
 
 
 
+
+
+# the fakes of the offline tests
+
+class FakeResponse:
+    """
+    The requests response of the status code and the json data
+    """
+    def __init__(self, status_code: int = 200, data=None):
+        self.status_code = status_code
+        self.data = data if data is not None else {}
+        self.text = str(status_code) if data is None else str(data)
+
+    def json(self):
+        return self.data
+
+
+class FakeHttp:
+    """
+    The requests session. The handler of the method returns the data (or the FakeResponse) of the url and the json body
+
+    calls: [ ( <method>, <url> ) ]
+    """
+    def __init__(self, get=None, post=None, put=None):
+        self.handlers = {'get': get, 'post': post, 'put': put}
+        self.calls = []
+        self.hooks = {'response': []}
+
+    def request(self, method: str, url: str, json=None) -> FakeResponse:
+        self.calls.append((method, url))
+        handler = self.handlers[method]
+        data = handler(url, json) if handler else None
+        return data if isinstance(data, FakeResponse) else FakeResponse(201 if method == 'put' else 200, data)
+
+    def get(self, url, json=None):
+        return self.request('get', url, json)
+
+    def post(self, url, json=None):
+        return self.request('post', url, json)
+
+    def put(self, url, json=None):
+        return self.request('put', url, json)
+
+    def urls(self, method: str) -> list:
+        return [url for x, url in self.calls if x == method]
+
+    def bp_ids(self, method: str) -> list:
+        """
+        The blueprint ids of the calls to /blueprints/<id>/<endpoint>
+        """
+        return [x.split('/')[-2] for x in self.urls(method)]
+
+
+class FakeSession:
+    """
+    The controller of the blueprints { <id>: <version> } labeled bp-<id>
+
+    items: the items of the other listings (like the logical devices)
+    """
+    url_prefix = 'https://apstra/api'
+
+    def __init__(self, versions: dict = None, items: list = None, get=None, post=None, put=None):
+        self.versions = versions if versions is not None else {}
+        self.items = items
+        self.listings = 0
+        self.latency_stats = None
+        self.session = FakeHttp(get, post, put)
+        self.blueprint_directory = CkBlueprintDirectory(self)
+
+    def get_items(self, url):
+        if url != 'blueprints':
+            return {'items': self.items or []}
+        self.listings += 1
+        return {'items': [{'id': x, 'label': f"bp-{x}", 'version': y} for x, y in self.versions.items()]}
+
+
+class FakeBlueprint:
+    """
+    The blueprint answering the graph queries by the rules and recording the writes
+
+    rules: [ ( <substring of the query>, <rows or function of the query> ) ]. The first match wins. [] without a match
+    """
+    def __init__(self, label: str = 'main-bp', rules: list = None, status_code: int = 202, session=None, bp_id: str = None):
+        self.label = label
+        self.id = bp_id or label
+        self.session = session
+        self.rules = rules or []
+        self.status_code = status_code
+        self.queries = []
+        self.writes = []  # [ ( <method>, <spec> ) ]
+
+    def query(self, query_string: str, print_prefix: str = None, multiline: bool = False) -> list:
+        self.queries.append(query_string)
+        for pattern, rows in self.rules:
+            if pattern in query_string:
+                return rows(query_string) if callable(rows) else rows
+        return []
+
+    def write(self, method: str, spec) -> FakeResponse:
+        self.writes.append((method, spec))
+        return FakeResponse(self.status_code)
+
+    def patch_nodes(self, patch_spec, params=None):
+        return self.write('patch_nodes', patch_spec)
+
+    def patch_virtual_network(self, patch_spec, params=None):
+        return self.write('patch_virtual_network', patch_spec)
+
+    def batch(self, batch_spec: dict, params=None):
+        return self.write('batch', batch_spec)
+
+    def post_tagging(self, nodes, tags_to_add=None, tags_to_remove=None, params=None, print_prefix=None):
+        return self.write('post_tagging', (sorted(nodes), tags_to_add))
@@ -0,0 +1,126 @@
+import pytest
+
+from apstra_bp_consolidation.consolidation import cli
+from apstra_bp_consolidation.cabling_maps import collect_cabling_maps, CkCablingMapIndex
+from apstra_bp_consolidation.move_access_switch import get_tor_interface_nodes_from_cabling_maps, pull_tor_interface_nodes_in_main
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from tests.conftest import FakeSession, FakeBlueprint
+
+
+def build_session(versions: dict) -> FakeSession:
+    """
+    The cabling map of each blueprint with a switch interface in the EVPN AE. The blueprints in session.failing fail
+    """
+    session = FakeSession(versions)
+    session.failing = set()
+
+    def get_cabling_map(url, json):
+        bp_id = url.split('/')[-2]
+        if bp_id in session.failing:
+            raise ConnectionError(bp_id)
+        return {'links': [{
+            'id': f"link-{bp_id}",
+            'speed': '10G',
+            'endpoints': [
+                {'system': {'id': 'sw-id', 'label': 'sw-a'}, 'interface': {'id': f"if-{bp_id}", 'if_name': 'xe-0/0/1'}},
+                {'system': {'id': 'srv-id', 'label': 'srv1'}, 'interface': {'if_name': 'eth0'}},
+            ]}]}
+
+    def get_evpn_members(url, json):
+        bp_id = url.split('/')[-2]
+        return {'items': [{CkEnum.EVPN_INTERFACE: {'id': f"ae-{bp_id}"}, CkEnum.MEMBER_INTERFACE: {'id': f"if-{bp_id}"}}]}
+
+    session.session.handlers.update(get=get_cabling_map, post=get_evpn_members)
+    return session
+
+
+def test_14_incremental_cabling_maps(tmp_path):
+    yaml_file = str(tmp_path / 'cabling-maps.yaml')
+    session = build_session({'1': 10, '2': 20, '3': 30})
+    collect_cabling_maps(session, yaml_file, max_workers=2)
+    assert sorted(session.session.bp_ids('get')) == ['1', '2', '3']
+
+    # only the changed blueprint is pulled, the others are copied by the byte range
+    session.versions['2'] = 21
+    session.session.calls = []
+    new_index = collect_cabling_maps(session, yaml_file, max_workers=2, incremental=True)
+    assert session.session.bp_ids('get') == ['2']
+    assert new_index['2']['version'] == 21
+    cabling_map_index = CkCablingMapIndex(yaml_file)
+    for bp_id in ['1', '2', '3']:
+        assert cabling_map_index.lookup(f"bp-{bp_id}", 'sw-a', 'xe-0/0/1')['interface_id'] == f"if-{bp_id}"
+    assert cabling_map_index.lookup('bp-1', 'srv1', 'eth0')['peer_if_name'] == 'xe-0/0/1'
+
+def test_15_cabling_maps_failed_pull(tmp_path):
+    yaml_file = str(tmp_path / 'cabling-maps.yaml')
+    session = build_session({'1': 10, '2': 20})
+    collect_cabling_maps(session, yaml_file, max_workers=2)
+
+    # the failed blueprint keeps the previous entry
+    session.versions['2'] = 21
+    session.failing.add('2')
+    new_index = collect_cabling_maps(session, yaml_file, max_workers=2, incremental=True)
+    assert new_index['2']['version'] == 20
+    assert CkCablingMapIndex(yaml_file).lookup('bp-2', 'sw-a', 'xe-0/0/1')['link_id'] == 'link-2'
+
+    # a new blueprint failing leaves the previous file untouched
+    with open(yaml_file, 'rb') as file:
+        previous = file.read()
+    session.versions['3'] = 30
+    session.failing.add('3')
+    with pytest.raises(ValueError):
+        collect_cabling_maps(session, yaml_file, max_workers=2, incremental=True)
+    with open(yaml_file, 'rb') as file:
+        assert file.read() == previous
+
+def test_16_tor_links_from_cabling_maps(tmp_path):
+    yaml_file = str(tmp_path / 'cabling-maps.yaml')
+    collect_cabling_maps(build_session({'1': 10}), yaml_file, max_workers=1)
+    tor_interface_nodes = get_tor_interface_nodes_from_cabling_maps(CkCablingMapIndex(yaml_file), 'bp-1', 'srv1')
+    assert len(tor_interface_nodes) == 1
+    assert tor_interface_nodes[0][CkEnum.GENERIC_SYSTEM_INTERFACE]['if_name'] == 'eth0'
+    assert tor_interface_nodes[0][CkEnum.LINK] == {'id': 'link-1', 'speed': '10G'}
+    assert tor_interface_nodes[0][CkEnum.MEMBER_INTERFACE] == {'id': 'if-1', 'if_name': 'xe-0/0/1'}
+    assert tor_interface_nodes[0][CkEnum.MEMBER_SWITCH] == {'id': 'sw-id', 'label': 'sw-a'}
+    assert tor_interface_nodes[0][CkEnum.EVPN_INTERFACE] == {'id': 'ae-1'}
+    assert get_tor_interface_nodes_from_cabling_maps(CkCablingMapIndex(yaml_file), 'bp-1', 'srv2') == []
+    assert 'move-access-switches' in cli.commands
+
+
+class FakeMainBlueprint(FakeBlueprint):
+    def __init__(self, session, bp_id: str):
+        super().__init__(f"bp-{bp_id}", session=session, bp_id=bp_id)
+        self.queried = []
+
+    def get_version(self):
+        return self.session.blueprint_directory.get_version(self.id)
+
+    def get_server_interface_nodes(self, system_label):
+        self.queried.append(system_label)
+        return []
+
+
+class FakeOrder:
+    def __init__(self, session, main_bp, tor_label: str, cabling_maps_yaml_file: str):
+        self.session = session
+        self.main_bp = main_bp
+        self.tor_label = tor_label
+        self.cabling_maps_yaml_file = cabling_maps_yaml_file
+
+
+def test_17_fleet_tor_links_from_cabling_maps(tmp_path):
+    yaml_file = str(tmp_path / 'cabling-maps.yaml')
+    session = build_session({'1': 10, '2': 20})
+    collect_cabling_maps(session, yaml_file, max_workers=1)
+    # bp-2 changed since the collection
+    session.versions['2'] = 21
+    main_bps = [FakeMainBlueprint(session, x) for x in ['1', '2']]
+    orders = [
+        FakeOrder(session, main_bps[0], 'srv1', yaml_file),
+        FakeOrder(session, main_bps[0], 'srv2', yaml_file),
+        FakeOrder(session, main_bps[1], 'srv3', yaml_file),
+    ]
+    tor_interface_nodes = pull_tor_interface_nodes_in_main(orders)
+    assert len(tor_interface_nodes['srv1']) == 1 and tor_interface_nodes['srv2'] == []
+    assert main_bps[0].queried == []
+    assert main_bps[1].queried == ['srv3']
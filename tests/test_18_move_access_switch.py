@@ -0,0 +1,95 @@
+import pytest
+
+from apstra_bp_consolidation.consolidation import cli
+from apstra_bp_consolidation import move_access_switch
+from apstra_bp_consolidation.move_access_switch import create_new_access_switch_pair, patch_access_switch_pairs
+from apstra_bp_consolidation.switch_templates import CkSwitchTemplateRegistry, InterfaceNameRules, SwitchPairTemplate
+from tests.conftest import FakeBlueprint
+
+
+class FakeOrder:
+    tor_label = 'r4r17'
+    switch_label_pair = ['r4r17a', 'r4r17b']
+
+    def __init__(self, main_bp):
+        self.main_bp = main_bp
+
+
+class FakeMainBlueprint(FakeBlueprint):
+    """
+    The main blueprint with the systems of the labels and the redundancy group
+    """
+    def __init__(self, system_labels: list, rg_label: str = 'rg-0', patch_status: int = 202, labels_show_up: bool = True):
+        super().__init__(status_code=patch_status, rules=[('', self.query_main)])
+        self.system_labels = system_labels
+        self.rg_label = rg_label
+        self.labels_show_up = labels_show_up
+        self.created = []
+
+    def query_main(self, query_string: str) -> list:
+        if query_string.startswith("node('redundancy_group'"):
+            return [{'redundancy_group': {'id': 'rg', 'label': self.rg_label}}] if f"'{self.rg_label}'" in query_string else []
+        if query_string.startswith('node(label=is_in('):
+            return [{'node': {}}] * 3 if self.labels_show_up else []
+        return [
+            {'leaf': {'id': f"id-{x}", 'label': x}, 'redundancy_group': {'id': 'rg', 'label': self.rg_label}}
+            for x in self.system_labels if f"'{x}'" in query_string
+        ]
+
+    def get_system_node_from_label(self, system_label):
+        return {'id': system_label, 'label': system_label} if system_label in self.system_labels else None
+
+    def add_generic_system(self, gs_spec: dict, check_existing: bool = True) -> list:
+        self.created.append(gs_spec)
+        return ['link-0']
+
+
+def test_18_access_switch_pair_rerun():
+    # renamed by a previous run
+    main_bp = FakeMainBlueprint(['r4r17a', 'r4r17b'])
+    assert create_new_access_switch_pair(FakeOrder(main_bp), {}) == []
+    main_bp = FakeMainBlueprint(['spine1'], rg_label='r4r17-pair')
+    assert create_new_access_switch_pair(FakeOrder(main_bp), {}) == []
+
+    # created by a previous run stopped before the renames
+    main_bp = FakeMainBlueprint(['r4r171', 'r4r172'])
+    node_patches = create_new_access_switch_pair(FakeOrder(main_bp), {})
+    assert main_bp.created == []
+    assert node_patches == [
+        {'id': 'rg', 'label': 'r4r17-pair'},
+        {'id': 'id-r4r171', 'label': 'r4r17a', 'hostname': 'r4r17a'},
+        {'id': 'id-r4r172', 'label': 'r4r17b', 'hostname': 'r4r17b'},
+    ]
+    assert 'move-access-switches' in cli.commands
+
+def test_19_patch_access_switch_pairs(monkeypatch):
+    monkeypatch.setattr(move_access_switch.time, 'sleep', lambda x: None)
+    node_patches = [{'id': 'rg', 'label': 'r4r17-pair'}, {'id': 'a', 'label': 'r4r17a'}, {'id': 'b', 'label': 'r4r17b'}]
+    patch_access_switch_pairs(FakeMainBlueprint([]), node_patches)
+    with pytest.raises(ValueError, match='422'):
+        patch_access_switch_pairs(FakeMainBlueprint([], patch_status=422), node_patches)
+    with pytest.raises(ValueError, match='not in main-bp'):
+        patch_access_switch_pairs(FakeMainBlueprint([], labels_show_up=False), node_patches)
+
+def test_20_switch_pair_templates(monkeypatch, tmp_path):
+    # the default template is the package data
+    monkeypatch.chdir(tmp_path)
+    registry = CkSwitchTemplateRegistry()
+    model = next(iter(registry.templates))
+    new_systems = registry.get(model).build_new_systems('r4r17')
+    assert new_systems[0]['label'] == 'r4r17'
+    assert new_systems[0]['interface_map']['label'] == model
+    with pytest.raises(ValueError, match='already loaded'):
+        registry.load(registry.get(model).file)
+    with pytest.raises(ValueError, match='no switch pair template'):
+        registry.get('unknown')
+    with pytest.raises(ValueError, match='not found'):
+        registry.load('missing.json')
+    with pytest.raises(ValueError, match='has no peer_links'):
+        SwitchPairTemplate.validate('bad.json', {'new_systems': [{'interface_map': {'label': model}}]})
+
+    interface_name_rules = InterfaceNameRules()
+    assert interface_name_rules.translate('et-0/0/48-a') == ('first', 'et-0/0/48')
+    assert interface_name_rules.translate('et-0/0/49b') == ('second', 'et-0/0/49')
+    with pytest.raises(ValueError):
+        interface_name_rules.translate('et-0/0/50a')
@@ -0,0 +1,40 @@
+from apstra_bp_consolidation import apstra_session
+from apstra_bp_consolidation.apstra_session import CkBlueprintDirectory
+from apstra_bp_consolidation.apstra_blueprint import CkApstraBlueprint
+from tests.conftest import FakeSession
+
+
+def test_22_blueprint_directory(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(apstra_session.time, 'time', lambda: now[0])
+    session = FakeSession({'1': 1})
+    bp_directory = CkBlueprintDirectory(session, max_age=300, min_refresh_interval=5)
+    assert bp_directory.get_id('bp-1') == '1'
+    assert bp_directory.get_label('1') == 'bp-1'
+    assert session.listings == 1
+
+    # a miss right after the listing is not pulled again
+    session.versions['2'] = 1
+    assert bp_directory.get_id('bp-2') is None
+    assert session.listings == 1
+
+    # a miss after min_refresh_interval pulls again
+    now[0] += 10
+    assert bp_directory.resolve_labels(['bp-1', 'bp-2']) == {'bp-1': '1', 'bp-2': '2'}
+    assert session.listings == 2
+
+    # older than max_age
+    now[0] += 301
+    assert bp_directory.get_version('2') == 1
+    assert session.listings == 3
+
+def test_23_blueprint_created_just_now(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(apstra_session.time, 'time', lambda: now[0])
+    session = FakeSession({'1': 1})
+    assert CkApstraBlueprint(session, 'bp-1').id == '1'
+    # created after the listing, within min_refresh_interval. the miss pulls the listing again
+    session.versions['2'] = 1
+    assert CkApstraBlueprint(session, 'bp-2').id == '2'
+    assert CkApstraBlueprint(session, None, '2').label == 'bp-2'
+    assert session.listings == 2
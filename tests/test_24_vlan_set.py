@@ -0,0 +1,35 @@
+import pytest
+
+from apstra_bp_consolidation.vlan_set import VlanSet
+
+
+def test_24_vlan_set_build():
+    vlans = VlanSet([30, 10, '11', 10, '12-14'])
+    assert list(vlans) == [10, 11, 12, 13, 14, 30]
+    assert len(vlans) == 6
+    assert 12 in vlans and 15 not in vlans
+    assert vlans.to_ranges() == '10-14,30'
+    assert VlanSet.from_ranges('10-14,30') == vlans
+    assert not VlanSet()
+
+def test_25_vlan_set_operations():
+    a = VlanSet.from_ranges('1-10')
+    b = VlanSet.from_ranges('5-15')
+    assert (a | b).to_ranges() == '1-15'
+    assert (a - b).to_ranges() == '1-4'
+    assert (a & b).to_ranges() == '5-10'
+    assert (a & b) <= a
+    assert hash(VlanSet([1, 2])) == hash(VlanSet.from_ranges('1-2'))
+    assert len({VlanSet([1, 2]), VlanSet([2, 1]), VlanSet([3])}) == 2
+
+def test_26_vlan_set_range_check():
+    assert list(VlanSet(['1', '4094'])) == [1, 4094]
+    for vlan in [0, 4095, 4096]:
+        with pytest.raises(ValueError):
+            VlanSet([vlan])
+    with pytest.raises(ValueError):
+        VlanSet.from_ranges('0-10')
+    with pytest.raises(ValueError):
+        VlanSet.from_ranges('4000-4095')
+    with pytest.raises(ValueError):
+        VlanSet.from_ranges('20-10')
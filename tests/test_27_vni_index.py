@@ -0,0 +1,65 @@
+import pytest
+
+from apstra_bp_consolidation.consolidation import cli
+from apstra_bp_consolidation.vni_index import CkVniIndex
+from apstra_bp_consolidation.find_missing_vn import order_find_missing_vn
+from tests.conftest import FakeSession, FakeBlueprint
+
+
+def build_session(vnis: dict) -> FakeSession:
+    """
+    The virtual networks of each blueprint { bp_id: [ vni ] } in session.vnis
+    """
+    session = FakeSession({x: 1 for x in vnis})
+    session.vnis = vnis
+
+    def query_virtual_networks(url, json):
+        bp_id = url.split('/')[-2]
+        vns = [{'virtual_network': {'id': f"vn-{vni}-{bp_id}", 'vn_id': str(vni), 'vn_type': 'vxlan'}} for vni in session.vnis[bp_id]]
+        if "vn_type='vxlan'" not in json['query']:
+            vns.append({'virtual_network': {'id': f"vlan-{bp_id}", 'vn_id': None, 'vn_type': 'vlan'}})
+        return {'items': vns}
+
+    session.session.handlers['post'] = query_virtual_networks
+    return session
+
+
+def test_27_vni_index(tmp_path):
+    index_file = str(tmp_path / 'vni_index.json')
+    session = build_session({'main': [10010, 10011], 'tor': [10011, 10012]})
+    vni_index = CkVniIndex(index_file)
+    assert vni_index.refresh(session, max_workers=2) == 2
+    assert vni_index.lookup(10011) == {'bp-main': ['vn-10011-main'], 'bp-tor': ['vn-10011-tor']}
+    assert vni_index.find_missing_vns('bp-main') == {'bp-tor': [10012]}
+
+    # only the changed blueprint is pulled again, the others from the file
+    session.vnis['tor'].append(10013)
+    session.versions['tor'] = 2
+    session.session.calls = []
+    vni_index = CkVniIndex(index_file)
+    assert vni_index.refresh(session, max_workers=2) == 1
+    assert session.session.bp_ids('post') == ['tor']
+    assert vni_index.get_vnis('bp-tor') == {10011, 10012, 10013}
+
+def test_28_find_missing_vn_main_bp_absent(tmp_path):
+    index_file = str(tmp_path / 'vni_index.json')
+    session = build_session({'tor': [10011, 10012]})
+    vni_index = CkVniIndex(index_file)
+    vni_index.refresh(session, max_workers=1)
+    with pytest.raises(ValueError, match='bp-main is not in the vni index'):
+        vni_index.find_missing_vns('bp-main')
+
+    class FakeOrder:
+        vni_index_file = index_file
+        max_workers = 1
+        main_bp = FakeBlueprint('bp-main')
+
+    # the main blueprint created after the index. the index is refreshed even without refresh
+    session.vnis['main'] = [10011]
+    session.versions['main'] = 1
+    FakeOrder.session = session
+    session.session.calls = []
+    order_find_missing_vn(FakeOrder(), refresh=False)
+    assert session.session.bp_ids('post') == ['main']
+    assert CkVniIndex(index_file).find_missing_vns('bp-main') == {'bp-tor': [10012]}
+    assert 'find-missing-vns' in cli.commands
@@ -0,0 +1,51 @@
+from apstra_bp_consolidation.consolidation import cli
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.inventory import CkInventory
+from tests.conftest import FakeSession
+
+
+def query_blueprint(url, json):
+    """
+    The graph query results of each blueprint by the first node of the query
+    """
+    bp_id = url.split('/')[-2]
+    query = json['query']
+    items = []
+    if query.startswith("node('system', name='system')"):
+        items = [{'system': {'id': f"gs-{bp_id}", 'label': 'srv1', 'system_type': 'server'}}]
+    elif query.startswith('match(') and f"name='{CkEnum.GENERIC_SYSTEM}'" in query:
+        items = [{
+            CkEnum.GENERIC_SYSTEM: {'label': 'srv1'},
+            CkEnum.GENERIC_SYSTEM_INTERFACE: {'if_name': 'eth0'},
+            CkEnum.LINK: {'id': f"link-{bp_id}", 'speed': '10G'},
+            CkEnum.MEMBER_INTERFACE: {'if_name': 'xe-0/0/1'},
+            CkEnum.MEMBER_SWITCH: {'label': f"sw-{bp_id}"},
+            CkEnum.EVPN_INTERFACE: None,
+        }]
+    elif query.startswith("node('virtual_network'"):
+        items = [{'vn': {'id': 'vn-1', 'vn_id': '10010', 'label': 'vn10'}}]
+        if "vn_type='vxlan'" not in query:
+            items.append({'vn': {'id': 'vlan-1', 'vn_id': None, 'label': 'vlan'}})
+    elif 'vn_instance' in query:
+        items = [{'system': {'label': f"sw-{bp_id}"}, 'vn': {'vn_id': '10010'}}]
+    return {'items': items}
+
+
+def test_29_inventory(tmp_path):
+    db_file = str(tmp_path / 'inventory.sqlite3')
+    session = FakeSession({'1': 10, '2': 20}, post=query_blueprint)
+    inventory = CkInventory(db_file)
+    assert inventory.refresh(session, max_workers=2) == 2
+    assert [x['switch_label'] for x in inventory.where_connected('srv1')] == ['sw-1', 'sw-2']
+    assert [x['system_label'] for x in inventory.systems_with_vni(10010)] == ['sw-1', 'sw-2']
+    assert [x['blueprint'] for x in inventory.blueprints_with_generic_system('srv1')] == ['bp-1', 'bp-2']
+
+    # the changed blueprint is pulled again and the deleted one is dropped
+    del session.versions['2']
+    session.versions['1'] = 11
+    session.session.calls = []
+    assert inventory.refresh(session, max_workers=2) == 1
+    assert set(session.session.bp_ids('post')) == {'1'}
+    assert [x['blueprint'] for x in inventory.where_connected('srv1')] == ['bp-1']
+    inventory.close()
+    assert 'inventory' in cli.commands
@@ -0,0 +1,81 @@
+import os
+import logging
+import threading
+
+from apstra_bp_consolidation import daemon
+from apstra_bp_consolidation.consolidation import cli
+from apstra_bp_consolidation.daemon import DaemonServer, ConsolidationDaemon, send_command, SESSION_SETTINGS
+
+
+class FakeDaemon:
+    """
+    The steps of the warm order
+    """
+    def __init__(self):
+        self.logger = logging.getLogger('FakeDaemon')
+        self.steps = []
+
+    def status(self) -> dict:
+        return {'steps': self.steps}
+
+    def reload(self) -> None:
+        self.steps = []
+
+    def run_step(self, step: str) -> None:
+        self.steps.append(step)
+        logging.getLogger('step').info(f"running {step}")
+        if step == 'move-devices':
+            raise ValueError('deploy failed')
+
+
+def test_30_daemon_commands(tmp_path):
+    socket_file = str(tmp_path / 'daemon.sock')
+    server = DaemonServer(socket_file, FakeDaemon())
+
+    def serve():
+        while not server.stop_requested:
+            server.handle_request()
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    try:
+        assert send_command(socket_file, 'move-cts')['result'] == 'ok'
+        assert send_command(socket_file, 'status') == {'result': 'ok', 'status': {'steps': ['move-cts']}}
+        result = send_command(socket_file, 'move-devices')
+        assert result['result'] == 'error' and 'deploy failed' in result['error']
+        assert send_command(socket_file, 'unknown') == {'result': 'error', 'error': 'unknown command unknown'}
+        assert send_command(socket_file, 'stop')['result'] == 'ok'
+    finally:
+        server.stop_requested = True
+        thread.join()
+        server.server_close()
+    assert 'daemon' in cli.commands
+
+def test_31_daemon_session_settings(tmp_path, monkeypatch):
+    class FakeOrder:
+        # a new session unless one is given
+        def __init__(self, env_file, session=None, blueprint_cache=None):
+            self.session = session or object()
+            blueprint_cache.setdefault('main-bp', self.session)
+
+    monkeypatch.setattr(daemon, 'ConsolidationOrder', FakeOrder)
+    # restored after the test. load_dotenv sets them in os.environ
+    for setting in SESSION_SETTINGS + ['config_yaml_input_file', 'max_workers']:
+        monkeypatch.setenv(setting, '')
+    env_file = tmp_path / '.env'
+
+    def write_env(host: str, mtime: int) -> None:
+        env_file.write_text(f"apstra_server_host={host}\napstra_server_username=admin\n")
+        os.utime(env_file, (mtime, mtime))
+
+    write_env('10.0.0.1', 1000)
+    consolidation_daemon = ConsolidationDaemon(str(env_file))
+    session = consolidation_daemon.get_order().session
+    # another change of the env file keeps the session
+    env_file.write_text(env_file.read_text() + "max_workers=4\n")
+    os.utime(env_file, (2000, 2000))
+    assert consolidation_daemon.get_order().session is session
+    # another server
+    write_env('10.0.0.2', 3000)
+    assert consolidation_daemon.get_order().session is not session
+    assert consolidation_daemon.blueprint_cache['main-bp'] is consolidation_daemon.session
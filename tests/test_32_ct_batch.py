@@ -0,0 +1,71 @@
+import collections
+
+import pytest
+
+from apstra_bp_consolidation.ct_batch import iter_application_points, take_application_points, apply_ct_assignments, diff_ct_assignments
+from apstra_bp_consolidation.batch_sizer import AdaptiveBatchSizer
+from tests.conftest import FakeResponse, FakeBlueprint
+
+
+def test_32_take_application_points():
+    assignments = {f"if{i}": {'ct1': True, 'ct2': True} for i in range(5)}
+    assignments['big'] = {f"ct{i}": True for i in range(7)}
+    pending = collections.deque(iter_application_points(assignments, max_policies=10))
+    payloads = []
+    while pending:
+        payloads.append(take_application_points(pending, max_application_points=3, max_policies=5))
+    points = [x for payload in payloads for x in payload]
+    assert sum(len(x['policies']) for x in points) == 17
+    for payload in payloads:
+        ids = [x['id'] for x in payload]
+        assert len(ids) == len(set(ids)) <= 3
+        assert sum(len(x['policies']) for x in payload) <= 5
+
+def test_33_diff_ct_assignments():
+    assignments = {'if1': {'ct1': True, 'ct2': True}, 'if2': {'ct1': True}}
+    current = {'if1': {'ct2', 'ct3', 'foreign'}, 'if2': {'ct1', 'foreign'}}
+    # the CT not managed by move-cts survives
+    assert diff_ct_assignments(assignments, current, {'ct1', 'ct2', 'ct3'}) == {'if1': {'ct1': True, 'ct3': False}}
+    assert diff_ct_assignments(assignments, current) == {'if1': {'ct1': True}}
+
+def test_34_adaptive_batch_sizer():
+    sizer = AdaptiveBatchSizer(initial=50, minimum=10, maximum=60, target_latency=1.0)
+    assert sizer.record(0.1) == 60
+    assert sizer.record(0.1) == 60
+    assert sizer.record(2.0) == 45
+    assert sizer.record(0.1, throttled=True) == 22
+    for _ in range(5):
+        sizer.record(0.1, throttled=True)
+    assert sizer.size == 10
+
+class FakeBatchBlueprint(FakeBlueprint):
+    """
+    Fail the batches carrying the bad interface
+    """
+    def __init__(self, bad_interface: str = None):
+        super().__init__()
+        self.bad_interface = bad_interface
+        self.applied = []
+        self.sent = []
+
+    def batch(self, batch_spec: dict, params=None):
+        points = batch_spec['operations'][0]['payload']['application_points']
+        self.sent.append([x['id'] for x in points])
+        if any(x['id'] == self.bad_interface for x in points):
+            return FakeResponse(422)
+        self.applied.extend(points)
+        return FakeResponse(202)
+
+def test_35_apply_ct_assignments_failure():
+    assignments = {f"if{i}": {f"ct{i}": True} for i in range(8)}
+    the_bp = FakeBatchBlueprint()
+    apply_ct_assignments(the_bp, assignments, AdaptiveBatchSizer(initial=4, minimum=1, maximum=4))
+    assert sorted(x['id'] for x in the_bp.applied) == sorted(assignments)
+
+    # the batch of the bad interface shrinks until it is isolated. the others are applied
+    the_bp = FakeBatchBlueprint('if0')
+    sizer = AdaptiveBatchSizer(initial=4, minimum=1, maximum=4)
+    with pytest.raises(ValueError, match='if0'):
+        apply_ct_assignments(the_bp, assignments, sizer)
+    assert sorted(x['id'] for x in the_bp.applied) == sorted(x for x in assignments if x != 'if0')
+    assert [x for x in the_bp.sent if 'if0' in x] == [['if0', 'if1', 'if2', 'if3'], ['if0', 'if1'], ['if0']]
@@ -0,0 +1,120 @@
+from apstra_bp_consolidation.consolidation import cli
+from apstra_bp_consolidation.move_ct import pull_interface_vlan_table, update_interface_id
+from apstra_bp_consolidation.move_ct import build_multi_vlan_assignments, get_multi_vlan_ct_label, get_managed_ct_ids, VniCt
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.models import InterfaceVlans
+from apstra_bp_consolidation.vlan_set import VlanSet
+from tests.conftest import FakeBlueprint
+
+
+def build_tor_bp() -> FakeBlueprint:
+    """
+    The rows of the narrow queries of pull_interface_vlan_table
+    """
+    switch = {'label': 'sw-a'}
+    ai_vlan_rows = [
+        {'ep_application_instance': {'id': 'ai-1'}, 'AttachSingleVLAN': {'attributes': 'vlan_tagged'}, 'virtual_network': {'vn_id': '100010'}},
+        {'ep_application_instance': {'id': 'ai-1'}, 'AttachSingleVLAN': {'attributes': 'untagged'}, 'virtual_network': {'vn_id': '100020'}},
+        {'ep_application_instance': {'id': 'ai-3'}, 'AttachSingleVLAN': {'attributes': 'vlan_tagged'}, 'virtual_network': {'vn_id': '100030'}},
+    ]
+    ai_interface_rows = [
+        {'ep_application_instance': {'id': 'ai-1'}, 'interface': {'id': 'if-1', 'if_name': 'xe-0/0/1'}, 'switch': switch},
+        # ai-2 is a CT without the single VLAN policy
+        {'ep_application_instance': {'id': 'ai-2'}, 'interface': {'id': 'if-2', 'if_name': 'xe-0/0/2'}, 'switch': switch},
+        {'ep_application_instance': {'id': 'ai-2'}, 'interface': {'id': 'ae-2', 'if_name': None}, 'switch': None},
+        {'ep_application_instance': {'id': 'ai-3'}, 'interface': {'id': 'ae-3', 'if_name': None}, 'switch': None},
+    ]
+    ae_member_rows = [
+        {CkEnum.EVPN_INTERFACE: {'id': ae_id}, CkEnum.MEMBER_INTERFACE: {'if_name': 'xe-0/0/9'}, CkEnum.MEMBER_SWITCH: switch}
+        for ae_id in ['ae-2', 'ae-3']
+    ]
+    return FakeBlueprint('tor-bp', [
+        ("AttachMultipleVLAN", []),
+        ("po_control_protocol='evpn'", ae_member_rows),
+        ("policy_type_name='batch'", ai_interface_rows),
+        ('', ai_vlan_rows),
+    ])
+
+
+def test_36_interface_vlan_table_join():
+    interface_vlan_table = pull_interface_vlan_table(build_tor_bp(), ['sw-a', 'sw-b'])
+    # the interfaces of the CT without the single VLAN policy are absent
+    assert list(interface_vlan_table['sw-a']) == ['xe-0/0/1']
+    assert list(interface_vlan_table[CkEnum.REDUNDANCY_GROUP]) == ['ae-3']
+    if_vlans = interface_vlan_table['sw-a']['xe-0/0/1']
+    assert (list(if_vlans.tagged_vlans), if_vlans.untagged_vlan, if_vlans.id) == ([10], 20, 'if-1')
+    assert list(interface_vlan_table[CkEnum.REDUNDANCY_GROUP]['ae-3'].tagged_vlans) == [30]
+    assert 'move-cts' in cli.commands
+
+def test_37_update_interface_id():
+    ae_vlans = InterfaceVlans(member_interfaces={'sw-a': ['xe-0/0/1'], 'sw-b': ['xe-0/0/1']})
+    interface_vlan_table = {CkEnum.REDUNDANCY_GROUP: {'ae-tor': ae_vlans}, 'sw-a': {'xe-0/0/2': InterfaceVlans(id='if-tor')}}
+    rows = [
+        {'switch': {'label': 'sw-a'}, 'member-interface': {'id': 'm-a1', 'if_name': 'xe-0/0/1'}, 'evpn-interface': {'id': 'ae-main'}},
+        {'switch': {'label': 'sw-b'}, 'member-interface': {'id': 'm-b1', 'if_name': 'xe-0/0/1'}, 'evpn-interface': {'id': 'ae-main'}},
+        {'switch': {'label': 'sw-a'}, 'member-interface': {'id': 'if-main', 'if_name': 'xe-0/0/2'}, 'evpn-interface': None},
+        # no VLAN assignment in the TOR blueprint
+        {'switch': {'label': 'sw-a'}, 'member-interface': {'id': 'if-other', 'if_name': 'xe-0/0/3'}, 'evpn-interface': None},
+    ]
+
+    interface_id_table = update_interface_id(FakeBlueprint(rules=[('', rows)]), interface_vlan_table, ['sw-a', 'sw-b'])
+    assert interface_id_table == {CkEnum.REDUNDANCY_GROUP: {'ae-tor': 'ae-main'}, 'sw-a': {'xe-0/0/2': 'if-main'}}
+    # the TOR blueprint data is not modified
+    assert interface_vlan_table['sw-a']['xe-0/0/2'].id == 'if-tor'
+
+class FakeMultiVlanBlueprint(FakeBlueprint):
+    """
+    The VNs of the VLANs 10, 11 and 20 and the multiple VLAN CT of the VLANs 10-11
+    """
+    def __init__(self):
+        super().__init__(rules=[
+            ("policy_type_name='AttachMultipleVLAN'", [
+                {'batch': {'id': 'ct-present', 'label': get_multi_vlan_ct_label(VlanSet.from_ranges('10-11'))}},
+                {'batch': {'id': 'ct-other', 'label': 'other'}}]),
+            ('', [{'vn': {'id': f"vn-{x}", 'vn_id': str(100000 + x)}} for x in [10, 11, 20]]),
+        ])
+        self.created = []
+
+    def add_multiple_vlan_ct(self, ct_label, tagged_vn_ids, untagged_vn_id=None, description=''):
+        self.created.append((tagged_vn_ids, untagged_vn_id))
+        return f"ct-{len(self.created)}"
+
+
+def build_interface_vlans(tagged: str, untagged: int = None) -> InterfaceVlans:
+    interface_vlans = InterfaceVlans()
+    interface_vlans.tagged_vlans = VlanSet.from_ranges(tagged)
+    interface_vlans.untagged_vlan = untagged
+    return interface_vlans
+
+def test_38_multi_vlan_assignments():
+    interface_vlan_table = {'sw-a': {
+        'xe-0/0/1': build_interface_vlans('10-11'),
+        'xe-0/0/2': build_interface_vlans('10-11'),
+        'xe-0/0/3': build_interface_vlans('10', 20),
+        'xe-0/0/4': build_interface_vlans('10', 20),
+        # VLAN 30 has no VN
+        'xe-0/0/5': build_interface_vlans('30'),
+    }}
+    interface_id_table = {'sw-a': {f"xe-0/0/{x}": f"if-{x}" for x in range(1, 6)}}
+    main_bp = FakeMultiVlanBlueprint()
+    assignments = build_multi_vlan_assignments(main_bp, interface_vlan_table, interface_id_table)
+    # one CT per distinct VLAN set, the present one reused
+    assert main_bp.created == [(['vn-10'], 'vn-20')]
+    assert assignments == {
+        'if-1': {'ct-present': True}, 'if-2': {'ct-present': True},
+        'if-3': {'ct-1': True}, 'if-4': {'ct-1': True},
+    }
+
+def test_39_multi_vlan_detach_single_vlan_cts():
+    # the single VLAN CTs of a previous single VLAN run. VLAN 11 has no untagged CT
+    vni_2_ct_id_table = {}
+    for vlan_id in [10, 11, 20]:
+        vni_2_ct_id_table[100000 + vlan_id] = VniCt(None, 100000 + vlan_id)
+        vni_2_ct_id_table[100000 + vlan_id].set_id(f"ct-t{vlan_id}", True)
+    vni_2_ct_id_table[100020].set_id('ct-u20', False)
+    interface_vlan_table = {'sw-a': {'xe-0/0/1': build_interface_vlans('10-11', 20)}}
+    interface_id_table = {'sw-a': {'xe-0/0/1': 'if-1'}}
+    main_bp = FakeMultiVlanBlueprint()
+    assignments = build_multi_vlan_assignments(main_bp, interface_vlan_table, interface_id_table, vni_2_ct_id_table)
+    assert assignments == {'if-1': {'ct-1': True, 'ct-t10': False, 'ct-t11': False, 'ct-u20': False}}
+    assert get_managed_ct_ids(main_bp, vni_2_ct_id_table) == {'ct-present', 'ct-t10', 'ct-t11', 'ct-t20', 'ct-u20'}
@@ -0,0 +1,32 @@
+from apstra_bp_consolidation.diff_engine import iter_diff, build_tree, ADDED, REMOVED, CHANGED
+from apstra_bp_consolidation.models import InterfaceVlans
+from apstra_bp_consolidation.vlan_set import VlanSet
+
+
+def test_40_diff_identical_and_list_order():
+    a = {'bound_to': [{'system_id': 'rg1', 'vlan_id': 10}, {'system_id': 'rg2', 'vlan_id': 20}], 'label': 'vn10'}
+    b = {'label': 'vn10', 'bound_to': [{'system_id': 'rg2', 'vlan_id': 20}, {'system_id': 'rg1', 'vlan_id': 10}]}
+    assert build_tree(a).digest == build_tree(b).digest
+    assert list(iter_diff(a, b)) == []
+
+def test_41_diff_records():
+    a = {'label': 'vn10', 'vn_id': 10010, 'bound_to': [{'system_id': 'rg1', 'access_switch_node_ids': []}]}
+    b = {'label': 'vn10', 'bound_to': [{'system_id': 'rg1', 'access_switch_node_ids': ['rg9']}], 'ipv4': True}
+    records = {(x.kind, x.path): x for x in iter_diff(a, b)}
+    assert set(records) == {
+        (REMOVED, ('vn_id',)),
+        (ADDED, ('ipv4',)),
+        (ADDED, ('bound_to', 0, 'access_switch_node_ids', 0)),
+    }
+    assert records[(REMOVED, ('vn_id',))].a == 10010
+    assert str(records[(ADDED, ('ipv4',))]) == "'ipv4' present in <B>, but not in <A>: True"
+
+def test_42_diff_interface_vlan_table():
+    def table(vlans):
+        interface_vlans = InterfaceVlans(id='if1')
+        interface_vlans.tagged_vlans = VlanSet.from_ranges(vlans)
+        return {'atl1tor-r5r14a': {'xe-0/0/0': interface_vlans}}
+    assert list(iter_diff(table('10-20'), table('10-20'))) == []
+    records = list(iter_diff(table('10-20'), table('10-19,30')))
+    assert [(x.kind, x.path) for x in records] == [(CHANGED, ('atl1tor-r5r14a', 'xe-0/0/0', 'tagged_vlans'))]
+    assert str(records[0]) == "Different VLANs at 'atl1tor-r5r14a/xe-0/0/0/tagged_vlans': <B> has +30 -20"
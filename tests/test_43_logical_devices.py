@@ -0,0 +1,34 @@
+from apstra_bp_consolidation.logical_devices import CkLogicalDeviceShapes, build_logical_device, get_shapes
+from apstra_bp_consolidation.models import GsLink
+from tests.conftest import FakeSession
+
+
+def build_generic_systems(shapes: dict) -> dict:
+    return {
+        label: {f"{label}-{i}": GsLink(f"{label}-{i}", 'sw-a', f"xe-0/0/{i}", speed) for i in range(port_count)}
+        for label, (speed, port_count) in shapes.items()
+    }
+
+def test_43_logical_device_shapes():
+    generic_systems_data = build_generic_systems({'srv1': ('10G', 2), 'srv2': ('10G', 2), 'srv3': ('25G', 1)})
+    generic_systems_data['srv4'] = {}
+    shapes = get_shapes(generic_systems_data)
+    assert shapes == {('10G', 2), ('25G', 1)}
+
+    # auto-10Gx2 matches, auto-25Gx1 is taken with another panel definition
+    present = dict(build_logical_device('10G', 2), created_at='2026-01-01')
+    present['panels'][0]['port_groups'][0]['roles'] = ['access', 'leaf']
+    other = build_logical_device('25G', 1)
+    other['panels'][0]['port_groups'][0]['count'] = 4
+    session = FakeSession(items=[present, other])
+    logical_device_shapes = CkLogicalDeviceShapes(session)
+    assert logical_device_shapes.get_missing(shapes | {('1G', 1)}) == [('1G', 1)]
+    logical_device_shapes.ensure(shapes | {('1G', 1)})
+    assert session.session.urls('put') == ['https://apstra/api/design/logical-devices/auto-1Gx1']
+    assert logical_device_shapes.get_spec('10G', 2) == {'logical_device_id': 'auto-10Gx2'}
+    assert logical_device_shapes.get_spec('1G', 1) == {'logical_device_id': 'auto-1Gx1'}
+    assert logical_device_shapes.get_spec('25G', 1) == {'logical_device': build_logical_device('25G', 1)}
+
+    logical_device = build_logical_device('25G', 1)
+    assert logical_device['id'] == 'auto-25Gx1'
+    assert logical_device['panels'][0]['port_groups'][0]['speed'] == {'unit': 'G', 'value': 25}
@@ -0,0 +1,76 @@
+import logging
+
+import pytest
+
+from apstra_bp_consolidation.consolidation import cli, ConsolidationOrder
+from apstra_bp_consolidation.apstra_blueprint import CkApstraBlueprint, CkEnum
+from apstra_bp_consolidation.move_generic_system import chunk_lag_links, preflight_generic_system_labels
+from tests.conftest import FakeResponse, FakeSession, FakeBlueprint
+
+
+def build_main_bp(existing_labels: list, labels_on_pair: list) -> FakeBlueprint:
+    """
+    The system labels of the main blueprint and the generic systems on the access switch pair
+    """
+    return FakeBlueprint(rules=[
+        ('distinct', [{CkEnum.GENERIC_SYSTEM: {'label': x}} for x in labels_on_pair]),
+        ('', [{'system': {'label': x}} for x in existing_labels + labels_on_pair]),
+    ])
+
+
+def build_order(main_bp) -> ConsolidationOrder:
+    # the rename methods without the env file and the session
+    order = ConsolidationOrder.__new__(ConsolidationOrder)
+    order.logger = logging.getLogger('test')
+    order.tor_label = 'atl1tor-r5r14'
+    order.switch_label_pair = ['atl1tor-r5r14a', 'atl1tor-r5r14b']
+    order.main_bp = main_bp
+    return order
+
+
+def test_44_chunk_lag_links():
+    lag_links = {
+        f"link-{group}-{i}": {'group_label': f"link{group}", 'lag_mode': 'lacp_active'}
+        for group in range(5) for i in range(2)
+    }
+    specs = list(chunk_lag_links(lag_links, max_links=5))
+    assert [len(x['links']) for x in specs] == [4, 4, 2]
+    # the links of a group stay in the same spec
+    for spec in specs:
+        groups = {x['group_label'] for x in spec['links'].values()}
+        assert all(f"link-{group[len('link'):]}-{i}" in spec['links'] for group in groups for i in range(2))
+    assert sum(len(x['links']) for x in chunk_lag_links(lag_links, max_bytes=100)) == 10
+    assert list(chunk_lag_links({})) == []
+    assert 'move-generic-systems' in cli.commands
+
+LONG_LABEL = 'a-very-long-generic-system-label-01'
+
+def test_45_preflight_generic_system_labels():
+    tor_generic_systems_data = {'_atl_rack_1_001_srv1': {'l1': 1}, '_atl_rack_1_001_srv2': {'l2': 2}, LONG_LABEL: {'l3': 3}}
+    # srv1 moved before, the long label taken by another system
+    order = build_order(build_main_bp([LONG_LABEL], ['r5r14-srv1']))
+    to_create = preflight_generic_system_labels(order, tor_generic_systems_data)
+    tail_label = order.rename_generic_system_tail(LONG_LABEL)
+    assert tail_label == 'r5r14-ng-generic-system-label-01'
+    assert to_create == {'r5r14-srv2': {'l2': 2}, tail_label: {'l3': 3}}
+
+    # the tail label is on the pair from a previous run
+    order = build_order(build_main_bp([LONG_LABEL], [tail_label]))
+    assert list(preflight_generic_system_labels(order, tor_generic_systems_data)) == ['r5r14-srv1', 'r5r14-srv2']
+
+def test_46_preflight_generic_system_conflicts():
+    # srv2 taken by a system not on the pair, and the tail too
+    order = build_order(build_main_bp(['r5r14-srv2', 'r5r14-_atl_rack_1_001_srv2'], []))
+    with pytest.raises(ValueError, match='1 generic system label conflicts'):
+        preflight_generic_system_labels(order, {'_atl_rack_1_001_srv1': {}, '_atl_rack_1_001_srv2': {}})
+
+def test_47_add_generic_system_check_existing():
+    # the methods without the blueprint listing
+    the_bp = CkApstraBlueprint.__new__(CkApstraBlueprint)
+    the_bp.session = FakeSession(post=lambda url, json: FakeResponse(201, {'ids': ['link-1']}))
+    the_bp.url_prefix = 'https://apstra/api/blueprints/bp-1'
+    the_bp.logger = logging.getLogger('test')
+    gs_spec = {'links': [], 'new_systems': [{'label': 'srv1'}]}
+    assert the_bp.add_generic_system(gs_spec, check_existing=False) == ['link-1']
+    # no query - only the switch-system-links POST
+    assert the_bp.session.session.calls == [('post', 'https://apstra/api/blueprints/bp-1/switch-system-links')]
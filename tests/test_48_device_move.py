@@ -0,0 +1,136 @@
+import logging
+
+from apstra_bp_consolidation import device_move
+from apstra_bp_consolidation.device_move import CkDeviceMoveEngine
+from apstra_bp_consolidation.apstra_blueprint import CkApstraBlueprint
+from tests.conftest import FakeResponse, FakeSession, FakeBlueprint
+
+
+class FakeMoveBlueprint(FakeBlueprint):
+    """
+    The system nodes change by the PATCH once the task is polled twice
+    """
+    def __init__(self, label: str, system_nodes: dict, patch_status: int = 202, task_status: str = 'succeeded'):
+        super().__init__(label)
+        self.system_nodes = system_nodes  # { label: { id, system_id, deploy_mode } }
+        self.patch_status = patch_status
+        self.task_status = task_status
+        self.patches = []
+        self.pending = {}  # { task id: ( patch spec, polls ) }
+
+    def get_system_nodes(self, system_labels: list) -> dict:
+        return {x: dict(self.system_nodes[x], label=x) for x in system_labels if x in self.system_nodes}
+
+    def patch_nodes(self, patch_spec, params=None):
+        self.patches.append(patch_spec)
+        if self.patch_status >= 400:
+            return FakeResponse(self.patch_status)
+        task_id = f"task-{len(self.patches)}"
+        self.pending[task_id] = (patch_spec, 0)
+        return FakeResponse(202, {'task_id': task_id})
+
+    def get_task_status(self, task_ids) -> dict:
+        status = {}
+        for task_id in task_ids:
+            patch_spec, polls = self.pending[task_id]
+            if self.task_status is None:
+                # the task is not found, the node is patched on the second poll
+                self.pending[task_id] = (patch_spec, polls + 1)
+                if polls >= 1:
+                    self.apply(patch_spec)
+                continue
+            if polls < 1:
+                self.pending[task_id] = (patch_spec, polls + 1)
+                status[task_id] = 'in_progress'
+                continue
+            status[task_id] = self.task_status
+            if self.task_status == 'succeeded':
+                self.apply(patch_spec)
+        return status
+
+    def apply(self, patch_spec) -> None:
+        for node_patch in patch_spec:
+            for system_node in self.system_nodes.values():
+                if system_node['id'] == node_patch['id']:
+                    system_node.update(system_id=node_patch['system_id'], deploy_mode=node_patch['deploy_mode'])
+
+
+def build_blueprints(main_patch_status: int = 202, main_task_status: str = 'succeeded'):
+    tor_bp = FakeMoveBlueprint('tor-bp', {
+        'sw-a': {'id': 'tor-a', 'system_id': 'SN-A', 'deploy_mode': 'deploy'},
+        'sw-b': {'id': 'tor-b', 'system_id': 'SN-B', 'deploy_mode': 'deploy'},
+    })
+    main_bp = FakeMoveBlueprint('main-bp', {
+        'sw-a': {'id': 'main-a', 'system_id': None, 'deploy_mode': None},
+        'sw-b': {'id': 'main-b', 'system_id': None, 'deploy_mode': None},
+    }, main_patch_status, main_task_status)
+    return tor_bp, main_bp
+
+def test_48_device_move_engine(monkeypatch):
+    monkeypatch.setattr(device_move.time, 'sleep', lambda x: None)
+    tor_bp, main_bp = build_blueprints()
+    engine = CkDeviceMoveEngine(timeout=60)
+    engine.add_pair(['sw-a', 'sw-b'], tor_bp, main_bp)
+    moves = engine.run()
+    assert [x.state for x in moves] == ['deployed', 'deployed']
+    # one PATCH per blueprint and phase
+    assert len(tor_bp.patches) == len(main_bp.patches) == 1
+    assert main_bp.system_nodes['sw-a'] == {'id': 'main-a', 'system_id': 'SN-A', 'deploy_mode': 'deploy'}
+    assert tor_bp.system_nodes['sw-b']['system_id'] is None
+    assert set(moves[0].timings) == {'undeploy', 'deploy'}
+
+    # already moved - nothing to send
+    engine = CkDeviceMoveEngine(timeout=60)
+    engine.add_pair(['sw-a', 'sw-b'], tor_bp, main_bp)
+    assert [x.state for x in engine.run()] == ['skipped', 'skipped']
+    assert len(tor_bp.patches) == 1
+
+def test_49_device_move_failures(monkeypatch):
+    monkeypatch.setattr(device_move.time, 'sleep', lambda x: None)
+    tor_bp, main_bp = build_blueprints(main_patch_status=422)
+    engine = CkDeviceMoveEngine(timeout=60)
+    engine.add_pair(['sw-a', 'sw-b'], tor_bp, main_bp)
+    moves = engine.run()
+    # undeployed, then the deploy PATCH failed
+    assert [x.state for x in moves] == ['failed', 'failed']
+    assert moves[0].timings.keys() == {'undeploy'}
+    assert 'deploy PATCH 422' in moves[0].error
+
+    tor_bp, main_bp = build_blueprints(main_task_status='failed')
+    engine = CkDeviceMoveEngine(timeout=60)
+    engine.add_pair(['sw-a', 'sw-c'], tor_bp, main_bp)
+    moves = engine.run()
+    assert [x.state for x in moves] == ['failed', 'failed']
+    assert 'deploy task' in moves[0].error
+    assert moves[1].error == 'absent in tor-bp'
+
+    # the undeploy is never confirmed within the timeout
+    tor_bp, main_bp = build_blueprints()
+    tor_bp.task_status = 'in_progress'
+    engine = CkDeviceMoveEngine(timeout=0)
+    engine.add_pair(['sw-a'], tor_bp, main_bp)
+    moves = engine.run()
+    assert moves[0].state == 'failed' and 'not confirmed' in moves[0].error
+    assert main_bp.patches == []
+
+def test_50_device_move_task_not_found(monkeypatch):
+    monkeypatch.setattr(device_move.time, 'sleep', lambda x: None)
+    # the tasks are not found. the moves are confirmed by the system nodes
+    tor_bp, main_bp = build_blueprints(main_task_status=None)
+    tor_bp.task_status = None
+    engine = CkDeviceMoveEngine(timeout=60)
+    engine.add_pair(['sw-a', 'sw-b'], tor_bp, main_bp)
+    assert [x.state for x in engine.run()] == ['deployed', 'deployed']
+
+    # one GET per task id, not the tasks listing
+    def get_task(url, json):
+        task_id = url.split('/')[-1]
+        return {'id': task_id, 'status': 'succeeded'} if task_id == 'task-1' else FakeResponse(404)
+
+    the_bp = CkApstraBlueprint.__new__(CkApstraBlueprint)
+    the_bp.session = FakeSession(get=get_task)
+    the_bp.url_prefix = 'https://apstra/api/blueprints/bp-1'
+    the_bp.logger = logging.getLogger('test')
+    assert the_bp.get_task_status(['task-1', 'task-2']) == {'task-1': 'succeeded'}
+    assert sorted(the_bp.session.session.urls('get')) == [
+        'https://apstra/api/blueprints/bp-1/tasks/task-1', 'https://apstra/api/blueprints/bp-1/tasks/task-2']
@@ -0,0 +1,67 @@
+import pytest
+
+from apstra_bp_consolidation.write_merge import CkMainBlueprintWrites
+from tests.conftest import FakeBlueprint
+
+
+def test_51_flush_tags():
+    main_bp = FakeBlueprint()
+    writes = CkMainBlueprintWrites(main_bp)
+    writes.add_tags(['link-1'], ['blue', 'red'])
+    writes.add_tags(['link-2'], ['red', 'blue'])
+    writes.add_tags(['link-3'], ['green'])
+    assert writes.flush_tags() == 2
+    assert sorted(x for _, x in main_bp.writes) == [(['link-1', 'link-2'], ['blue', 'red']), (['link-3'], ['green'])]
+
+
+class FakeVnBlueprint(FakeBlueprint):
+    """
+    The VNs of the main blueprint by the VNI
+    """
+    def __init__(self, vn_specs: dict, patch_status: int = 202):
+        super().__init__(status_code=patch_status)
+        self.vn_specs = vn_specs
+
+    def get_virtual_network(self, vni):
+        return self.vn_specs.get(vni)
+
+    @property
+    def patched(self) -> dict:
+        return {x['id']: x for method, x in self.writes if method == 'patch_virtual_network'}
+
+
+def build_vn_spec(vn_id: str, bound_to: dict, vn_type: str = 'vxlan') -> dict:
+    return {
+        'id': vn_id, 'vn_type': vn_type, 'endpoints': [],
+        'bound_to': [{'system_id': leaf, 'access_switch_node_ids': list(rg_ids)} for leaf, rg_ids in bound_to.items()],
+    }
+
+def build_vn_writes(main_bp) -> CkMainBlueprintWrites:
+    writes = CkMainBlueprintWrites(main_bp)
+    # two orders on the same leaf pair, and one more on another leaf pair
+    for vni in ['10010', '10011', '10012', '10013']:
+        writes.add_vn_access_switch(vni, 'leaf-1', 'rg-r4')
+        writes.add_vn_access_switch(vni, 'leaf-1', 'rg-r5')
+    writes.add_vn_access_switch('10010', 'leaf-2', 'rg-r6')
+    return writes
+
+def test_52_flush_virtual_networks():
+    main_bp = FakeVnBlueprint({
+        '10010': build_vn_spec('vn-10', {'leaf-1': ['rg-old'], 'leaf-2': []}),
+        # in already
+        '10011': build_vn_spec('vn-11', {'leaf-1': ['rg-r4', 'rg-r5']}),
+        # leaf-1 is not in bound_to
+        '10012': build_vn_spec('vn-12', {'leaf-2': []}),
+        '10013': build_vn_spec('vn-13', {'leaf-1': []}, vn_type='vlan'),
+    })
+    assert build_vn_writes(main_bp).flush_virtual_networks() == 1
+    assert list(main_bp.patched) == ['vn-10']
+    assert main_bp.patched['vn-10']['bound_to'] == [
+        {'system_id': 'leaf-1', 'access_switch_node_ids': ['rg-old', 'rg-r4', 'rg-r5']},
+        {'system_id': 'leaf-2', 'access_switch_node_ids': ['rg-r6']},
+    ]
+    assert 'endpoints' not in main_bp.patched['vn-10']
+
+    main_bp = FakeVnBlueprint({'10010': build_vn_spec('vn-10', {'leaf-1': [], 'leaf-2': []})}, patch_status=422)
+    with pytest.raises(ValueError, match="10010"):
+        build_vn_writes(main_bp).flush_virtual_networks()
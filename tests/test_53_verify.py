@@ -0,0 +1,62 @@
+from apstra_bp_consolidation.consolidation import cli
+from apstra_bp_consolidation.verify import build_interface_records, compare_interface_records
+from apstra_bp_consolidation.move_ct import pull_interface_vlan_table
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.models import InterfaceVlans, GsLink
+from apstra_bp_consolidation.vlan_set import VlanSet
+from tests.conftest import FakeBlueprint
+
+
+def build_records(ae_id: str, vlans: str, peer: str, tags: list) -> dict:
+    ae_vlans = InterfaceVlans(member_interfaces={'sw-a': ['xe-0/0/1'], 'sw-b': ['xe-0/0/1']})
+    ae_vlans.tagged_vlans = VlanSet.from_ranges(vlans)
+    single_vlans = InterfaceVlans(id='if-2')
+    single_vlans.add_vlan(20, False)
+    interface_vlan_table = {CkEnum.REDUNDANCY_GROUP: {ae_id: ae_vlans}, 'sw-a': {'xe-0/0/2': single_vlans}}
+    generic_systems_data = {peer: {}}
+    for sw_label, if_name in [('sw-a', 'xe-0/0/1'), ('sw-b', 'xe-0/0/1'), ('sw-a', 'xe-0/0/2')]:
+        gs_link = GsLink(f"link-{sw_label}-{if_name}", sw_label, if_name, '10G', ae_id)
+        for tag in tags:
+            gs_link.add_tag(tag)
+        generic_systems_data[peer][gs_link.link_id] = gs_link
+    return build_interface_records(interface_vlan_table, generic_systems_data)
+
+def test_53_verify_interface_records():
+    tor_records = build_records('ae-tor', '10-12', 'r5r14-srv1', ['b', 'a'])
+    assert tor_records['sw-b']['xe-0/0/1']['lag'] == ['sw-a:xe-0/0/1', 'sw-b:xe-0/0/1']
+    assert compare_interface_records(tor_records, build_records('ae-main', '10-12', 'r5r14-srv1', ['a', 'b'])) == {}
+    mismatches = compare_interface_records(tor_records, build_records('ae-main', '10-11', 'r5r14-srv1', ['a']))
+    assert sorted(mismatches) == [('sw-a', 'xe-0/0/1'), ('sw-a', 'xe-0/0/2'), ('sw-b', 'xe-0/0/1')]
+    assert {x.path[0] for x in mismatches[('sw-a', 'xe-0/0/1')]} == {'tagged_vlans', 'tags'}
+    assert 'verify' in cli.commands
+
+
+def build_vlan_bp(multi_vlan: bool) -> FakeBlueprint:
+    """
+    An interface with the VLANs 10-12 tagged and 20 untagged by the single or the multiple VLAN CTs
+    """
+    # the graph keeps the attributes as a json string
+    attributes = '{"tagged_vn_node_ids": ["vn-10", "vn-11", "vn-12"], "untagged_vn_node_id": "vn-20"}'
+    multi_vlan_rows = [{'ep_application_instance': {'id': 'ai-1'}, 'AttachMultipleVLAN': {'attributes': attributes}}]
+    single_vlan_rows = [
+        {'ep_application_instance': {'id': 'ai-1'}, 'AttachSingleVLAN': {'attributes': 'vlan_tagged' if x != 20 else 'untagged'}, 'virtual_network': {'vn_id': str(100000 + x)}}
+        for x in [10, 11, 12, 20]
+    ]
+    return FakeBlueprint('bp', [
+        ("AttachMultipleVLAN", multi_vlan_rows if multi_vlan else []),
+        ("AttachSingleVLAN", [] if multi_vlan else single_vlan_rows),
+        ("node('virtual_network'", [{'vn': {'id': f"vn-{x}", 'vn_id': str(100000 + x)}} for x in [10, 11, 12, 20]]),
+        ("po_control_protocol='evpn'", []),
+        ('', [{'ep_application_instance': {'id': 'ai-1'}, 'interface': {'id': 'if-1', 'if_name': 'xe-0/0/1'}, 'switch': {'label': 'sw-a'}}]),
+    ])
+
+def test_54_verify_multi_vlan():
+    tor_table = pull_interface_vlan_table(build_vlan_bp(multi_vlan=False), ['sw-a', 'sw-b'])
+    main_table = pull_interface_vlan_table(build_vlan_bp(multi_vlan=True), ['sw-a', 'sw-b'])
+    if_vlans = main_table['sw-a']['xe-0/0/1']
+    assert (list(if_vlans.tagged_vlans), if_vlans.untagged_vlan) == ([10, 11, 12], 20)
+    gs_link = GsLink('link-1', 'sw-a', 'xe-0/0/1', '10G')
+    generic_systems_data = {'r5r14-srv1': {gs_link.link_id: gs_link}}
+    assert compare_interface_records(
+        build_interface_records(tor_table, generic_systems_data),
+        build_interface_records(main_table, generic_systems_data)) == {}
@@ -0,0 +1,54 @@
+import json
+import logging
+
+import pytest
+
+from apstra_bp_consolidation.consolidation import cli, ConsolidationOrder
+from apstra_bp_consolidation.plan import encode_interface_vlan_table, decode_interface_vlan_table
+from apstra_bp_consolidation.plan import encode_generic_systems, decode_generic_systems, write_plan, read_plan
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.models import InterfaceVlans, GsLink
+from apstra_bp_consolidation.vlan_set import VlanSet
+from tests.conftest import FakeBlueprint
+
+
+def test_60_plan_round_trip(tmp_path):
+    ae_vlans = InterfaceVlans(member_interfaces={'sw-a': ['xe-0/0/1'], 'sw-b': ['xe-0/0/1']})
+    ae_vlans.tagged_vlans = VlanSet.from_ranges('10-20,30')
+    single_vlans = InterfaceVlans(id='if-2')
+    single_vlans.add_vlan(40, False)
+    interface_vlan_table = {CkEnum.REDUNDANCY_GROUP: {'ae-1': ae_vlans}, 'sw-a': {'xe-0/0/2': single_vlans}}
+    gs_link = GsLink('link-1', 'sw-a', 'xe-0/0/2', '10G')
+    gs_link.add_tag('tag1')
+    generic_systems_data = {'srv1': {'link-1': gs_link}}
+
+    plan_file = str(tmp_path / 'plan.json')
+    write_plan(plan_file, [{
+        'interface_vlan_table': encode_interface_vlan_table(interface_vlan_table),
+        'generic_systems': encode_generic_systems(generic_systems_data),
+    }])
+    order_plan = read_plan(plan_file)['orders'][0]
+    assert decode_interface_vlan_table(order_plan['interface_vlan_table']) == interface_vlan_table
+    decoded = decode_generic_systems(order_plan['generic_systems'])
+    assert decoded['srv1']['link-1'].to_dict() == gs_link.to_dict()
+    assert {'plan', 'apply'} <= set(cli.commands)
+
+def test_61_plan_version(tmp_path):
+    plan_file = tmp_path / 'plan.json'
+    plan_file.write_text(json.dumps({'plan_version': 0, 'orders': []}))
+    with pytest.raises(ValueError):
+        read_plan(str(plan_file))
+
+def test_62_lazy_vni_list():
+    # the order without the env file and the session
+    order = ConsolidationOrder.__new__(ConsolidationOrder)
+    order.logger = logging.getLogger('test')
+    order.switch_label_pair = ['sw-a', 'sw-b']
+    order.tor_bp = FakeBlueprint('tor-bp', [('', [{'vn': {'vn_id': '10010'}}])])
+    # set from the plan - not pulled
+    order.vni_list = ['10020']
+    assert order.vni_list == ['10020'] and order.tor_bp.queries == []
+    # pulled once on the first use
+    order.vni_list = None
+    assert order.vni_list == ['10010'] and order.vni_list == ['10010']
+    assert len(order.tor_bp.queries) == 1
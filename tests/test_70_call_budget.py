@@ -0,0 +1,79 @@
+from apstra_bp_consolidation.consolidation import cli
+from apstra_bp_consolidation.call_budget import count_writes, estimate_seconds
+from apstra_bp_consolidation.latency_stats import CkLatencyStats, classify_request, get_latency_stats
+from apstra_bp_consolidation.apstra_blueprint import CkEnum
+from apstra_bp_consolidation.models import InterfaceVlans, GsLink
+from apstra_bp_consolidation.vlan_set import VlanSet
+from tests.conftest import FakeSession
+
+
+def build_facts(tor_label: str, vni_list: list) -> dict:
+    interface_vlan_table = {CkEnum.REDUNDANCY_GROUP: {}, f"{tor_label}a": {}}
+    for port in range(4):
+        interface_vlans = InterfaceVlans(id=f"if-{port}")
+        interface_vlans.tagged_vlans = VlanSet.from_ranges('10-14')
+        interface_vlan_table[f"{tor_label}a"][f"xe-0/0/{port}"] = interface_vlans
+    generic_systems = {}
+    for index in range(3):
+        gs_link = GsLink(f"link-{index}", f"{tor_label}a", f"xe-0/0/{index}", '10G', f"ae-{index}")
+        if index < 2:
+            gs_link.add_tag('tag1')
+        generic_systems[f"srv{index}"] = {gs_link.link_id: gs_link}
+    return {
+        'tor_label': tor_label, 'tor_bp': tor_label, 'main_bp': 'main',
+        'old_ae_cts': 12, 'pair_present': False, 'generic_systems': generic_systems, 'conflict': None,
+        'missing_shapes': {('10G', 1)}, 'vni_list': vni_list, 'bound_vni_list': [],
+        'interface_vlan_table': interface_vlan_table, 'ct_keys': {'t10', 't11'}, 'current_ct_keys': {},
+    }
+
+def test_70_count_writes():
+    r5 = build_facts('r5', ['10010', '10011'])
+    writes = count_writes([r5], batch_size=10, max_application_points=100)
+    assert writes[('move-access-switches', 'POST batch')] == 2 + 1
+    assert writes[('move-generic-systems', 'POST switch-system-links')] == 3
+    assert writes[('move-generic-systems', 'POST tagging')] == 1
+    assert writes[('move-virtual-networks', 'PATCH virtual-networks')] == 2
+    # 4 interfaces x 5 VLANs in batches of 10 policies
+    assert writes[('move-cts', 'POST batch')] == 2
+    # the CTs of the VLANs 12-14 are missing
+    assert writes[('move-cts', 'PUT obj-policy-import')] == 3
+    assert writes[('move-devices', 'PATCH nodes')] == 2
+
+    # a partial previous run - the VNs and the CTs already in effect are not written again
+    r5['bound_vni_list'] = ['10010']
+    r5['current_ct_keys'] = {('r5a', f"xe-0/0/{port}"): {'t10', 't11', 't12', 't13', 't14'} for port in range(3)}
+    r5['current_ct_keys'][('r5a', 'xe-0/0/3')] = {'t10', 't11'}
+    writes = count_writes([r5], batch_size=10, max_application_points=100)
+    assert writes[('move-virtual-networks', 'PATCH virtual-networks')] == 1
+    assert writes[('move-cts', 'POST batch')] == 1
+
+    # the single VLAN CTs of a previous run are detached from the interfaces on the multiple VLAN CTs
+    #   3 interfaces x (1 + 5 detached) and 1 interface x (1 + 2 detached) in batches of 10 policies
+    writes = count_writes([r5], batch_size=10, max_application_points=100, multi_vlan=True)
+    assert writes[('move-cts', 'POST batch')] == 3
+    r5['bound_vni_list'] = []
+    r5['current_ct_keys'] = {}
+
+    fleet = count_writes([r5, build_facts('r6', ['10011', '10012'])], batch_size=10, max_application_points=100)
+    assert fleet[('move-virtual-networks', 'PATCH virtual-networks')] == 3
+    assert fleet[('move-generic-systems', 'PUT design/logical-devices')] == 1
+    assert fleet[('move-access-switches', 'PATCH nodes')] == 1
+    assert fleet[('move-devices', 'PATCH nodes')] == 3
+    assert 'dry-run' in cli.commands
+
+def test_71_latency_stats(tmp_path):
+    # not recorded without the file
+    session = FakeSession()
+    assert get_latency_stats(session, None).mean('PATCH nodes', 1.0) == 1.0
+    assert session.session.hooks['response'] == []
+
+    assert classify_request('PATCH', 'https://host:443/api/blueprints/bp-1/nodes?async=full') == 'PATCH nodes'
+    assert classify_request('PUT', 'https://host/api/design/logical-devices/auto-10Gx1') == 'PUT design/logical-devices'
+    latency_stats = CkLatencyStats(str(tmp_path / 'stats.json'))
+    latency_stats.record('PATCH nodes', 1.0)
+    latency_stats.record('PATCH nodes', 3.0)
+    latency_stats.save()
+    latency_stats = CkLatencyStats(str(tmp_path / 'stats.json'))
+    assert latency_stats.mean('PATCH nodes') == 2.0
+    assert latency_stats.mean('POST batch', 0.5) == 0.5
+    assert estimate_seconds({('move-devices', 'PATCH nodes'): 2}, latency_stats)['move-devices'] == 4.0